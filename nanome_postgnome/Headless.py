@@ -0,0 +1,186 @@
+import re
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from nanome.util import Logs
+
+from .Settings import Settings
+from .engine import Progress, RequestRun, RequestRunner
+from .engine.Scheduler import BATCH
+
+# where a plugin with default arguments keeps its settings
+DEFAULT_SETTINGS_DIR = os.path.join(os.path.expanduser('~'), 'Documents', 'nanome-plugins', 'postgnome')
+
+
+class DirectoryImporter():
+    """ Writes the structures of import steps to a directory, in place of a workspace.
+        Files are written as downloaded, there is no Nanome to add bonds or secondary structure
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = []
+        self.__lock = threading.Lock()
+
+    def __call__(self, name, filetype, contents, metadata, body=None, cancel=None, progress=None, repeat=None):
+        if cancel:
+            cancel.check()
+        if progress:
+            progress.stage(f'writing {name}')
+        path = self.reserve(re.sub(r'[^\w.-]+', '_', name) or 'structure', filetype)
+        if body is not None:
+            body.save_as(path)
+        else:
+            with open(path, 'w') as file:
+                file.write(contents if isinstance(contents, str) else json.dumps(contents))
+        if metadata:
+            with open(path + '.metadata.json', 'w') as file:
+                file.write(metadata)
+        Logs.debug(f'wrote {path}')
+
+    def reserve(self, name, filetype):
+        # steps of a fan-out import concurrently, often under the same name
+        with self.__lock:
+            path = os.path.join(self.directory, name + filetype)
+            copy = 1
+            while path in self.files:
+                copy += 1
+                path = os.path.join(self.directory, f'{name}-{copy}{filetype}')
+            self.files.append(path)
+            return path
+
+
+def find_request(settings, name):
+    for request in settings.requests.values():
+        if name in (request['name'], request['id']):
+            return request
+    return None
+
+
+def output_values(settings, request):
+    values = {}
+    for step in request['steps']:
+        resource = settings.get_resource(step['resource'])
+        for uid in resource['output variables'] if resource else []:
+            if uid in settings.variables:
+                variable = settings.variables[uid]
+                values[variable.name] = variable.value
+    return values
+
+
+def run_request(settings_dir, request_name, variables, directory):
+    """ Runs one saved Request with variables (name -> value), writing its imported
+        structures and a result.json to directory. Settings are loaded for the run
+        and never saved, so runs don't see each other's outputs.
+        Returns the result written to result.json.
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = time.monotonic()
+    result = {'request': request_name, 'variables': variables, 'steps': None, 'outputs': {}, 'files': [], 'error': None}
+    settings = Settings(directory=settings_dir)
+    request = find_request(settings, request_name)
+    if request is None:
+        result['error'] = f'no request named {request_name}'
+        return write_result(directory, result, started)
+
+    # the Load button's behaviour: inputs the run doesn't give are left empty
+    fields = {name: '' for name, _ in settings.get_inputs(request).values()}
+    for name, value in variables.items():
+        value = value if isinstance(value, str) else json.dumps(value)
+        if name not in fields:
+            Logs.warning(f'{request_name} has no input {name}')
+        fields[name] = value
+        settings.set_variable(None, name, value)
+
+    importer = DirectoryImporter(directory)
+    runner = RequestRunner(settings, priority=BATCH, importer=importer)
+    run = RequestRun(Progress(lambda text: Logs.message(f'{directory}: {text}'), interval=1.0))
+    if runner.recorder:
+        runner.recorder.start()
+    try:
+        result['steps'] = runner.run_steps(request, run, fields)
+        if result['steps'] is None:
+            result['error'] = 'a step failed'
+    except Exception as e:
+        Logs.debug(traceback.format_exc())
+        result['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        if runner.recorder:
+            runner.recorder.save(request['name'])
+        runner.tempdir.cleanup()
+    result['outputs'] = output_values(settings, request)
+    result['files'] = importer.files
+    return write_result(directory, result, started)
+
+
+def write_result(directory, result, started):
+    result['seconds'] = round(time.monotonic() - started, 3)
+    with open(os.path.join(directory, 'result.json'), 'w') as file:
+        json.dump(result, file, indent=2, default=str)
+    return result
+
+
+def read_batch(path):
+    """ Variable sets of a batch: a JSON list of objects, or one object per line """
+    with open(path) as file:
+        text = file.read()
+    try:
+        batch = json.loads(text)
+    except ValueError:
+        batch = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(batch, dict):
+        batch = [batch]
+    if not all(isinstance(variables, dict) for variables in batch):
+        raise ValueError(f'{path} must hold objects of variable names to values')
+    return batch
+
+
+def parse_variable(text):
+    name, sep, value = text.partition('=')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f'expected NAME=VALUE, got {text}')
+    return name, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Runs saved Postgnome Requests without Nanome, writing their results and structures to disk.')
+    parser.add_argument('requests', nargs='+', metavar='REQUEST', help='name or id of a saved Request')
+    parser.add_argument('-s', '--settings', default=os.environ.get('POSTGNOME_SETTINGS_DIR', DEFAULT_SETTINGS_DIR), help='directory holding the plugin settings')
+    parser.add_argument('-v', '--var', dest='variables', type=parse_variable, action='append', default=[], metavar='NAME=VALUE', help='input variable of every run')
+    parser.add_argument('-b', '--batch', help='JSON file of variable sets, one run of each Request per set')
+    parser.add_argument('-o', '--output', default='postgnome-results', help='directory the results are written to')
+    parser.add_argument('-p', '--parallel', type=int, default=4, help='runs in progress at once')
+    args = parser.parse_args(argv)
+
+    common = dict(args.variables)
+    batch = read_batch(args.batch) if args.batch else [{}]
+    runs = []
+    for request_name in args.requests:
+        for i, variables in enumerate(batch):
+            directory = os.path.join(args.output, re.sub(r'[^\w.-]+', '_', request_name))
+            if len(batch) > 1:
+                directory = os.path.join(directory, str(i + 1))
+            runs.append((request_name, {**common, **variables}, directory))
+
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        futures = [executor.submit(run_request, args.settings, *run) for run in runs]
+        results = [future.result() for future in futures]
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'summary.json'), 'w') as file:
+        json.dump(results, file, indent=2, default=str)
+    failed = [result for result in results if result['error']]
+    for result in failed:
+        Logs.error(f"{result['request']} {result['variables']}: {result['error']}")
+    Logs.message(f'{len(results) - len(failed)} of {len(results)} runs succeeded, results in {args.output}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
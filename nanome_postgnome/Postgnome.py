@@ -16,6 +16,7 @@ from .menus.MakeRequestMenu import MakeRequestMenu
 from .menus.VariablesMenu import VariablesMenu
 from .menus.ResourcesMenu import ResourcesMenu
 from .menus.RequestsMenu import RequestsMenu
+from .menus.ResourceConfigurationMenu import ResourceConfigurationMenu
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), 'json', 'MakeRequest.json')
 class Postgnome(nanome.PluginInstance):
@@ -26,9 +27,29 @@ class Postgnome(nanome.PluginInstance):
         }
         self.settings = Settings(self)
         self.make_request = MakeRequestMenu(self, self.settings)
-        self.variables_menu = VariablesMenu(self, self.settings)
         self.requests = RequestsMenu(self, self.settings)
-        self.resources_menu = ResourcesMenu(self, self.settings)
+        # secondary menus are built the first time they are used
+        self._variables_menu = None
+        self._resources_menu = None
+        self._resource_config = None
+
+    @property
+    def variables_menu(self):
+        if self._variables_menu is None:
+            self._variables_menu = VariablesMenu(self, self.settings)
+        return self._variables_menu
+
+    @property
+    def resources_menu(self):
+        if self._resources_menu is None:
+            self._resources_menu = ResourcesMenu(self, self.settings)
+        return self._resources_menu
+
+    @property
+    def resource_config(self):
+        if self._resource_config is None:
+            self._resource_config = ResourceConfigurationMenu(self, self.settings)
+        return self._resource_config
 
     def start(self):
         self.set_plugin_list_button(self.PluginListButtonType.run, 'Save')
@@ -0,0 +1,68 @@
+class ReferenceIndex():
+    """ Tracks which variables each resource field references, and the reverse.\n
+        Fields are keyed by item name ('url', 'data', ...) or ('header', header_id),
+        so an edit only has to re-scan the field that changed.
+    """
+
+    def __init__(self):
+        # resource id -> field -> {var uid}
+        self.fields = {}
+        # var uid -> {resource id: number of fields referencing it}
+        self.resources = {}
+
+    def __contains__(self, resource_id):
+        return resource_id in self.fields
+
+    def clear(self):
+        self.fields = {}
+        self.resources = {}
+
+    def set_field(self, resource_id, field, uids):
+        """ Replaces the variables referenced by a field.
+            Returns True if the set of variables the resource references changed.
+        """
+        fields = self.fields.setdefault(resource_id, {})
+        old_uids = fields.get(field, set())
+        uids = set(uids)
+        if uids == old_uids:
+            return False
+        before = self.resource_inputs(resource_id)
+        for uid in old_uids - uids:
+            self.__unref(uid, resource_id)
+        for uid in uids - old_uids:
+            refs = self.resources.setdefault(uid, {})
+            refs[resource_id] = refs.get(resource_id, 0) + 1
+        if uids:
+            fields[field] = uids
+        else:
+            fields.pop(field, None)
+        return before != self.resource_inputs(resource_id)
+
+    def drop_field(self, resource_id, field):
+        return self.set_field(resource_id, field, ())
+
+    def drop_resource(self, resource_id):
+        for uids in self.fields.pop(resource_id, {}).values():
+            for uid in uids:
+                self.__unref(uid, resource_id)
+
+    def resource_inputs(self, resource_id):
+        inputs = set()
+        for uids in self.fields.get(resource_id, {}).values():
+            inputs |= uids
+        return inputs
+
+    def resources_using(self, var_uid):
+        return set(self.resources.get(var_uid, ()))
+
+    def __unref(self, uid, resource_id):
+        refs = self.resources.get(uid)
+        if refs is None:
+            return
+        count = refs.get(resource_id, 0) - 1
+        if count > 0:
+            refs[resource_id] = count
+        else:
+            refs.pop(resource_id, None)
+            if not refs:
+                del self.resources[uid]
@@ -1,29 +1,61 @@
 import re
 import json
-import xmltodict
 import os
 import uuid
 import traceback
 from functools import partial, reduce
+from itertools import islice
 
 import nanome
 from nanome.util import Logs
+
+from .VariableStore import Variable, VariableStore
+from .ReferenceIndex import ReferenceIndex
+from .Templates import load_menu
+from .storage import JSONBackend, SQLiteBackend
 BASE_PATH = os.path.dirname(os.path.realpath(__file__))
+RESOURCE_FIELDS = ['url', 'import name', 'import content', 'data']
+VARIABLE_PATTERN = re.compile('{{(.*?)}}')
 MENU_PATH = os.path.join(BASE_PATH, 'menus', 'json', 'Settings.json')
 OFF_ICON_PATH = os.path.join(BASE_PATH, 'assets', 'icons', 'off.png')
 ON_ICON_PATH = os.path.join(BASE_PATH, 'assets', 'icons', 'on.png')
+# outputs are saved with the settings, larger ones are only stored as a preview
+STORED_OUTPUT_SIZE = int(os.environ.get('POSTGNOME_STORED_OUTPUT_SIZE', 256 * 1024))
+# keeping the first keys of objects, items of lists and characters of strings
+PREVIEW_KEYS = 200
+PREVIEW_ITEMS = 20
+PREVIEW_TEXT = 1024
+BACKENDS = {'json': JSONBackend, 'sqlite': SQLiteBackend}
+
+
+def preview_json(value):
+    if isinstance(value, dict):
+        return {key: preview_json(item) for key, item in islice(value.items(), PREVIEW_KEYS)}
+    if isinstance(value, list):
+        return [preview_json(item) for item in value[:PREVIEW_ITEMS]]
+    if isinstance(value, str):
+        return value[:PREVIEW_TEXT]
+    return value
+
+
+def preview_output(output):
+    """ A shortened copy of a JSON output that still parses, for outputs too large to store.
+        Empty if even that is over STORED_OUTPUT_SIZE
+    """
+    preview = json.dumps(preview_json(json.loads(output)))
+    return preview if len(preview) <= STORED_OUTPUT_SIZE else ''
+
 
 class Settings():
 
-    def __init__(self, plugin):
+    def __init__(self, plugin=None, directory=None):
+        """ Settings of a plugin session, or (without a plugin) those stored in directory """
         self.plugin = plugin
-        self.__menu = nanome.ui.Menu.io.from_json(MENU_PATH)
-        # uid -> [name, value]
-        self.variables = {}
-        # name -> uid
-        self.variable_names = {}
-        # value -> [uid]
-        self.variable_values = {}
+        self.__menu = None
+        # uid -> Variable(name, value)
+        self.variables = VariableStore()
+        # variable uid <-> resource fields, filled in lazily per resource
+        self.references = ReferenceIndex()
         self.resource_ids = []
         self.resources = {}
         self.request_ids = []
@@ -32,86 +64,83 @@ class Settings():
 
         self.count = 0
 
-        self.__settings_path = os.path.normpath(os.path.join(plugin.plugin_files_path, 'postgnome', 'settings.json'))
-        if not os.path.exists(os.path.dirname(self.__settings_path)):
-            os.makedirs(os.path.dirname(self.__settings_path))
+        settings_dir = os.path.normpath(directory or os.path.join(plugin.plugin_files_path, 'postgnome'))
+        if not os.path.exists(settings_dir):
+            os.makedirs(settings_dir)
+        backend = os.environ.get('POSTGNOME_SETTINGS_BACKEND', 'json').lower()
+        if backend not in BACKENDS:
+            Logs.warning(f'unknown settings backend {backend}, using json')
+            backend = 'json'
+        self.backend = BACKENDS[backend](settings_dir)
         self.load_settings()
 
+    @property
+    def variable_names(self):
+        # name -> uid
+        return self.variables.names
+
+    @property
+    def variable_values(self):
+        # value -> {uid: None}
+        return self.variables.values
+
     def generate_settings(self):
-        for setting_name in ['variables', 'variable_names', 'variable_values', 'resource_ids', 'resources', 'request_ids', 'requests']:
+        yield from self.variables.to_settings().items()
+        for setting_name in ['resource_ids', 'resources', 'request_ids', 'requests']:
             yield setting_name, getattr(self, setting_name)
 
     def load_settings(self, update=False):
-        if os.path.exists(self.__settings_path):
-            with open(self.__settings_path, 'r') as settings_file:
-                settings = json.load(settings_file)
-                for key, value in settings.items():
-                    setattr(self, key, value)
-        if update:
+        self.references.clear()
+        self.backend.load(self)
+        if update and self.plugin:
+            self.__menu = self.__menu or load_menu(MENU_PATH)
             self.plugin.update_menu(self.__menu)
 
     def save_settings(self, menu=None):
-        with open(self.__settings_path, 'w') as settings_file:
-            json.dump(dict(self.generate_settings()), settings_file)
-        self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, "Settings saved.")
-        Logs.debug(f'settings: {self.__settings_path}')
-
-    def touch_value(self, var_value):
-        if not self.variable_values.get(var_value, None):
-            self.variable_values[var_value] = []
+        self.backend.save(self)
+        self.notify(nanome.util.enums.NotificationTypes.success, "Settings saved.")
+        Logs.debug(f'settings: {self.backend.path}')
+
+    def notify(self, notification_type, message):
+        if self.plugin:
+            self.plugin.send_notification(notification_type, message)
+        elif notification_type == nanome.util.enums.NotificationTypes.error:
+            Logs.error(message)
+        else:
+            Logs.message(message)
 
     def touch_variable(self, var_name, uid=None):
-        if var_name not in self.variable_names:
-            uid = uid or str(uuid.uuid1())
-            self.variable_names[var_name] = uid
-            self.touch_value('')
-            self.variable_values[''].append(uid)
-            self.variables[uid] = [var_name,'']
-            return uid
-        else:
-            return self.variable_names[var_name]
+        return self.variables.add(var_name, '', uid)
 
     def set_variable(self, uid=None, name=None, value=None):
         # create the variable if it doesn't exist
         if uid is None and name is not None:
             uid = self.touch_variable(name)
-        # default to existing values
-        name = self.variables.get(uid, ['', ''])[0] if name is None else name
-        value = self.variables.get(uid, ['', ''])[1] if value is None else value
-        # update value->uid mappings
-        old_value = self.variables[uid][1]
-        self.variable_values[old_value].remove(uid)
-        if not self.variable_values[old_value]:
-            del self.variable_values[old_value]
-        if not self.variable_values.get(value, None):
-            self.variable_values[value] = []
-        self.variable_values[value].append(uid)
-        # update uid->name,value mapping
-        self.variables[uid] = [name, value]
-        return uid
+        return self.variables.set(uid, name, value)
 
     def get_variable_name(self, uid):
         if uid in self.variables:
-            return self.variables[uid][0]
+            return self.variables[uid].name
         return None
 
     def get_variable_by_id(self, uid):
         if uid in self.variables:
-            var = self.variables[uid]
-            return self.variables[uid][1]
+            return self.variables[uid].value
         return None
 
     def get_variable_by_name(self, name):
-        if name not in self.variable_names:
-            self.touch_variable(name)
-        uid = self.variable_names[name]
-        return self.variables[uid][1]
+        uid = self.touch_variable(name)
+        return self.variables[uid].value
 
     def get_inputs(self, r):
         def request_var_generator(r):
             for step in r['steps']:
                 resource = self.get_resource(step['resource'])
+                # a fan-out step fills its item variable itself
+                item_id = step['fan out'][1] if step.get('fan out') else None
                 for var_id in resource['input variables']:
+                    if var_id == item_id:
+                        continue
                     yield var_id, self.variables.get(var_id, [None, None])
                 if step['override_data']:
                     override_data_name = f"{r['name']} {step['name']} data"
@@ -128,14 +157,10 @@ class Settings():
 
     def delete_variable_by_name(self, var_name):
         uid = self.variable_names[var_name]
-        self.delete_variable_by_id(uid, var_name)
+        self.delete_variable_by_id(uid)
 
     def delete_variable_by_id(self, var_id, var_name=''):
-        value = self.variables[var_id][1]
-        var_name = var_name or self.variables[var_id][0]
-        del self.variable_names[var_name]
-        self.variable_values[value].remove(var_id)
-        del self.variables[var_id]
+        self.variables.delete(var_id)
 
     def generate_resource_string(self, string, acc=None):
         """ Takes a variable name template string and returns a variable uid
@@ -170,14 +195,18 @@ class Settings():
             replacement = None
             for context in contexts:
                 replacement = context.get(m.group(1))
-                if type(replacement) is list:
+                if isinstance(replacement, (list, Variable)):
                     replacement = replacement[use_index]
+                if replacement and not isinstance(replacement, str):
+                    # lists and objects read out of responses are substituted as JSON
+                    replacement = json.dumps(replacement)
                 if replacement: break
             if replacement:
                 if reporter: reporter(m.group(1), replacement)
             else:
                 replacement = defaults_generator(m.group(1)) if defaults_generator else default_value
-                if add_to_context:
+                # the variable store is only written through set_variable
+                if add_to_context and not isinstance(context, VariableStore):
                     context[m.group(1)] = replacement
             full_replacement = bleft_wrapper + bytearray(replacement, 'utf-8') + bright_wrapper
             bstring[m.start()+delta:m.end()+delta] = full_replacement
@@ -203,7 +232,7 @@ class Settings():
             return newd
 
         if not contexts:
-            contexts = [self.variable_values]
+            contexts = [{value: list(uids) for value, uids in self.variable_values.items()}]
         for context in contexts:
             for var_value, var_names in context.items():
                 Logs.debug(f'replacing {var_value} with {var_names[0]}')
@@ -257,7 +286,7 @@ class Settings():
         name = name or f'Resource {len(self.resource_ids)+1}'
         inputs = []
         def acc(name, uid): inputs.append(uid)
-        self.generate_resource_string(url, acc=acc)
+        url = self.generate_resource_string(url, acc=acc)
         r_id = str(uuid.uuid1())
         while r_id in self.resource_ids:
             r_id = str(uuid.uuid1())
@@ -278,7 +307,13 @@ class Settings():
                 'output headers': {},
                 'output variables': {},
                 'data': data,
-                'references': {}
+                'references': {},
+                'credential provider': False,
+                'credential ttl': None,
+                'pagination': None,
+                'max size': None,
+                'repeat load': 'focus',
+                'upload': None
             }
         for h_name, h_value in headers.items():
             self.add_header(self.resources[r_id], h_name, h_value)
@@ -310,59 +345,87 @@ class Settings():
         """
         uids = []
         def uid_acc(name, uid):
-            Logs.debug('item:', item)
-            Logs.debug('uid:', uid)
             uids.append(uid)
         rstr = partial(self.generate_resource_string, acc=uid_acc)
         if type(item) is str:
             value = rstr(item)
-            Logs.debug(f"resource string: {value}")
             resource[item_name] = value
         elif type(item) is list:
             value = {h_id: [rstr(h_n), rstr(h_v)] for h_id, [h_n, h_v] in item.values()}
             resource[item_name].update(value)
         return uids
 
+    def scan_field(self, resource, field):
+        """ Returns the uids of the variables referenced by one field of a resource.
+            Stored items use uids, headers are stored with variable names.
+        """
+        if type(field) is tuple:
+            strings = resource['headers'].get(field[1], [])
+            uids = []
+            for string in strings:
+                for m in VARIABLE_PATTERN.finditer(string):
+                    var = m.group(1)
+                    uids.append(var if var in self.variables else self.touch_variable(var))
+            return uids
+        string = resource.get(field, '')
+        return [m.group(1) for m in VARIABLE_PATTERN.finditer(string) if m.group(1) in self.variables]
+
+    def index_resource(self, resource):
+        r_id = resource['id']
+        self.references.drop_resource(r_id)
+        for field in RESOURCE_FIELDS:
+            self.references.set_field(r_id, field, self.scan_field(resource, field))
+        for h_id in resource['headers']:
+            self.references.set_field(r_id, ('header', h_id), self.scan_field(resource, ('header', h_id)))
+
+    def reindex_field(self, resource, field, uids=None):
+        """ Re-scans a single field of a resource, updating its input variables.
+            Returns True if the resource's input variables changed.
+        """
+        if resource['id'] not in self.references:
+            self.index_resource(resource)
+        if uids is None:
+            uids = self.scan_field(resource, field)
+        changed = self.references.set_field(resource['id'], field, uids)
+        output_vars = set(resource['output variables'].keys())
+        inputs = self.references.resource_inputs(resource['id']) - output_vars
+        changed = changed or inputs != set(resource['input variables'])
+        if changed:
+            resource['input variables'] = [uid for uid in resource['input variables'] if uid in inputs]
+            resource['input variables'] += [uid for uid in inputs if uid not in resource['input variables']]
+        return changed
+
+    def resources_using_variable(self, var_uid):
+        for resource in self.resources.values():
+            if resource['id'] not in self.references:
+                self.index_resource(resource)
+        return [self.resources[r_id] for r_id in self.references.resources_using(var_uid) if r_id in self.resources]
+
+    def requests_using_resource(self, resource):
+        return {request_id for request_id, count in resource['references'].items() if count}
+
+    def requests_using_variable(self, var_uid):
+        request_ids = set()
+        for resource in self.resources_using_variable(var_uid):
+            request_ids |= self.requests_using_resource(resource)
+        return request_ids
+
     def rename_resource(self, resource, new_name):
         self.resources[resource['id']]['name'] = new_name
         return True
 
-    def change_resource(self, resource, new_url=None, new_headers={}, new_import_content=None, new_import_name=None, new_data=None):
-        input_vars = set()
-        def acc(uid, name): input_vars.add(uid)
-
-        if new_url is not None:
-            input_vars.update(self.set_resource_item(resource, 'url', new_url))
-        else:
-            self.generate_varname_string(resource['url'], acc)
-
-        if new_import_name is not None:
-            input_vars.update(self.set_resource_item(resource, 'import name', new_import_name))
-        else:
-            self.generate_varname_string(resource['import name'], acc)
-
-        if new_import_content is not None:
-            input_vars.update(self.set_resource_item(resource, 'import content', new_import_content))
-        else:
-            self.generate_varname_string(resource['import content'], acc)
-
-        if new_data is not None:
-            input_vars.update(self.set_resource_item(resource, 'data', new_data))
-        else:
-            self.generate_varname_string(resource['data'], acc)
-
-        if new_headers is not None:
-            input_vars.update(self.set_resource_item(resource, 'headers', new_headers))
-        else:
-            for name, value in resource['headers'].values():
-                self.generate_varname_string(name, acc)
-                self.generate_varname_string(value, acc)
-
-        output_vars = set(resource['output variables'].keys())
-        print(f"output_vars: {output_vars}")
-        print(f"input_vars: {input_vars}")
-        print(f"new url: {new_url}")
-        resource['input variables'] = list(input_vars-output_vars)
+    def change_resource(self, resource, new_url=None, new_headers=None, new_import_content=None, new_import_name=None, new_data=None):
+        """ Updates the given items of a resource. Only the changed items are re-scanned
+            for variables, the others keep their indexed references.
+        """
+        changes = {'url': new_url, 'import name': new_import_name, 'import content': new_import_content, 'data': new_data}
+        for item_name, item in changes.items():
+            if item is not None:
+                uids = self.set_resource_item(resource, item_name, item)
+                self.reindex_field(resource, item_name, uids)
+        if new_headers:
+            for h_id, (h_name, h_value) in new_headers.items():
+                self.set_header(resource, h_id, h_name, h_value)
         return True
 
     def delete_resource(self, resource):
@@ -370,34 +433,39 @@ class Settings():
         if not has_references:
             self.resource_ids.remove(resource['id'])
             del self.resources[resource['id']]
+            self.references.drop_resource(resource['id'])
             return True
         else:
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Resource in use")
+            self.notify(nanome.util.enums.NotificationTypes.error, "Resource in use")
             return False
 
     def add_header(self, resource, new_name, new_value):
         header_id = str(uuid.uuid1())
         if new_name in resource['headers']:
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"Header {new_name} already exists in settings")
+            self.notify(nanome.util.enums.NotificationTypes.error, f"Header {new_name} already exists in settings")
             return False
         resource['header ids'].append(header_id)
         resource['headers'][header_id] = [new_name, new_value]
+        if resource['id'] in self.references:
+            self.reindex_field(resource, ('header', header_id))
         return header_id
 
     def set_header(self, resource, header_id, new_name, new_value):
         if not header_id in resource['header ids']:
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Header does not exist in settings")
+            self.notify(nanome.util.enums.NotificationTypes.error, "Header does not exist in settings")
             return False
         resource['headers'][header_id] = [new_name, new_value]
+        self.reindex_field(resource, ('header', header_id))
         return True
 
     def delete_header(self, resource, header_id):
         if not header_id in resource['header ids']:
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Header does not exist in settings")
+            self.notify(nanome.util.enums.NotificationTypes.error, "Header does not exist in settings")
             return False
         i = resource['header ids'].index(header_id)
         del resource['header ids'][i]
         del resource['headers'][header_id]
+        self.reindex_field(resource, ('header', header_id), ())
         return True
 
     def clear_output(self, resource, clear_headers=False):
@@ -408,20 +476,33 @@ class Settings():
     def set_output(self, resource, output, output_headers={}, override=True):
         """ Decontextualizes and sets the output for a resource
             and updates its output variables.
+            Returns the values of the output variables by uid, read from the whole output
         """
         # TODO: Fix flip flopping of variables (get rid of decontextualization here)
         # and put it somewhere where it makes sense
         # TODO: Finish with everything else
         if not resource['output'] or override:
+            values = self.read_output(resource, output)
             resource['output headers'] = output_headers
-            resource['output'] = output
-            output = self.decontextualize_output(resource, json.loads(output))
-            for uid, path in resource['output variables'].items():
-                value = output
-                for part in path:
-                    value = value.get(part, None)
-                if value:
-                    self.set_variable(uid, None, value)
+            resource['output'] = output if len(output) <= STORED_OUTPUT_SIZE else preview_output(output)
+            for uid, value in values.items():
+                self.set_variable(uid, None, value)
+            return values
+        return {}
+
+    def read_output(self, resource, output):
+        """ Returns the values of a resource's output variables in output, by uid,
+            without storing anything
+        """
+        output = self.decontextualize_output(resource, json.loads(output))
+        values = {}
+        for uid, path in resource['output variables'].items():
+            value = output
+            for part in path:
+                value = value.get(part, None)
+            if value:
+                values[uid] = value
+        return values
 
     def decontextualize_output(self, resource, output):
         if not output: return output
@@ -469,17 +550,17 @@ class Settings():
         del self.requests[request_id]
         return True
 
-    def add_step(self, request_id, step_name, resource_id, metadata_source='', override_data=False):
+    def add_step(self, request_id, step_name, resource_id, metadata_source='', override_data=False, fan_out=None):
         if resource_id in self.resources:
             request = self.requests[request_id]
             if step_name not in request['step names']:
                 request['step names'][step_name] = True
-                step = {'name': step_name, 'resource': resource_id, 'override_data': override_data, 'metadata_source': metadata_source}
+                step = {'name': step_name, 'resource': resource_id, 'override_data': override_data, 'metadata_source': metadata_source, 'fan out': fan_out}
                 request['steps'].append(step)
                 refs = self.resources[resource_id]['references']
                 refs[request_id] = refs.get(request_id, 0) + 1
                 return step
-        self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Please choose a unique name")
+        self.notify(nanome.util.enums.NotificationTypes.error, "Please choose a unique name")
         return False
 
     def rename_step(self, request_id, step, new_step_name):
@@ -493,9 +574,22 @@ class Settings():
                     a_step['name'] = new_step_name
                     return True
         else:
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Step does not exist")
+            self.notify(nanome.util.enums.NotificationTypes.error, "Step does not exist")
             return False
 
+    def set_fan_out(self, step, source_name=None, item_name=None):
+        """ Makes a step run its resource once per element of the list variable source_name,
+            each run seeing the element as item_name. Without names the step runs once.
+        """
+        if not source_name or not item_name:
+            step['fan out'] = None
+            return True
+        if source_name == item_name:
+            self.notify(nanome.util.enums.NotificationTypes.error, "The item variable must differ from the list")
+            return False
+        step['fan out'] = [self.touch_variable(source_name), self.touch_variable(item_name)]
+        return True
+
     def move_step(self, request_id, step_index, new_index):
         self.requests[request_id]['steps'].insert(new_index, self.requests[request_id]['steps'].pop(step_index))
 
@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+import nanome
+
+
+@lru_cache(maxsize=None)
+def node_template(path):
+    return nanome.ui.LayoutNode.io.from_json(path)
+
+
+def load_menu(path):
+    """ Parses a menu json. Copying a parsed menu is no faster than parsing it again """
+    return nanome.ui.Menu.io.from_json(path)
+
+
+def load_node(path):
+    """ Parses a layout node json once per process and returns a clone of it per call """
+    return node_template(path).clone()
@@ -0,0 +1,163 @@
+import uuid
+from collections.abc import Hashable, Mapping
+
+
+class Variable():
+    """ A single stored variable.
+        Indexes like the old [name, value] lists so existing unpacking keeps working.
+    """
+    __slots__ = ('uid', 'name', 'value')
+
+    def __init__(self, uid, name, value=''):
+        self.uid = uid
+        self.name = name
+        self.value = value
+
+    def __getitem__(self, i):
+        return (self.name, self.value)[i]
+
+    def __iter__(self):
+        yield self.name
+        yield self.value
+
+    def __len__(self):
+        return 2
+
+    def __repr__(self):
+        return f'Variable({self.uid!r}, {self.name!r}, {self.value!r})'
+
+
+class VariableStore(Mapping):
+    """ uid -> Variable mapping with name and value indexes.\n
+        Every insert, rename, update and delete is O(1). Value buckets are dicts used
+        as ordered sets so shared values such as '' don't degrade to list scans.
+        version is bumped on every change and can be used as a cache key.
+    """
+
+    def __init__(self):
+        self.__variables = {}
+        # name -> uid
+        self.names = {}
+        # value -> {uid: None}
+        self.values = {}
+        self.version = 0
+        # uids changed or deleted since the last take_changes, for per-row saving
+        self.__changed = set()
+        self.__deleted = set()
+
+    def __getitem__(self, uid):
+        return self.__variables[uid]
+
+    def __iter__(self):
+        return iter(self.__variables)
+
+    def __len__(self):
+        return len(self.__variables)
+
+    def __contains__(self, uid):
+        return uid in self.__variables
+
+    def uid_for(self, name):
+        return self.names.get(name)
+
+    def uids_with_value(self, value):
+        return list(self.values.get(value, ()))
+
+    def add(self, name, value='', uid=None):
+        """ Creates a variable, or returns the uid of the variable already using name """
+        if name in self.names:
+            return self.names[name]
+        uid = uid or str(uuid.uuid1())
+        self.__variables[uid] = Variable(uid, name, value)
+        self.names[name] = uid
+        self.__index_value(uid, value)
+        self.__changed.add(uid)
+        self.__deleted.discard(uid)
+        self.version += 1
+        return uid
+
+    def set(self, uid, name=None, value=None):
+        var = self.__variables[uid]
+        if name is not None and name != var.name:
+            if self.names.get(var.name) == uid:
+                del self.names[var.name]
+            self.names[name] = uid
+            var.name = name
+            self.__changed.add(uid)
+            self.version += 1
+        if value is not None and value != var.value:
+            self.__unindex_value(uid, var.value)
+            self.__index_value(uid, value)
+            var.value = value
+            self.__changed.add(uid)
+            self.version += 1
+        return uid
+
+    def delete(self, uid):
+        var = self.__variables.pop(uid)
+        if self.names.get(var.name) == uid:
+            del self.names[var.name]
+        self.__unindex_value(uid, var.value)
+        self.__changed.discard(uid)
+        self.__deleted.add(uid)
+        self.version += 1
+
+    def clear(self):
+        self.__deleted.update(self.__variables)
+        self.__changed = set()
+        self.__variables = {}
+        self.names = {}
+        self.values = {}
+        self.version += 1
+
+    def take_changes(self):
+        """ Returns the variables changed and the uids deleted since the last call """
+        changed = [self.__variables[uid] for uid in self.__changed if uid in self.__variables]
+        deleted = list(self.__deleted)
+        self.__changed = set()
+        self.__deleted = set()
+        return changed, deleted
+
+    def restore_changes(self, changed, deleted):
+        """ Marks what take_changes returned as unsaved again, after a failed save """
+        self.__changed.update(var.uid for var in changed if var.uid in self.__variables)
+        self.__deleted.update(uid for uid in deleted if uid not in self.__variables)
+
+    def load(self, variables):
+        """ Rebuilds the store from the settings format (uid -> [name, value]) """
+        self.clear()
+        for uid, (name, value) in variables.items():
+            self.__variables[uid] = Variable(uid, name, value)
+            self.names[name] = uid
+            self.__index_value(uid, value)
+        # what was loaded is what is stored
+        self.__changed = set()
+        self.__deleted = set()
+
+    def to_settings(self):
+        """ Serializes the store to the variables, variable_names and variable_values settings """
+        variables = {uid: [var.name, var.value] for uid, var in self.__variables.items()}
+        variable_values = {value: list(uids) for value, uids in self.values.items()}
+        return {
+            'variables': variables,
+            'variable_names': dict(self.names),
+            'variable_values': variable_values
+        }
+
+    def __index_value(self, uid, value):
+        # lists and dicts pulled out of responses can't be looked up by value
+        if not isinstance(value, Hashable):
+            return
+        bucket = self.values.get(value)
+        if bucket is None:
+            bucket = self.values[value] = {}
+        bucket[uid] = None
+
+    def __unindex_value(self, uid, value):
+        if not isinstance(value, Hashable):
+            return
+        bucket = self.values.get(value)
+        if bucket is not None:
+            bucket.pop(uid, None)
+            if not bucket:
+                del self.values[value]
@@ -5,6 +5,8 @@ from enum import IntEnum
 
 import nanome
 
+from ..Templates import load_node
+
 BASE_PATH = os.path.dirname(os.path.realpath(__file__))
 JSON_PATH = os.path.join(BASE_PATH, 'json', 'ListElement2.json')
 
@@ -21,7 +23,7 @@ class ValueDisplayType(IntEnum):
 class ListElement(nanome.ui.LayoutNode):
     def __init__(self, plugin, ui_list, name, value = None, value_source = None, value_display_type = ValueDisplayType.Fixed, externally_used = False, config = None, deleted = None, renamed = None, revalued = None, external_toggle = None, config_opened = None, config_closed = None):
         nanome.ui.LayoutNode.__init__(self, name)
-        ln = nanome.ui.LayoutNode.io.from_json(JSON_PATH)
+        ln = load_node(JSON_PATH)
         self.add_child(ln)
 
         self.config = config
@@ -0,0 +1,79 @@
+import threading
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class CancelToken():
+    """ Cancellation flag of one Request run.\n
+        Work checks it between stages, and blocking operations register callbacks
+        (closing a response, cancelling a queued future) that run as soon as the
+        run is cancelled so they return early instead of finishing their work.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__event = threading.Event()
+        self.__callbacks = {}
+        self.__next_id = 0
+
+    @property
+    def cancelled(self):
+        return self.__event.is_set()
+
+    def cancel(self):
+        with self.__lock:
+            if self.__event.is_set():
+                return
+            self.__event.set()
+            callbacks, self.__callbacks = list(self.__callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def check(self):
+        if self.__event.is_set():
+            raise RequestCancelled()
+
+    def on_cancel(self, callback):
+        """ Calls callback when the token is cancelled (now, if it already is).
+            Returns a function unregistering it.
+        """
+        with self.__lock:
+            if not self.__event.is_set():
+                key = self.__next_id
+                self.__next_id += 1
+                self.__callbacks[key] = callback
+                return lambda: self.__callbacks.pop(key, None)
+        callback()
+        return lambda: None
+
+    def sleep(self, seconds):
+        if self.__event.wait(seconds):
+            raise RequestCancelled()
+
+    def result(self, future, timeout=None):
+        """ Waits for a Future, cancelling it and raising RequestCancelled if the token is cancelled first,
+            or TimeoutError if timeout seconds pass first
+        """
+        done = threading.Event()
+        future.add_done_callback(lambda f: done.set())
+        remove = self.on_cancel(done.set)
+        try:
+            finished = done.wait(timeout)
+        finally:
+            remove()
+        if not future.done():
+            future.cancel()
+        self.check()
+        if not finished:
+            raise TimeoutError(f'no result after {timeout} seconds')
+        return future.result()
+
+    def iterate(self, iterable):
+        for item in iterable:
+            self.check()
+            yield item
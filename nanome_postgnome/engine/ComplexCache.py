@@ -0,0 +1,156 @@
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from nanome.util import Logs
+
+# bumped whenever cached files can no longer be read back
+CACHE_VERSION = 1
+MEMORY_SIZE = int(os.environ.get('POSTGNOME_COMPLEX_MEMORY_SIZE', 64 * 1024 * 1024))
+DISK_SIZE = int(os.environ.get('POSTGNOME_COMPLEX_CACHE_SIZE', 1024 * 1024 * 1024))
+
+
+class ComplexCache():
+    """ Complexes that went through parsing, add_bonds and add_dssp, by (payload digest, import type).\n
+        Entries are kept pickled, so every get returns complexes of its own, in an LRU
+        of at most memory_size bytes and, once open() gave it a directory, in an LRU
+        of at most disk_size bytes of files shared by every process using that directory.
+    """
+
+    def __init__(self, memory_size=MEMORY_SIZE, disk_size=DISK_SIZE):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.directory = None
+        self.__lock = threading.Lock()
+        # key -> pickled complex list, least recently used first
+        self.__memory = OrderedDict()
+        self.__memory_used = 0
+
+    def open(self, directory):
+        """ Keeps entries under directory from now on. The first call wins """
+        with self.__lock:
+            if self.directory is None:
+                os.makedirs(directory, exist_ok=True)
+                self.directory = directory
+                self.__trim_disk()
+
+    def get(self, key):
+        with self.__lock:
+            data = self.__memory.get(key)
+            if data is not None:
+                self.__memory.move_to_end(key)
+        if data is None:
+            data = self.__read(key)
+            if data is None:
+                return None
+            with self.__lock:
+                self.__remember(key, data)
+        else:
+            self.__touch(key)
+        try:
+            return pickle.loads(data)
+        except Exception:
+            Logs.warning(f'dropping unreadable cached complex {key[0]}')
+            self.discard(key)
+            return None
+
+    def put(self, key, complex_list):
+        try:
+            data = pickle.dumps(complex_list, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            Logs.warning(f'could not cache complex {key[0]}: {e}')
+            return
+        with self.__lock:
+            self.__remember(key, data)
+        self.__write(key, data)
+
+    def discard(self, key):
+        with self.__lock:
+            data = self.__memory.pop(key, None)
+            if data is not None:
+                self.__memory_used -= len(data)
+        path = self.__path(key)
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def __remember(self, key, data):
+        if len(data) > self.memory_size:
+            return
+        old = self.__memory.pop(key, None)
+        if old is not None:
+            self.__memory_used -= len(old)
+        self.__memory[key] = data
+        self.__memory_used += len(data)
+        while self.__memory_used > self.memory_size:
+            _, evicted = self.__memory.popitem(last=False)
+            self.__memory_used -= len(evicted)
+
+    def __path(self, key):
+        if self.directory is None:
+            return None
+        digest, import_type = key
+        return os.path.join(self.directory, f"v{CACHE_VERSION}-{digest}-{import_type.lstrip('.')}.pickle")
+
+    def __read(self, key):
+        path = self.__path(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        self.__touch(key)
+        return data
+
+    def __touch(self, key):
+        # file times order the disk LRU
+        path = self.__path(key)
+        if path:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def __write(self, key, data):
+        path = self.__path(key)
+        if not path or len(data) > self.disk_size:
+            return
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            # other processes only ever see complete files
+            os.replace(temp_path, path)
+        except OSError as e:
+            Logs.warning(f'could not write cached complex {key[0]}: {e}')
+            return
+        with self.__lock:
+            self.__trim_disk()
+
+    def __trim_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if used <= self.disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            used -= size
+
+
+complex_cache = ComplexCache()
@@ -0,0 +1,220 @@
+import re
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from nanome.util import Logs
+
+from .Cancellation import RequestCancelled
+
+PAGINATION_TYPES = ['link', 'next', 'offset']
+DEFAULT_MAX_PAGES = 100
+DEFAULT_CONCURRENCY = 4
+LINK_PATTERN = re.compile(r'<([^>]*)>\s*;([^,]*)')
+# spec option -> (policy key, parser)
+SPEC_OPTIONS = {
+    'items': ('items', lambda v: v.split('.')),
+    'next': ('next', lambda v: v.split('.')),
+    'cursor': ('cursor param', str),
+    'total': ('total', lambda v: v.split('.')),
+    'limit': ('limit', int),
+    'offset_param': ('offset param', str),
+    'limit_param': ('limit param', str),
+    'max_pages': ('max pages', int)
+}
+
+
+def parse_policy(spec):
+    """ Reads a pagination policy from 'type key=value ...', e.g.\n
+        link items=root.results\n
+        next next=root.next items=root.results cursor=page_token\n
+        offset limit=100 total=root.total items=root.data offset_param=start
+    """
+    tokens = spec.split()
+    if not tokens:
+        return None
+    if tokens[0] not in PAGINATION_TYPES:
+        raise ValueError(f'pagination type must be one of {", ".join(PAGINATION_TYPES)}')
+    policy = {'type': tokens[0]}
+    for token in tokens[1:]:
+        key, _, value = token.partition('=')
+        if key not in SPEC_OPTIONS or not value:
+            raise ValueError(f'unknown pagination option {token}')
+        name, parse = SPEC_OPTIONS[key]
+        policy[name] = parse(value)
+    if 'items' not in policy:
+        raise ValueError('pagination needs items=<path of the list to merge>')
+    if policy['type'] == 'next' and 'next' not in policy:
+        raise ValueError('next pagination needs next=<path of the next url or cursor>')
+    return policy
+
+
+def format_policy(policy):
+    if not policy:
+        return ''
+    tokens = [policy['type']]
+    for key, (name, _) in SPEC_OPTIONS.items():
+        if name in policy:
+            value = policy[name]
+            tokens.append(f"{key}={'.'.join(value) if isinstance(value, list) else value}")
+    return ' '.join(tokens)
+
+
+def get_path(obj, path):
+    for part in path:
+        if isinstance(obj, dict):
+            obj = obj.get(part)
+        elif isinstance(obj, list) and part.isdigit() and int(part) < len(obj):
+            obj = obj[int(part)]
+        else:
+            return None
+    return obj
+
+
+def with_query(url, **params):
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update({k: str(v) for k, v in params.items()})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def query_value(url, name, default=None):
+    return dict(parse_qsl(urlsplit(url).query)).get(name, default)
+
+
+def next_link(headers):
+    """ The rel="next" target of an RFC 8288 Link header """
+    for target, params in LINK_PATTERN.findall(headers.get('Link', '')):
+        if re.search(r'rel="?([^";]*\s)?next(\s[^";]*)?"?', params):
+            return target
+    return None
+
+
+class PageMerger():
+    """ Merges pages into the first one as they arrive, appending each page's
+        items list to the first page's, so only pages still out of order are held
+    """
+
+    def __init__(self, document, items_path):
+        self.document = document
+        self.items_path = items_path
+        self.items = get_path(document, items_path)
+        if not isinstance(self.items, list):
+            raise ValueError(f"{'.'.join(items_path)} is not a list in the first page")
+        self.pages = 1
+
+    def add(self, response):
+        items = get_path(json.loads(response.text), self.items_path)
+        if isinstance(items, list):
+            self.items.extend(items)
+        self.pages += 1
+        return items or []
+
+
+def paginate(policy, rendered, fetch, concurrency=DEFAULT_CONCURRENCY):
+    """ Fetches every page of a paginated resource and merges them into one response.\n
+        Offset pagination fetches the remaining pages concurrently once the first page
+        gives the total. Link and cursor pagination have to follow the pages in order,
+        so the next page is fetched while the current one is being merged.
+        Returns a copy of the first page's response holding the merged document,
+        as the first page itself may be shared with other steps of the run.
+    """
+    kind = policy['type']
+    limit = policy.get('limit')
+    if kind == 'offset' and limit:
+        offset = int(query_value(rendered.url, policy.get('offset param', 'offset'), 0))
+        rendered = rendered._replace(url=with_query(rendered.url, **{
+            policy.get('offset param', 'offset'): offset,
+            policy.get('limit param', 'limit'): limit
+        }))
+    first = fetch(rendered)
+    try:
+        document = json.loads(first.text)
+        merger = PageMerger(document, policy['items'])
+    except ValueError as e:
+        Logs.warning(f'not paginating {rendered.url}: {e}')
+        return first
+
+    max_pages = policy.get('max pages', DEFAULT_MAX_PAGES)
+    with ThreadPoolExecutor(max_workers=concurrency if kind == 'offset' else 1) as executor:
+        try:
+            if kind == 'offset':
+                merge_offset_pages(policy, rendered, merger, fetch, executor, max_pages)
+            else:
+                merge_cursor_pages(policy, rendered, first, merger, fetch, executor, max_pages)
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            # keep what was merged, a failing page shouldn't lose the others
+            Logs.warning(f'pagination of {rendered.url} stopped after {merger.pages} pages: {e}')
+    if merger.pages >= max_pages:
+        Logs.warning(f'pagination of {rendered.url} stopped at {max_pages} pages')
+    merged = copy.copy(first)
+    merged._content = bytes(json.dumps(merger.document), 'utf-8')
+    merged.encoding = 'utf-8'
+    # a body kept on disk only holds the first page, imports get the merged document as received
+    merged.body = None
+    merged.raw_text = json.dumps(merger.document.get('root', merger.document))
+    return merged
+
+
+def merge_offset_pages(policy, rendered, merger, fetch, executor, max_pages):
+    offset_param = policy.get('offset param', 'offset')
+    limit_param = policy.get('limit param', 'limit')
+    limit = policy.get('limit') or len(merger.items)
+    if not limit:
+        return
+    start = int(query_value(rendered.url, offset_param, 0))
+    total = get_path(merger.document, policy['total']) if 'total' in policy else None
+    if total is None:
+        # no total, page until one comes back short
+        offset = start + limit
+        while merger.pages < max_pages:
+            page = rendered._replace(url=with_query(rendered.url, **{offset_param: offset, limit_param: limit}))
+            if len(merger.add(fetch(page))) < limit:
+                return
+            offset += limit
+        return
+    offsets = range(start + limit, int(total), limit)[:max_pages - 1]
+    pages = [rendered._replace(url=with_query(rendered.url, **{offset_param: offset, limit_param: limit})) for offset in offsets]
+    # submitted together, merged in order as they complete
+    futures = [executor.submit(fetch, page) for page in pages]
+    try:
+        for future in futures:
+            merger.add(future.result())
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def merge_cursor_pages(policy, rendered, first, merger, fetch, executor, max_pages):
+    seen = {rendered.url}
+    response, document, items = first, merger.document, None
+    while True:
+        url = next_url(policy, rendered, response, document)
+        future = None
+        if url and url not in seen and merger.pages + (items is not None) < max_pages:
+            seen.add(url)
+            future = executor.submit(fetch, rendered._replace(url=url))
+        # the current page is merged while the next one downloads
+        if items is not None:
+            merger.items.extend(items if isinstance(items, list) else [])
+            merger.pages += 1
+        if future is None:
+            return
+        response = future.result()
+        document = json.loads(response.text)
+        items = get_path(document, policy['items'])
+
+
+def next_url(policy, rendered, response, document):
+    if policy['type'] == 'link':
+        target = next_link(response.headers)
+        return urljoin(rendered.url, target) if target else None
+    cursor = get_path(document, policy['next'])
+    if not cursor:
+        return None
+    if isinstance(cursor, str) and cursor.startswith(('http://', 'https://', '/')):
+        return urljoin(rendered.url, cursor)
+    return with_query(rendered.url, **{policy.get('cursor param', 'cursor'): cursor})
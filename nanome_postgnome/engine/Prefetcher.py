@@ -0,0 +1,79 @@
+import time
+import threading
+from urllib.parse import urlsplit
+
+from nanome.util import Logs
+
+from .Scheduler import SPECULATIVE, scheduler
+
+
+class Prefetcher():
+    """ Runs fetches ahead of time for a Request that was just selected.\n
+        Results are kept for ttl seconds and handed out once, to the Load that
+        renders the same request. Connections to the hosts a Request targets can
+        also be warmed so the first real fetch skips DNS, TCP and TLS setup.
+        Both run as speculative work of owner on the process scheduler.
+    """
+
+    def __init__(self, session, fetch, ttl=60, proxies=None, owner=None):
+        self.session = session
+        self.fetch = fetch
+        self.ttl = ttl
+        self.proxies = proxies
+        self.owner = owner
+        self.__lock = threading.Lock()
+        # RenderedRequest -> (expiry, Future)
+        self.__results = {}
+        self.__warm_hosts = {}
+
+    def warm(self, urls):
+        now = time.time()
+        for url in urls:
+            parts = urlsplit(url)
+            if parts.scheme not in ['http', 'https'] or not parts.netloc:
+                continue
+            origin = f'{parts.scheme}://{parts.netloc}/'
+            with self.__lock:
+                if self.__warm_hosts.get(origin, 0) > now:
+                    continue
+                self.__warm_hosts[origin] = now + self.ttl
+            scheduler.submit(SPECULATIVE, self.owner, self.__warm, origin)
+
+    def __warm(self, origin):
+        # the pooled keep-alive connection is what we're after, not the response
+        try:
+            self.session.head(origin, proxies=self.proxies, verify=False, timeout=5, allow_redirects=False)
+        except Exception as e:
+            Logs.debug(f'could not warm {origin}: {e}')
+
+    def prefetch(self, rendered):
+        now = time.time()
+        with self.__lock:
+            self.__expire(now)
+            if rendered in self.__results:
+                return
+            future = scheduler.submit(SPECULATIVE, self.owner, self.fetch, rendered)
+            self.__results[rendered] = (now + self.ttl, future)
+
+    def take(self, rendered):
+        """ Returns the prefetch Future for a rendered request, or None.
+            A prefetch that hasn't started is dropped instead, waiting for it would
+            leave the caller queued at speculative priority
+        """
+        with self.__lock:
+            self.__expire(time.time())
+            expiry, future = self.__results.pop(rendered, (None, None))
+        if future is not None and future.cancel():
+            return None
+        return future
+
+    def clear(self):
+        with self.__lock:
+            results, self.__results = self.__results, {}
+        for expiry, future in results.values():
+            # drops the prefetches that haven't started yet
+            future.cancel()
+
+    def __expire(self, now):
+        for rendered in [r for r, (expiry, _) in self.__results.items() if expiry <= now]:
+            del self.__results[rendered]
@@ -0,0 +1,90 @@
+import time
+import threading
+
+
+def format_size(size):
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GB'
+
+
+class Progress():
+    """ Progress of one Request run: step i of n, its stage, and bytes received.\n
+        Updates are coalesced so publish is called at most once per interval with
+        the latest state, however often the run reports. Without publish it does nothing.
+    """
+
+    def __init__(self, publish=None, interval=0.25):
+        self.publish = publish
+        self.interval = interval
+        self.__lock = threading.Lock()
+        self.__step = None
+        self.__stage = ''
+        self.__transfer = None
+        self.__last = 0.0
+        self.__timer = None
+
+    def step(self, index, count, stage):
+        with self.__lock:
+            self.__step = (index, count)
+            self.__stage = stage
+            self.__transfer = None
+        self.__changed()
+
+    def stage(self, stage):
+        with self.__lock:
+            self.__stage = stage
+            self.__transfer = None
+        self.__changed()
+
+    def transfer(self, received, total=None):
+        with self.__lock:
+            self.__transfer = (received, total)
+        self.__changed()
+
+    def message(self, text):
+        """ Publishes text right away, replacing anything pending """
+        with self.__lock:
+            if self.__timer:
+                self.__timer.cancel()
+                self.__timer = None
+            self.__last = time.monotonic()
+        if self.publish:
+            self.publish(text)
+
+    def text(self):
+        with self.__lock:
+            text = self.__stage
+            if self.__step:
+                text = f'Step {self.__step[0]} of {self.__step[1]}: {text}'
+            if self.__transfer:
+                received, total = self.__transfer
+                text += f' ({format_size(received)} of {format_size(total)})' if total else f' ({format_size(received)})'
+            return text
+
+    def __changed(self):
+        if not self.publish:
+            return
+        with self.__lock:
+            if self.__timer:
+                # the pending publish will pick this update up
+                return
+            delay = self.__last + self.interval - time.monotonic()
+            if delay > 0:
+                self.__timer = threading.Timer(delay, self.__flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+                return
+            self.__last = time.monotonic()
+        self.publish(self.text())
+
+    def __flush(self):
+        with self.__lock:
+            if self.__timer is None:
+                # replaced by a message in the meantime
+                return
+            self.__timer = None
+            self.__last = time.monotonic()
+        self.publish(self.text())
@@ -0,0 +1,183 @@
+import os
+import math
+import time
+import threading
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+
+from nanome.util import Logs
+
+DEFAULT_RATE = 10.0
+DEFAULT_CONCURRENCY = 8
+INITIAL_CONCURRENCY = 2
+BACKOFF_STATUSES = [429, 503]
+DEFAULT_BACKOFF = 1.0
+MAX_RETRY_AFTER = 60.0
+
+
+def retry_after(headers, default):
+    """ Seconds to wait according to a Retry-After header (delay or HTTP date) """
+    value = headers.get('Retry-After')
+    if not value:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return default
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def parse_limit(limit):
+    """ (rate, burst, concurrency) of a 'rate[/burst][:concurrency]' limit.
+        Rates and bursts have to be finite and positive, and concurrency at least 1
+    """
+    limit, _, concurrency = limit.partition(':')
+    rate, _, burst = limit.partition('/')
+    rate, burst, concurrency = float(rate), float(burst) if burst else None, int(concurrency or DEFAULT_CONCURRENCY)
+    for value in [rate] + ([burst] if burst is not None else []):
+        if not math.isfinite(value) or value <= 0:
+            raise ValueError(f'{value} is not a positive rate')
+    if concurrency < 1:
+        raise ValueError(f'concurrency {concurrency} is below 1')
+    return rate, burst, concurrency
+
+
+class HostLimiter():
+    """ Request budget of one host.\n
+        A token bucket bounds the request rate, and a concurrency limit adapts with
+        AIMD: it grows by about one per window of successful requests, and halves
+        when the host answers 429 or 503, the host being paused for its Retry-After.
+    """
+
+    def __init__(self, host, rate=DEFAULT_RATE, burst=None, max_concurrency=DEFAULT_CONCURRENCY):
+        if not rate > 0:
+            raise ValueError(f'rate of {host} must be positive')
+        self.host = host
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(INITIAL_CONCURRENCY, max_concurrency))
+        self.active = 0
+        self.__tokens = self.burst
+        self.__updated = time.monotonic()
+        self.__paused_until = 0.0
+        self.__failures = 0
+        self.__condition = threading.Condition()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def acquire(self):
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                self.__refill(now)
+                wait = self.__paused_until - now
+                if wait <= 0 and self.active < int(self.limit):
+                    if self.__tokens >= 1:
+                        self.__tokens -= 1
+                        self.active += 1
+                        return
+                    wait = (1 - self.__tokens) / self.rate
+                # woken early when a slot is released
+                self.__condition.wait(wait if wait > 0 else None)
+
+    def release(self):
+        with self.__condition:
+            self.active -= 1
+            self.__condition.notify_all()
+
+    def feedback(self, status_code, headers):
+        """ Adapts to a response. Returns the seconds to wait before retrying it, or None """
+        with self.__condition:
+            if status_code in BACKOFF_STATUSES:
+                self.__failures += 1
+                delay = retry_after(headers, DEFAULT_BACKOFF * 2 ** (self.__failures - 1))
+                now = time.monotonic()
+                # one decrease per backoff period, responses to requests already in flight don't compound it
+                if now >= self.__paused_until:
+                    self.limit = max(1.0, self.limit / 2)
+                    Logs.debug(f'{self.host} answered {status_code}, concurrency {self.limit:.1f}, pausing {delay:.1f}s')
+                self.__paused_until = max(self.__paused_until, now + delay)
+                return delay
+            self.__failures = 0
+            if status_code < 500:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.__condition.notify_all()
+            return None
+
+    def __refill(self, now):
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+
+class UnlimitedHost():
+    """ Budget of a host with no configured limit. Requests are never held back,
+        feedback only gives the Retry-After of a 429 or 503
+    """
+
+    def __init__(self, host):
+        self.host = host
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def feedback(self, status_code, headers):
+        if status_code in BACKOFF_STATUSES:
+            return retry_after(headers, DEFAULT_BACKOFF)
+        return None
+
+
+class RateLimits():
+    """ HostLimiters by host, created on first use.\n
+        Limits are configured with entries 'host=rate[/burst][:concurrency]' separated by
+        commas, e.g. 'rcsb.org=10/20:4,pubchem.ncbi.nlm.nih.gov=5'. An entry also applies
+        to the subdomains of its host, and '*' sets the default for unlisted hosts.
+        Hosts no entry applies to are not limited.
+    """
+
+    def __init__(self, spec=''):
+        self.__lock = threading.Lock()
+        self.__hosts = {}
+        self.__limits = {}
+        for entry in filter(None, (e.strip() for e in spec.split(','))):
+            try:
+                host, limit = entry.split('=')
+                self.__limits[host.strip().lower()] = parse_limit(limit)
+            except ValueError as e:
+                Logs.warning(f'invalid rate limit {entry}: {e}')
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get('POSTGNOME_RATE_LIMITS', ''))
+
+    def for_url(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        with self.__lock:
+            limiter = self.__hosts.get(host)
+            if limiter is None:
+                limits = self.__limits_for(host)
+                limiter = self.__hosts[host] = HostLimiter(host, *limits) if limits else UnlimitedHost(host)
+            return limiter
+
+    def __limits_for(self, host):
+        parts = host.split('.')
+        for i in range(len(parts)):
+            limits = self.__limits.get('.'.join(parts[i:]))
+            if limits:
+                return limits
+        return self.__limits.get('*')
+
+
+# one budget per host for the whole plugin process
+rate_limits = RateLimits.from_env()
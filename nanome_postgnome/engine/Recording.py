@@ -0,0 +1,258 @@
+import io
+import os
+import re
+import json
+import time
+import base64
+import threading
+from datetime import datetime, timedelta, timezone
+
+from requests import ConnectionError, Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from nanome.util import Logs
+
+from .ResponseBody import is_text_type
+
+HAR_VERSION = '1.2'
+CREATOR = {'name': 'postgnome', 'version': '1'}
+# bodies are archived decoded, so the transfer headers no longer describe them
+TRANSFER_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding']
+UNSAFE_FILENAME = re.compile(r'[^\w.-]+')
+# credentials are not written to archives
+REDACTED_HEADERS = ['authorization', 'proxy-authorization', 'cookie', 'set-cookie']
+REDACTED = '[redacted]'
+
+
+def har_headers(headers):
+    return [{'name': name, 'value': REDACTED if name.lower() in REDACTED_HEADERS else value} for name, value in headers.items()]
+
+
+def har_content(content, mime_type):
+    entry = {'size': len(content), 'mimeType': mime_type}
+    if is_text_type(mime_type):
+        try:
+            entry['text'] = content.decode('utf-8')
+            return entry
+        except UnicodeDecodeError:
+            pass
+    entry['text'] = base64.b64encode(content).decode('ascii')
+    entry['encoding'] = 'base64'
+    return entry
+
+
+def content_bytes(content):
+    text = content.get('text', '')
+    if content.get('encoding') == 'base64':
+        return base64.b64decode(text)
+    return text.encode('utf-8')
+
+
+def request_body(body):
+    if body is None:
+        return ''
+    if isinstance(body, bytes):
+        return body.decode('utf-8', errors='replace')
+    if not isinstance(body, str):
+        # streamed uploads are generated while they are sent, and not recorded
+        return ''
+    return body
+
+
+class Recorder():
+    """ Collects the HTTP exchanges of a Request run into a HAR archive.\n
+        Entries hold the request as it was sent, the response status, headers and
+        decoded body, and how long the response took to start (wait) and to
+        arrive in full (receive). Credential headers are redacted.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.__lock = threading.Lock()
+        self.__entries = []
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        with self.__lock:
+            self.__entries = []
+
+    def add(self, request, response, content, started, wait, receive):
+        entry = {
+            'startedDateTime': started.isoformat(),
+            'time': (wait + receive) * 1000,
+            'request': {
+                'method': request.method,
+                'url': request.url,
+                'httpVersion': 'HTTP/1.1',
+                'headers': har_headers(request.headers),
+                'queryString': [],
+                'postData': {'mimeType': request.headers.get('Content-Type', ''), 'text': request_body(request.body)},
+                'headersSize': -1,
+                'bodySize': len(request.body or '')
+            },
+            'response': {
+                'status': response.status_code,
+                'statusText': response.reason or '',
+                'httpVersion': 'HTTP/1.1',
+                'headers': har_headers(response.headers),
+                'content': har_content(content, response.headers.get('Content-Type', '')),
+                'redirectURL': response.headers.get('Location', ''),
+                'headersSize': -1,
+                'bodySize': -1
+            },
+            'cache': {},
+            'timings': {'send': 0, 'wait': wait * 1000, 'receive': receive * 1000}
+        }
+        with self.__lock:
+            self.__entries.append(entry)
+
+    def archive(self):
+        with self.__lock:
+            entries = list(self.__entries)
+        return {'log': {'version': HAR_VERSION, 'creator': CREATOR, 'entries': entries}}
+
+    def save(self, name):
+        """ Writes the exchanges recorded since start() to <directory>/<name>-<time>.har """
+        filename = f"{UNSAFE_FILENAME.sub('_', name)}-{time.strftime('%Y%m%d-%H%M%S')}.har"
+        path = os.path.join(self.directory, filename)
+        archive = self.archive()
+        with open(path, 'w') as archive_file:
+            json.dump(archive, archive_file)
+        Logs.message(f"recorded {len(archive['log']['entries'])} exchanges to {path}")
+        return path
+
+
+class TeeStream():
+    """ Raw response stream that keeps a copy of what is read through it.\n
+        Readers stream it as usual. done(content) is called once, with everything that
+        was read, when the stream runs out or is closed
+    """
+
+    def __init__(self, raw, done):
+        self.__raw = raw
+        self.__done = done
+        self.__chunks = []
+        self.__finished = False
+
+    def __getattr__(self, name):
+        return getattr(self.__raw, name)
+
+    def stream(self, amt=2**16, decode_content=None):
+        for chunk in self.__raw.stream(amt, decode_content=decode_content):
+            self.__chunks.append(chunk)
+            yield chunk
+        self.__finish()
+
+    def read(self, *args, **kwargs):
+        chunk = self.__raw.read(*args, **kwargs)
+        if chunk:
+            self.__chunks.append(chunk)
+        else:
+            self.__finish()
+        return chunk
+
+    def close(self):
+        self.__raw.close()
+        # an abandoned transfer is recorded with what arrived of it
+        self.__finish()
+
+    def __finish(self):
+        if not self.__finished:
+            self.__finished = True
+            self.__done(b''.join(self.__chunks))
+
+
+class RecordingAdapter(HTTPAdapter):
+    """ Transport that sends requests normally and records every exchange.
+        Bodies are recorded as they are streamed to the reader, so size limits,
+        progress and cancellation keep working while recording
+    """
+
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request, **kwargs):
+        started = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        response = super().send(request, **kwargs)
+        wait = time.perf_counter() - start
+        def done(content):
+            receive = time.perf_counter() - start - wait
+            self.recorder.add(request, response, content, started, wait, receive)
+        response.raw = TeeStream(response.raw, done)
+        return response
+
+
+class PacedStream(io.BytesIO):
+    """ Raw response stream that spreads a recorded receive time over its reads """
+
+    def __init__(self, content, receive):
+        super().__init__(content)
+        self.__rate = receive / len(content) if content else 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        if chunk and self.__rate:
+            time.sleep(self.__rate * len(chunk))
+        return chunk
+
+
+class ReplayAdapter(BaseAdapter):
+    """ Transport that answers requests from a HAR archive instead of the network.\n
+        Exchanges are matched on method, url and body. Repeated requests are answered
+        with their recorded exchanges in order, the last one being reused once they run out.
+        Recorded latencies are reproduced, multiplied by latency_scale (0 disables them).
+    """
+
+    def __init__(self, archive, latency_scale=1.0):
+        super().__init__()
+        self.latency_scale = latency_scale
+        self.__lock = threading.Lock()
+        # (method, url, body) -> [entry]
+        self.__exchanges = {}
+        for entry in archive['log']['entries']:
+            self.__exchanges.setdefault(self.key(entry['request']), []).append(entry)
+
+    @classmethod
+    def from_file(cls, path, latency_scale=1.0):
+        with open(path, 'r') as archive_file:
+            return cls(json.load(archive_file), latency_scale)
+
+    @staticmethod
+    def key(request):
+        return request['method'].upper(), request['url'], request.get('postData', {}).get('text', '')
+
+    def send(self, request, stream=False, **kwargs):
+        key = (request.method.upper(), request.url, request_body(request.body))
+        with self.__lock:
+            entries = self.__exchanges.get(key)
+            if not entries:
+                raise ConnectionError(f'no recorded exchange for {request.method} {request.url}', request=request)
+            entry = entries.pop(0) if len(entries) > 1 else entries[0]
+
+        timings = entry.get('timings', {})
+        wait = max(timings.get('wait', 0), 0) / 1000 * self.latency_scale
+        receive = max(timings.get('receive', 0), 0) / 1000 * self.latency_scale
+        time.sleep(wait)
+
+        recorded = entry['response']
+        headers = CaseInsensitiveDict({h['name']: h['value'] for h in recorded['headers'] if h['name'].lower() not in TRANSFER_HEADERS})
+        content = content_bytes(recorded['content'])
+        response = Response()
+        response.status_code = recorded['status']
+        response.reason = recorded.get('statusText', '')
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response.raw = PacedStream(content, receive)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=wait)
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        pass
@@ -0,0 +1,49 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from .Cancellation import CancelToken
+from .Progress import Progress
+
+
+class RenderedRequest(namedtuple('RenderedRequest', ['method', 'url', 'headers', 'data', 'max_size'], defaults=[None])):
+    """ A resource with all of its variables filled in. Hashable, so it can key caches.
+        max_size is the resource's response size limit, None for the global one
+    """
+
+    @classmethod
+    def create(cls, method, url, headers, data, max_size=None):
+        return cls(method, url, tuple(sorted(headers.items())), data, max_size)
+
+    @property
+    def header_dict(self):
+        return dict(self.headers)
+
+
+class RequestRun():
+    """ State shared by the steps of one Request execution.\n
+        Steps that render to the same request share a single fetch: the first one
+        performs it, the others wait on its result instead of fetching again.
+        Cancelling the run's token stops both the fetch and the waiting.
+    """
+
+    def __init__(self, progress=None):
+        self.cancel = CancelToken()
+        self.progress = progress or Progress()
+        self.__lock = threading.Lock()
+        # RenderedRequest -> Future
+        self.__fetches = {}
+
+    def fetch(self, rendered, fetch):
+        self.cancel.check()
+        with self.__lock:
+            future = self.__fetches.get(rendered)
+            owner = future is None
+            if owner:
+                future = self.__fetches[rendered] = Future()
+        if owner:
+            try:
+                future.set_result(fetch(rendered))
+            except BaseException as e:
+                future.set_exception(e)
+        return self.cancel.result(future)
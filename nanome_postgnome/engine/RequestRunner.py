@@ -0,0 +1,414 @@
+import re
+import os
+import time
+import json
+import tempfile
+import traceback
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from nanome.util import Logs
+from nanome.util.enums import NotificationTypes
+
+from .Cancellation import RequestCancelled
+from .Pagination import paginate
+from .Prefetcher import Prefetcher
+from .Progress import format_size
+from .RateLimiter import rate_limits
+from .Recording import Recorder, RecordingAdapter, ReplayAdapter
+from .RequestRun import RenderedRequest
+from .ResponseBody import ACCEPT_ENCODING, MAX_OUTPUT_SIZE, is_text_type, read_response
+from .Scheduler import BACKGROUND, INTERACTIVE, scheduler
+from .TokenCache import tokens
+from .Upload import UploadBody
+from ..formats.Writers import frame_atoms
+
+MAX_RETRIES = 3
+# only requests that are safe to repeat are retried
+RETRY_METHODS = ['get', 'head']
+FAN_OUT_CONCURRENCY = 4
+
+
+class RequestRunner():
+    """ Runs the Requests of a Settings, independently of any menu or plugin.\n
+        Everything that involves the user goes through callbacks:
+        notify(notification_type, message) for notifications (logged by default),
+        importer(name, import_type, contents, metadata, body, cancel, progress, repeat)
+        for the structures of import steps (skipped without one), and
+        structures(source, cancel) returning the complexes of 'workspace' or 'selection'
+        for resources that upload structures (which fail without one).
+        owner is the session the runner's fetches are scheduled for, at priority.
+    """
+
+    def __init__(self, settings, owner=None, priority=INTERACTIVE, notify=None, importer=None, structures=None):
+        self.settings = settings
+        self.owner = owner if owner is not None else self
+        self.priority = priority
+        self.notify = notify or self.log_notification
+        self.importer = importer
+        self.structures = structures
+        self.session = requests.Session()
+        # advertise every content encoding urllib3 can decode here (br and zstd when installed)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        self.proxies = {
+            'no': 'pass'
+        }
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.prefetcher = Prefetcher(self.session, self.fetch_shared, proxies=self.proxies, owner=self.owner)
+        self.recorder = None
+        self.setup_transport()
+        self.host = os.environ.get("HOSTNAME", None)
+
+    @staticmethod
+    def log_notification(notification_type, message):
+        if notification_type == NotificationTypes.error:
+            Logs.error(message)
+        else:
+            Logs.message(message)
+
+    def setup_transport(self):
+        """ POSTGNOME_REPLAY=<archive.har> answers every request from a recorded archive,
+            with recorded latencies scaled by POSTGNOME_REPLAY_LATENCY (default 1, 0 for none).
+            POSTGNOME_RECORD=<directory> records the exchanges of each Load to a .har file there.
+        """
+        replay_path = os.environ.get('POSTGNOME_REPLAY')
+        record_dir = os.environ.get('POSTGNOME_RECORD')
+        if replay_path:
+            latency_scale = float(os.environ.get('POSTGNOME_REPLAY_LATENCY', 1))
+            adapter = ReplayAdapter.from_file(replay_path, latency_scale)
+            Logs.message(f'replaying requests from {replay_path}')
+        elif record_dir:
+            self.recorder = Recorder(record_dir)
+            adapter = RecordingAdapter(self.recorder)
+        else:
+            return
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def is_determined(self, resource, contexts, produced=()):
+        """ Whether every variable the resource uses has a value in contexts,
+            none of them being one of the variable uids in produced
+        """
+        unresolved = []
+        def missing(var):
+            unresolved.append(var)
+            return ''
+        def found(var, value):
+            if var in produced:
+                unresolved.append(var)
+        strings = [resource['url'], resource['data']]
+        strings += [string for header in resource['headers'].values() for string in header]
+        for string in strings:
+            self.settings.contextualize(string, contexts, defaults_generator=missing, reporter=found)
+            if unresolved:
+                return False
+        return True
+
+    def contextualize(self, variable, contexts, left_wrapper="", right_wrapper=""):
+        cvar = self.settings.contextualize(variable, contexts, add_to_context=True, default_value="", left_wrapper=left_wrapper, right_wrapper=right_wrapper)
+        return cvar
+
+    def convert_to_json_string(self, response_text, response_type):
+        if 'json' in response_type:
+            coerced_response = '{"root": '+ response_text + '}'
+        elif 'xml' in response_type:
+            import xmltodict
+            coerced_response = json.dumps(xmltodict.parse(response_text))
+        elif 'text' in response_type:
+            try:
+                coerced_response = json.dumps({'root': json.loads(response_text)})
+            except ValueError:
+                coerced_response = json.dumps({'root': response_text})
+        else:
+            # binary payloads are kept on the response body for importing
+            coerced_response = '{"root": null}'
+        return coerced_response
+
+    def render_request(self, resource, contexts, data=None):
+        load_url = self.contextualize(variable=resource['url'], contexts=contexts)
+        if self.host: load_url = load_url.replace('localhost', self.host)
+        method = resource['method'].lower()
+        headers = dict(resource['headers'].values())
+        headers = {self.contextualize(name, contexts):self.contextualize(value, contexts) for name,value in headers.items()}
+        data = self.contextualize(data or resource['data'], contexts=contexts)
+        if method == 'post':
+            headers.update({'Content-Length': str(len(data))})
+            if 'Content-Type' not in headers:
+                headers['Content-Type'] = 'text/plain'
+        elif headers.get('Content-Length'):
+            del headers['Content-Length']
+        return RenderedRequest.create(method, load_url, headers, data, resource.get('max size'))
+
+    def get_response(self, resource, contexts, data=None, run=None):
+        """ Responsible for getting a response from a resource.
+            As this method calls settings.set_output,
+            It gives a response decontextualized from the resource's inputs
+            and will update the resource's output variables in the process.
+        """
+        response, _ = self.get_output(resource, contexts, data, run)
+        return response
+
+    def get_output(self, resource, contexts, data=None, run=None):
+        """ get_response, also returning the values of the resource's output variables by uid.
+            They are read from the full response, the stored output may only be a preview of it.
+            Returns (None, None) if the request failed
+        """
+        try:
+            response = self.fetch_resource(resource, contexts, data, run)
+            values = self.settings.set_output(resource, response.text, dict(response.headers))
+        except RequestCancelled:
+            raise
+        except:
+            exception = self.get_exception("An error occured while making the request")
+            Logs.debug(traceback.format_exc())
+            self.notify(NotificationTypes.error, f"{exception}")
+            return None, None
+
+        return response, values
+
+    def fetch_resource(self, resource, contexts, data=None, run=None):
+        """ Fetches a resource rendered with contexts, leaving its output untouched.
+            Steps of the same run that render to the same request share one fetch,
+            and responses of credential providers are reused until they expire.
+            Paginated resources are fetched page by page into one merged response.
+            Uploads send workspace structures, so they are never shared or reused.
+        """
+        rendered = self.render_request(resource, contexts, data)
+        cancel = run.cancel if run else None
+        progress = run.progress.transfer if run else None
+        if resource.get('upload') and rendered.method == 'post':
+            upload = self.upload_body(resource['upload'], rendered, cancel, progress)
+            Logs.debug(f"upload url: {rendered.url}")
+            return scheduler.run(self.priority, self.owner, self.fetch_now, rendered, cancel, progress, upload, cancel=cancel)
+        fetch = partial(self.fetch, cancel=cancel, progress=progress)
+        fetch_now = partial(self.fetch_now, cancel=cancel, progress=progress)
+        if run:
+            fetch = partial(run.fetch, fetch=fetch)
+            fetch_now = partial(run.fetch, fetch=fetch_now)
+        Logs.debug(f"load url: {rendered.url}")
+        if self.recorder:
+            # bypass the shared caches so every exchange goes through this session's transport
+            fetch = fetch_now
+        elif resource.get('credential provider'):
+            refresh = partial(self.fetch_shared, priority=BACKGROUND)
+            return tokens.get(rendered, fetch, refresh, resource.get('credential ttl'))
+        if resource.get('pagination') and rendered.method == 'get':
+            return paginate(resource['pagination'], rendered, fetch)
+        return fetch(rendered)
+
+    def fetch(self, rendered, cancel=None, progress=None):
+        """ Fetches a rendered request, using its prefetched response if the prefetch has started. """
+        prefetched = self.prefetcher.take(rendered)
+        if prefetched is not None:
+            try:
+                return cancel.result(prefetched) if cancel else prefetched.result()
+            except RequestCancelled:
+                raise
+            except Exception:
+                Logs.debug(f'prefetch of {rendered.url} failed, fetching again')
+        return self.fetch_shared(rendered, cancel=cancel, progress=progress)
+
+    def fetch_shared(self, rendered, priority=None, cancel=None, progress=None):
+        """ Runs the fetch on the process scheduler, at the priority of the work that needs it
+            (the runner's own by default).
+        """
+        priority = self.priority if priority is None else priority
+        return scheduler.run(priority, self.owner, self.fetch_now, rendered, cancel, progress, cancel=cancel)
+
+    def upload_body(self, policy, rendered, cancel=None, progress=None):
+        if not self.structures:
+            raise ValueError('uploads need a workspace to take structures from')
+        complexes = self.structures(policy['source'], cancel)
+        if policy['source'] == 'selection':
+            complexes = [complex for complex in complexes if any(True for _ in frame_atoms(complex, selected_only=True))]
+        if not complexes:
+            raise ValueError(f"no structures to upload from the {policy['source']}")
+        # the data template becomes the other fields of a multipart form
+        fields = json.loads(rendered.data) if policy['field'] and rendered.data.strip() else {}
+        return UploadBody(policy, complexes, fields, cancel, progress)
+
+    def fetch_now(self, rendered, cancel=None, progress=None, upload=None):
+        """ Streams the response within the budget of its host. GET requests are retried
+            after the host's Retry-After when it answers 429 or 503. Negotiated content encodings (gzip, br, zstd)
+            are decoded on the fly, binary and .gz payloads are kept on disk as response.body.
+            Cancelling closes the response, aborting the transfer.
+        """
+        limiter = rate_limits.for_url(rendered.url)
+        retries = MAX_RETRIES if rendered.method in RETRY_METHODS and not upload else 0
+        for attempt in range(retries + 1):
+            with limiter:
+                if cancel:
+                    cancel.check()
+                response = self.send(rendered, upload)
+                remove = cancel.on_cancel(response.close) if cancel else None
+                try:
+                    delay = limiter.feedback(response.status_code, response.headers)
+                    if delay is None or attempt == retries:
+                        # the transfer counts against the host's concurrency until it is read
+                        return self.read(response, cancel, progress, rendered.max_size)
+                except Exception:
+                    if cancel and cancel.cancelled:
+                        raise RequestCancelled() from None
+                    raise
+                finally:
+                    if remove:
+                        remove()
+            response.close()
+            Logs.debug(f'retrying {rendered.url} in {delay:.1f}s')
+            if cancel:
+                cancel.sleep(delay)
+            else:
+                time.sleep(delay)
+
+    def send(self, rendered, upload=None):
+        if upload:
+            # a generator body goes out with chunked transfer encoding
+            return self.session.post(rendered.url, data=upload.chunks(), headers=upload.headers(rendered.header_dict), proxies=self.proxies, verify=False, stream=True)
+        if rendered.method == 'get':
+            return self.session.get(rendered.url, headers=rendered.header_dict, proxies=self.proxies, verify=False, stream=True)
+        elif rendered.method == 'post':
+            return self.session.post(rendered.url, data=json.loads(rendered.data), proxies=self.proxies, verify=False, stream=True)
+
+    def read(self, response, cancel=None, progress=None, max_size=None):
+        response_type = response.headers.get('Content-Type', 'text/plain')
+        content, response.body = read_response(response, self.tempdir.name, cancel, progress, max_size)
+        # the text as received, for importing. response.text becomes the JSON outputs are read from
+        response.raw_text = None
+        if content is not None:
+            response._content = content
+            text = response.raw_text = response.text
+        elif is_text_type(response_type):
+            text = response.body.text(MAX_OUTPUT_SIZE)
+            if text is None:
+                # kept on disk for importing, converting it would hold several copies in memory
+                Logs.warning(f'{response.url} is over {format_size(MAX_OUTPUT_SIZE)} decompressed, too large for output variables')
+                text, response_type = '', ''
+        else:
+            text = ''
+        json_text = self.convert_to_json_string(text, response_type)
+        response._content = bytes(json_text, 'utf-8')
+        response.encoding = 'utf-8'
+        return response
+
+    def run_steps(self, request, run, fields):
+        """ Runs the steps of a request with fields as its input values, importing the
+            structures of steps that have an import type through the importer.
+            Returns the results of the steps by step name, or None if a step failed
+        """
+        results = {}
+        imported = False
+        steps = request['steps']
+        for i, step in enumerate(steps):
+            run.cancel.check()
+            run.progress.step(i+1, len(steps), f"fetching {step['name']}")
+            resource = self.settings.get_resource(step['resource'])
+            import_type = resource['import type']
+            metadata = step['metadata_source']
+            data = resource['data'].replace("\'", "\"")
+            # override data if necessary
+            data_override_field_name = f"{request['name']} {step['name']} data"
+            if step['override_data']:
+                data = fields[data_override_field_name]
+
+            contexts = [fields, results, self.settings.variables]
+            if step.get('fan out'):
+                values = self.fan_out(step, resource, contexts, data, run)
+                results[f'step{i+1}'] = json.dumps(values)
+                continue
+            response, values = self.get_output(resource, contexts, data, run)
+            if not response:
+                self.notify(NotificationTypes.error, f"Step {i} failed. Aborting {request['name']}")
+                run.progress.message(f'Step {i+1} failed')
+                return None
+            var_uid = next(iter(resource['output variables']), None)
+            var_value = values.get(var_uid)
+            results[f'step{i+1}'] = json.dumps(var_value) or response.text
+            Logs.debug(f'setting step{i+1} to {var_value} ({self.settings.get_variable_name(var_uid)})')
+            if import_type and self.importer:
+                import_name = self.contextualize(variable=resource['import name'], contexts=contexts)
+                contents, body = self.import_contents(response, var_value)
+                self.importer(import_name, import_type, contents, metadata, body, run.cancel, run.progress, resource.get('repeat load', 'focus'))
+                imported = True
+        if not imported:
+            run.progress.message('Done')
+        return {step['name']: results[f'step{i+1}'] for i, step in enumerate(steps)}
+
+    def import_contents(self, response, var_value):
+        """ What a step imports, as (contents, body): the value of its first output variable
+            if it has one, and otherwise the response as received, in memory or on disk
+        """
+        if var_value:
+            return var_value, None
+        return response.raw_text, response.body
+
+    def fan_out(self, step, resource, contexts, data, run):
+        """ Runs a step's resource once per element of its list variable, FAN_OUT_CONCURRENCY
+            at a time, each run seeing the element as the step's item variable. Every run's
+            structure is imported, and the resource's output variables are set to the lists
+            of the runs' values, as JSON. Returns the list of values of its first output variable.
+        """
+        source_uid, item_uid = step['fan out']
+        items = self.settings.get_variable_by_id(source_uid)
+        if isinstance(items, str):
+            try:
+                items = json.loads(items)
+            except ValueError:
+                pass
+        if not isinstance(items, list):
+            raise ValueError(f"{self.settings.get_variable_name(source_uid)} is not a list")
+
+        lock = threading.Lock()
+        outputs = [None] * len(items)
+        failed = []
+        def run_item(index, item):
+            run.cancel.check()
+            item_contexts = [{item_uid: item if isinstance(item, str) else json.dumps(item)}] + contexts
+            try:
+                response = self.fetch_resource(resource, item_contexts, data, run)
+                outputs[index] = (response, self.settings.read_output(resource, response.text))
+                if resource['import type'] and self.importer:
+                    var_value = outputs[index][1].get(next(iter(resource['output variables']), None))
+                    import_name = self.contextualize(variable=resource['import name'], contexts=item_contexts)
+                    contents, body = self.import_contents(response, var_value)
+                    self.importer(import_name, resource['import type'], contents, step['metadata_source'], body, run.cancel, repeat=resource.get('repeat load', 'focus'))
+            except RequestCancelled:
+                raise
+            except Exception:
+                Logs.debug(traceback.format_exc())
+                failed.append(index)
+            with lock:
+                done = sum(1 for output in outputs if output) + len(failed)
+            run.progress.stage(f"fetching {step['name']} ({done} of {len(items)})")
+
+        with ThreadPoolExecutor(max_workers=FAN_OUT_CONCURRENCY) as executor:
+            futures = [executor.submit(run_item, i, item) for i, item in enumerate(items)]
+            try:
+                for future in futures:
+                    run.cancel.result(future)
+            except RequestCancelled:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        if failed:
+            self.notify(NotificationTypes.error, f"{len(failed)} of {len(items)} runs of {step['name']} failed")
+        completed = [output for output in outputs if output]
+        if completed:
+            response = completed[-1][0]
+            self.settings.set_output(resource, response.text, dict(response.headers))
+        for uid in resource['output variables']:
+            # stored as JSON, like any other value fields and requests substitute
+            self.settings.set_variable(uid, None, json.dumps([values.get(uid) for _, values in completed]))
+        first_uid = next(iter(resource['output variables']), None)
+        return [values.get(first_uid) for _, values in completed]
+
+    def get_exception(self, default_error, pattern=".*?([\w ]*Error:[\w ]*)"):
+        exc = traceback.format_exc()
+        Logs.debug(exc)
+        exc_lines = re.findall(pattern, exc, re.MULTILINE)
+        if not len(exc_lines) or len(exc_lines[0]) < 15:
+            return default_error
+        else:
+            return exc_lines[0]
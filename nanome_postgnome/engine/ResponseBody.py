@@ -0,0 +1,206 @@
+import io
+import os
+import mmap
+import gzip
+import hashlib
+import shutil
+import weakref
+import tempfile
+from itertools import chain
+from functools import partial
+from contextlib import contextmanager
+
+from .Progress import format_size
+
+GZIP_MAGIC = b'\x1f\x8b'
+TEXT_TYPES = ['json', 'xml', 'text']
+CHUNK_SIZE = 64 * 1024
+# text bodies over this size are spilled to disk instead of being held in memory
+MEMORY_LIMIT = int(os.environ.get('POSTGNOME_MEMORY_LIMIT', 8 * 1024 * 1024))
+# largest body read from any response, resources can set their own 'max size'
+MAX_BODY_SIZE = int(os.environ.get('POSTGNOME_MAX_BODY_SIZE', 1024 * 1024 * 1024))
+# largest text body converted to JSON for output variables, larger ones are only imported
+MAX_OUTPUT_SIZE = int(os.environ.get('POSTGNOME_MAX_OUTPUT_SIZE', 16 * 1024 * 1024))
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:
+    ACCEPT_ENCODING = 'gzip,deflate'
+
+
+def is_text_type(content_type):
+    return any(text_type in content_type for text_type in TEXT_TYPES)
+
+
+class ResponseSizeError(Exception):
+    pass
+
+
+class ResponseBody():
+    """ A response payload kept on disk.\n
+        gzip payloads (.gz downloads) stay compressed at rest and are decompressed
+        while being read, so parsers stream straight out of the compressed file.
+        The file is removed once the body is garbage collected.
+    """
+
+    def __init__(self, path, compressed):
+        self.path = path
+        self.compressed = compressed
+        self.size = os.path.getsize(path)
+        weakref.finalize(self, ResponseBody.remove, path)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @classmethod
+    def write(cls, directory, chunks):
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.body')
+        compressed = None
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in chunks:
+                    if compressed is None and chunk:
+                        compressed = chunk[:2] == GZIP_MAGIC
+                    file.write(chunk)
+        except BaseException:
+            # interrupted downloads (e.g. cancelled) don't leave partial files behind
+            cls.remove(path)
+            raise
+        return cls(path, bool(compressed))
+
+    @classmethod
+    def from_text(cls, text, directory):
+        return cls.write(directory, [text.encode('utf-8')])
+
+    def open(self):
+        return gzip.open(self.path, 'rb') if self.compressed else open(self.path, 'rb')
+
+    def open_text(self):
+        return io.TextIOWrapper(self.open(), encoding='utf-8', errors='replace')
+
+    @contextmanager
+    def view(self):
+        """ A read-only memory map of an uncompressed body, paged in as it is read """
+        if self.compressed:
+            raise ValueError('compressed bodies can not be mapped')
+        if not self.size:
+            # empty files can't be mapped
+            yield b''
+            return
+        with open(self.path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+    def text(self, limit=None):
+        """ The payload as text, or None if it is over limit bytes once decompressed.
+            Compressed bodies are decompressed no further than the limit
+        """
+        if self.compressed:
+            with self.open() as file:
+                data = file.read() if limit is None else file.read(limit + 1)
+            if limit is not None and len(data) > limit:
+                return None
+            return str(data, 'utf-8', 'replace')
+        if limit is not None and self.size > limit:
+            return None
+        # decoded straight out of the mapping, without reading the file into a buffer first
+        with self.view() as view:
+            return str(view, 'utf-8', 'replace')
+
+    def digest(self):
+        """ sha256 of the decompressed payload, so equal payloads hash alike however they arrived """
+        sha = hashlib.sha256()
+        if self.compressed:
+            with self.open() as file:
+                for chunk in iter(partial(file.read, CHUNK_SIZE), b''):
+                    sha.update(chunk)
+        else:
+            with self.view() as view:
+                sha.update(view)
+        return sha.hexdigest()
+
+    def preview(self, size):
+        """ The first size bytes of the payload as text """
+        if self.compressed:
+            with self.open() as file:
+                head = file.read(size)
+        else:
+            with self.view() as view:
+                head = view[:size]
+        return str(head, 'utf-8', 'ignore')
+
+    def save_as(self, path):
+        """ Writes the decompressed payload to path, for loaders that need a named file """
+        with self.open() as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        return path
+
+
+def content_length(response):
+    try:
+        return int(response.headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+def report_progress(response, chunks, progress):
+    total = content_length(response)
+    # Content-Length counts encoded bytes, so count what came off the wire when possible
+    tell = getattr(response.raw, 'tell', None)
+    received = 0
+    for chunk in chunks:
+        received += len(chunk)
+        progress(tell() if tell else received, total)
+        yield chunk
+
+
+def limit_size(chunks, max_size):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_size:
+            raise ResponseSizeError(f'response over the size limit of {format_size(max_size)}')
+        yield chunk
+
+
+def read_response(response, directory, cancel=None, progress=None, max_size=None):
+    """ Streams a response body, decoding any negotiated Content-Encoding on the way.\n
+        Uncompressed text stays in memory and is returned as bytes, unless it grows past
+        MEMORY_LIMIT. Anything else (binary types, gzip payloads and large text)
+        is streamed to a ResponseBody on disk.
+        Bodies over max_size (MAX_BODY_SIZE by default) raise ResponseSizeError, before
+        the download when Content-Length announces it and otherwise once it is reached.
+        A cancel token is checked between chunks, and progress(received, total)
+        is called with the bytes received so far against Content-Length.
+        Returns (content, body), one of which is None.
+    """
+    max_size = max_size or MAX_BODY_SIZE
+    try:
+        length = content_length(response)
+        if length is not None and length > max_size:
+            raise ResponseSizeError(f'response of {format_size(length)} over the size limit of {format_size(max_size)}')
+        chunks = response.iter_content(CHUNK_SIZE)
+        if cancel:
+            chunks = cancel.iterate(chunks)
+        if progress:
+            chunks = report_progress(response, chunks, progress)
+        chunks = limit_size(chunks, max_size)
+        first = next(chunks, b'')
+        content_type = response.headers.get('Content-Type', 'text/plain')
+        if first[:2] != GZIP_MAGIC and is_text_type(content_type):
+            buffered, size = [first], len(first)
+            for chunk in chunks:
+                buffered.append(chunk)
+                size += len(chunk)
+                if size > MEMORY_LIMIT:
+                    # too large to hold, what was read so far goes to disk with the rest
+                    return None, ResponseBody.write(directory, chain(buffered, chunks))
+            return b''.join(buffered), None
+        return None, ResponseBody.write(directory, chain([first], chunks))
+    except BaseException:
+        # release the connection of an abandoned transfer
+        response.close()
+        raise
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# priority classes, most urgent first
+INTERACTIVE = 0
+BATCH = 1
+SPECULATIVE = 2
+BACKGROUND = 3
+PRIORITIES = [INTERACTIVE, BATCH, SPECULATIVE, BACKGROUND]
+
+
+class Scheduler():
+    """ Runs the fetch work of a process on one pool of workers.\n
+        Queued work is taken by priority class, interactive first, so a Load overtakes
+        pending batch, speculative and background work. Within a class, owners (the
+        session, or each run of a headless batch) take turns one task at a time.
+        Some workers are reserved for interactive work so that it can start even when
+        every other worker is busy.
+    """
+
+    def __init__(self, workers=8, reserved=2):
+        self.workers = workers
+        self.reserved = reserved
+        self.__condition = threading.Condition()
+        # priority -> OrderedDict(owner -> deque of tasks), in turn order
+        self.__queues = [OrderedDict() for _ in PRIORITIES]
+        self.__running = [0 for _ in PRIORITIES]
+        self.__threads = []
+        self.__idle = 0
+        self.__local = threading.local()
+
+    def submit(self, priority, session, fn, *args, **kwargs):
+        """ Queues fn(*args, **kwargs) for the owner session, returning its Future """
+        future = Future()
+        with self.__condition:
+            self.__queues[priority].setdefault(session, deque()).append((future, fn, args, kwargs))
+            if self.__idle == 0 and len(self.__threads) < self.workers:
+                thread = threading.Thread(target=self.__work, name=f'scheduler-{len(self.__threads)}', daemon=True)
+                self.__threads.append(thread)
+                thread.start()
+            self.__condition.notify_all()
+        return future
+
+    def run(self, priority, session, fn, *args, cancel=None, **kwargs):
+        """ Runs fn through the scheduler and waits for its result.\n
+            Work started from a scheduler worker runs inline, at the priority of that
+            worker's task, instead of waiting for another worker.
+            A cancel token stops the wait, and drops the work if it hasn't started.
+        """
+        if getattr(self.__local, 'worker', False):
+            return fn(*args, **kwargs)
+        future = self.submit(priority, session, fn, *args, **kwargs)
+        return cancel.result(future) if cancel else future.result()
+
+    def cancel(self, session, priorities=PRIORITIES):
+        """ Cancels the queued (not yet running) work of a session """
+        with self.__condition:
+            tasks = []
+            for priority in priorities:
+                tasks += self.__queues[priority].pop(session, [])
+        for future, *_ in tasks:
+            future.cancel()
+        return len(tasks)
+
+    def pending(self):
+        with self.__condition:
+            return [sum(len(tasks) for tasks in queue.values()) for queue in self.__queues]
+
+    def __next(self):
+        deferrable_running = sum(self.__running[INTERACTIVE+1:])
+        for priority, queue in enumerate(self.__queues):
+            if not queue:
+                continue
+            if priority != INTERACTIVE and deferrable_running >= self.workers - self.reserved:
+                return None
+            session, tasks = next(iter(queue.items()))
+            task = tasks.popleft()
+            if tasks:
+                # the session goes to the back of its class
+                queue.move_to_end(session)
+            else:
+                del queue[session]
+            return priority, task
+        return None
+
+    def __work(self):
+        self.__local.worker = True
+        while True:
+            with self.__condition:
+                item = self.__next()
+                while item is None:
+                    self.__idle += 1
+                    self.__condition.wait()
+                    self.__idle -= 1
+                    item = self.__next()
+                priority, (future, fn, args, kwargs) = item
+                self.__running[priority] += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.__condition:
+                    self.__running[priority] -= 1
+                    self.__condition.notify_all()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,152 @@
+import re
+import json
+import math
+import time
+import base64
+import threading
+
+from nanome.util import Logs
+
+JWT_PATTERN = re.compile(r'^[\w-]+\.([\w-]+)\.[\w-]*$')
+
+
+def find_values(obj, key):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k == key:
+                yield v
+            yield from find_values(v, key)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from find_values(v, key)
+
+
+def find_strings(obj):
+    if isinstance(obj, str):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from find_strings(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from find_strings(v)
+
+
+def jwt_expiry(token):
+    match = JWT_PATTERN.match(token)
+    if not match:
+        return None
+    payload = match.group(1)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except Exception:
+        return None
+
+
+def token_ttl(response_text, now=None):
+    """ Seconds a credential response stays valid for, from expires_in or a JWT exp claim """
+    now = now or time.time()
+    try:
+        obj = json.loads(response_text)
+    except (TypeError, ValueError):
+        return None
+    for expires_in in find_values(obj, 'expires_in'):
+        try:
+            return float(expires_in)
+        except (TypeError, ValueError):
+            continue
+    for string in find_strings(obj):
+        exp = jwt_expiry(string)
+        if exp is not None:
+            return exp - now
+    return None
+
+
+class CachedToken():
+    __slots__ = ('response', 'expiry', 'used', 'timer')
+
+    def __init__(self, response, expiry):
+        self.response = response
+        self.expiry = expiry
+        self.used = False
+        self.timer = None
+
+
+class TokenCache():
+    """ Caches the responses of credential provider resources until they expire.\n
+        Tokens that were used are refreshed in the background shortly before expiry,
+        unused ones are dropped. A cache miss goes through the caller's fetch.
+    """
+
+    def __init__(self, refresh_margin=0.1, min_margin=5):
+        self.refresh_margin = refresh_margin
+        self.min_margin = min_margin
+        self.__lock = threading.Lock()
+        # RenderedRequest -> CachedToken
+        self.__tokens = {}
+
+    def get(self, rendered, fetch, refresh, ttl=None):
+        """ Returns the cached response for rendered, fetching it if missing or expired.\n
+            fetch   -- used on a cache miss, within the current run\n
+            refresh -- used for background refreshes, outside of any run\n
+            ttl     -- seconds to keep the token for, read from the response if not set
+        """
+        with self.__lock:
+            token = self.__tokens.get(rendered)
+            if token and token.expiry > time.time():
+                token.used = True
+                return token.response
+        response = fetch(rendered)
+        self.__store(rendered, response, refresh, ttl)
+        return response
+
+    def invalidate(self, rendered):
+        with self.__lock:
+            token = self.__tokens.pop(rendered, None)
+        if token and token.timer:
+            token.timer.cancel()
+
+    def clear(self):
+        with self.__lock:
+            tokens, self.__tokens = self.__tokens, {}
+        for token in tokens.values():
+            if token.timer:
+                token.timer.cancel()
+
+    def __store(self, rendered, response, refresh, manual_ttl):
+        if not response.ok:
+            # a failed login is retried on the next use, whatever the ttl
+            Logs.debug(f'credentials from {rendered.url} answered {response.status_code}, not caching')
+            return
+        ttl = manual_ttl or token_ttl(response.text)
+        if not ttl or not math.isfinite(ttl) or ttl <= 0:
+            Logs.debug(f'no expiry found for credentials from {rendered.url}, not caching')
+            return
+        token = CachedToken(response, time.time() + ttl)
+        margin = max(ttl * self.refresh_margin, self.min_margin)
+        if ttl > margin:
+            token.timer = threading.Timer(ttl - margin, self.__refresh, [rendered, token, refresh, manual_ttl])
+            token.timer.daemon = True
+        with self.__lock:
+            old = self.__tokens.get(rendered)
+            self.__tokens[rendered] = token
+        if old and old.timer:
+            old.timer.cancel()
+        if token.timer:
+            token.timer.start()
+
+    def __refresh(self, rendered, token, refresh, manual_ttl):
+        with self.__lock:
+            if self.__tokens.get(rendered) is not token:
+                return
+            if not token.used:
+                del self.__tokens[rendered]
+                return
+        try:
+            self.__store(rendered, refresh(rendered), refresh, manual_ttl)
+        except Exception:
+            Logs.debug(f'background refresh of {rendered.url} failed, token will expire')
+
+
+tokens = TokenCache()
@@ -0,0 +1,119 @@
+import re
+import json
+import uuid
+import zlib
+
+from ..formats.Writers import WRITERS
+
+# upload format -> content type
+UPLOAD_FORMATS = {'pdb': 'chemical/x-pdb', 'sdf': 'chemical/x-mdl-sdfile', 'cif': 'chemical/x-mmcif'}
+UPLOAD_SOURCES = ['workspace', 'selection']
+
+
+def parse_upload(spec):
+    """ Reads an upload policy from 'format [source] [gzip] [multipart[=field]]', e.g.\n
+        pdb selection\n
+        sdf workspace gzip\n
+        cif selection multipart=receptor
+    """
+    tokens = spec.split()
+    if not tokens:
+        return None
+    if tokens[0] not in UPLOAD_FORMATS:
+        raise ValueError(f'upload format must be one of {", ".join(UPLOAD_FORMATS)}')
+    policy = {'format': tokens[0], 'source': 'workspace', 'gzip': False, 'field': None}
+    for token in tokens[1:]:
+        key, _, value = token.partition('=')
+        if token in UPLOAD_SOURCES:
+            policy['source'] = token
+        elif token == 'gzip':
+            policy['gzip'] = True
+        elif key == 'multipart':
+            policy['field'] = value or 'file'
+        else:
+            raise ValueError(f'unknown upload option {token}')
+    return policy
+
+
+def format_upload(policy):
+    if not policy:
+        return ''
+    tokens = [policy['format'], policy['source']]
+    if policy['gzip']:
+        tokens.append('gzip')
+    if policy['field']:
+        tokens.append(f"multipart={policy['field']}")
+    return ' '.join(tokens)
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def count_sent(chunks, progress):
+    sent = 0
+    for chunk in chunks:
+        yield chunk
+        sent += len(chunk)
+        progress(sent, None)
+
+
+class UploadBody():
+    """ A request body serializing complexes while it is sent.\n
+        The complexes are written in the policy's format a chunk at a time, without
+        the whole file ever being held in memory, and sent with chunked transfer encoding.
+        gzip compresses them on the fly. With a multipart field they are sent as the
+        file part of a form, after the form fields.
+        The body is a generator that can only be sent once, which is why uploads are never retried.
+    """
+
+    def __init__(self, policy, complexes, fields=None, cancel=None, progress=None):
+        self.policy = policy
+        self.complexes = complexes
+        self.fields = fields or {}
+        self.cancel = cancel
+        self.progress = progress
+        self.boundary = uuid.uuid4().hex
+        name = complexes[0].name if complexes and complexes[0].name else 'structure'
+        self.filename = re.sub(r'[^\w.-]+', '_', name) + '.' + policy['format'] + ('.gz' if policy['gzip'] else '')
+
+    def headers(self, headers):
+        headers = {name: value for name, value in headers.items() if name.lower() != 'content-length'}
+        if self.policy['field']:
+            headers = {name: value for name, value in headers.items() if name.lower() != 'content-type'}
+            headers['Content-Type'] = f'multipart/form-data; boundary={self.boundary}'
+            return headers
+        # text/plain is what resources are sent as by default, not a choice to keep
+        if headers.get('Content-Type', 'text/plain') == 'text/plain':
+            headers['Content-Type'] = UPLOAD_FORMATS[self.policy['format']]
+        if self.policy['gzip']:
+            headers['Content-Encoding'] = 'gzip'
+        return headers
+
+    def chunks(self):
+        write = WRITERS[self.policy['format']]
+        chunks = (text.encode('utf-8') for text in write(self.complexes, self.policy['source'] == 'selection'))
+        if self.policy['gzip']:
+            chunks = gzip_chunks(chunks)
+        if self.policy['field']:
+            chunks = self.multipart(chunks)
+        if self.cancel:
+            chunks = self.cancel.iterate(chunks)
+        if self.progress:
+            chunks = count_sent(chunks, self.progress)
+        return chunks
+
+    def multipart(self, file_chunks):
+        for name, value in self.fields.items():
+            value = value if isinstance(value, str) else json.dumps(value)
+            yield f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+        content_type = 'application/gzip' if self.policy['gzip'] else UPLOAD_FORMATS[self.policy['format']]
+        yield (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{self.policy["field"]}"; filename="{self.filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+        yield from file_chunks
+        yield f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
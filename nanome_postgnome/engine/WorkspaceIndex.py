@@ -0,0 +1,39 @@
+import threading
+
+# what a repeated load of a structure already in the workspace does
+REPEAT_MODES = ['focus', 'replace', 'duplicate']
+
+
+class WorkspaceIndex():
+    """ The complexes a session loaded into its workspace, by payload.\n
+        Keys are (payload digest, import type, name), so loading the same payload
+        under the same name again can reuse the complex it produced last time
+        instead of going through parsing, bonding and DSSP again.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # key -> complex index
+        self.__complexes = {}
+
+    @staticmethod
+    def key(body, import_type, name):
+        return body.digest(), import_type, name
+
+    def get(self, key):
+        with self.__lock:
+            return self.__complexes.get(key)
+
+    def add(self, key, index):
+        with self.__lock:
+            self.__complexes[key] = index
+
+    def discard(self, key):
+        with self.__lock:
+            self.__complexes.pop(key, None)
+
+    def retain(self, indexes):
+        """ Forgets the complexes that are no longer in the workspace """
+        indexes = set(indexes)
+        with self.__lock:
+            self.__complexes = {key: index for key, index in self.__complexes.items() if index in indexes}
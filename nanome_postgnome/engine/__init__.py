@@ -0,0 +1,20 @@
+""" Fetching, scheduling and caching for Requests, independently of any menu.
+
+    Nanome runs every session of a plugin in a process of its own. The module-level
+    scheduler, rate_limits, tokens and complex_cache are therefore shared by the runs of
+    one session (or of one headless batch) and never between sessions. Only the files
+    complex_cache keeps on disk are shared by every process.
+"""
+from .RequestRun import RenderedRequest, RequestRun
+from .Prefetcher import Prefetcher
+from .TokenCache import TokenCache
+from .Recording import Recorder, RecordingAdapter, ReplayAdapter
+from .RateLimiter import HostLimiter, RateLimits, UnlimitedHost
+from .Scheduler import Scheduler
+from .Cancellation import CancelToken, RequestCancelled
+from .Progress import Progress
+from .Pagination import format_policy, paginate, parse_policy
+from .WorkspaceIndex import WorkspaceIndex
+from .Upload import format_upload, parse_upload
+from .RequestRunner import RequestRunner
+from .ComplexCache import ComplexCache
@@ -0,0 +1,103 @@
+from .Columns import build_complex, delta, recursive_index, run_length, typed_array
+
+# BinaryCIF ByteArray type ids -> array codes
+BYTE_ARRAY_TYPES = {1: 'b', 2: 'h', 3: 'i', 4: 'B', 5: 'H', 6: 'I', 32: 'f', 33: 'd'}
+MASK_PRESENT = 0
+
+
+def decode(data, encodings):
+    """ Applies a BinaryCIF encoding chain in reverse """
+    for encoding in reversed(encodings):
+        kind = encoding['kind']
+        if kind == 'ByteArray':
+            data = typed_array(data, BYTE_ARRAY_TYPES[encoding['type']])
+        elif kind == 'FixedPoint':
+            factor = encoding['factor']
+            data = [value / factor for value in data]
+        elif kind == 'IntervalQuantization':
+            low, high, steps = encoding['min'], encoding['max'], encoding['numSteps']
+            step = (high - low) / (steps - 1)
+            data = [low + step * value for value in data]
+        elif kind == 'RunLength':
+            data = run_length(data)
+        elif kind == 'Delta':
+            data = delta(data, encoding['origin'])
+        elif kind == 'IntegerPacking':
+            data = unpack_integers(data, encoding['byteCount'], encoding['isUnsigned'], encoding['srcSize'])
+        elif kind == 'StringArray':
+            data = decode_strings(data, encoding)
+        else:
+            raise ValueError(f'Unsupported BinaryCIF encoding {kind}')
+    return data
+
+
+def unpack_integers(data, byte_count, unsigned, size):
+    if unsigned:
+        upper, lower = (0xFF, None) if byte_count == 1 else (0xFFFF, None)
+    else:
+        upper, lower = (0x7F, -0x80) if byte_count == 1 else (0x7FFF, -0x8000)
+    return recursive_index(data, lower, upper)[:size]
+
+
+def decode_strings(indices, encoding):
+    offsets = decode(encoding['offsets'], encoding['offsetEncoding'])
+    string_data = encoding['stringData']
+    strings = [string_data[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+    indices = decode(indices, encoding['dataEncoding'])
+    return [strings[i] if i >= 0 else '' for i in indices]
+
+
+def read_column(column):
+    values = decode(column['data']['data'], column['data']['encoding'])
+    mask = column.get('mask')
+    if mask:
+        flags = decode(mask['data'], mask['encoding'])
+        values = [value if flag == MASK_PRESENT else None for value, flag in zip(values, flags)]
+    return values
+
+
+def read_category(block, name):
+    for category in block['categories']:
+        if category['name'].lstrip('_') == name:
+            return {column['name']: column for column in category['columns']}
+    return None
+
+
+def parse(stream):
+    import msgpack
+    return msgpack.unpack(stream, raw=False)
+
+
+def complex_from_bcif(stream, name=''):
+    """ Builds a complex from the atom_site category of a BinaryCIF stream """
+    bcif = parse(stream)
+    block = bcif['dataBlocks'][0]
+    atom_site = read_category(block, 'atom_site')
+    if atom_site is None:
+        raise ValueError('BinaryCIF file has no atom_site category')
+
+    def column(*names, default=None):
+        for column_name in names:
+            if column_name in atom_site:
+                return read_column(atom_site[column_name])
+        return default
+
+    x = column('Cartn_x')
+    count = len(x)
+    columns = {
+        'model': column('pdbx_PDB_model_num', default=[1] * count),
+        'chain': column('auth_asym_id', 'label_asym_id'),
+        'residue_serial': [s if s is not None else 0 for s in column('auth_seq_id', 'label_seq_id')],
+        'ins_code': [c or '' for c in column('pdbx_PDB_ins_code', default=[''] * count)],
+        'residue_name': column('auth_comp_id', 'label_comp_id'),
+        'atom_name': column('auth_atom_id', 'label_atom_id'),
+        'element': column('type_symbol'),
+        'x': x,
+        'y': column('Cartn_y'),
+        'z': column('Cartn_z'),
+        'serial': column('id'),
+        'bfactor': [b or 0.0 for b in column('B_iso_or_equiv', default=[0.0] * count)],
+        'occupancy': [o if o is not None else 1.0 for o in column('occupancy', default=[1.0] * count)],
+        'het': [group == 'HETATM' for group in column('group_PDB', default=['ATOM'] * count)]
+    }
+    return build_complex(name or block.get('header', ''), columns)
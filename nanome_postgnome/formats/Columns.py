@@ -0,0 +1,92 @@
+import sys
+import array
+from itertools import accumulate, chain, repeat
+
+import nanome
+from nanome.util import Vector3
+
+NATIVE_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def typed_array(data, code, big_endian=False):
+    """ Reinterprets raw bytes as a typed array without copying element by element """
+    values = array.array(code)
+    values.frombytes(data)
+    if values.itemsize > 1 and big_endian != NATIVE_BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def run_length(values):
+    return list(chain.from_iterable(repeat(value, count) for value, count in zip(values[0::2], values[1::2])))
+
+
+def delta(values, origin=0):
+    return list(accumulate(values, initial=origin))[1:]
+
+
+def recursive_index(values, lower, upper):
+    """ Sums runs of values sitting at the limits of a packed integer type """
+    decoded = []
+    acc = 0
+    for value in values:
+        acc += value
+        if value != lower and value != upper:
+            decoded.append(acc)
+            acc = 0
+    return decoded
+
+
+def scale(values, divisor):
+    return [value / divisor for value in values]
+
+
+def build_complex(name, columns):
+    """ Builds a complex from per-atom columns.\n
+        Required columns: model, chain, residue_serial, residue_name, atom_name, element, x, y, z\n
+        Optional columns: ins_code, serial, bfactor, occupancy, het
+        Molecules, chains and residues start wherever their key columns change value.
+    """
+    complex = nanome.structure.Complex()
+    complex.name = name
+    count = len(columns['x'])
+    ins_codes = columns.get('ins_code') or repeat('', count)
+    serials = columns.get('serial') or range(1, count+1)
+    bfactors = columns.get('bfactor') or repeat(0.0, count)
+    occupancies = columns.get('occupancy') or repeat(1.0, count)
+    hets = columns.get('het') or repeat(False, count)
+
+    molecule = chain_ = residue = None
+    model_key = chain_key = residue_key = None
+    rows = zip(columns['model'], columns['chain'], columns['residue_serial'], ins_codes, columns['residue_name'],
+        columns['atom_name'], columns['element'], columns['x'], columns['y'], columns['z'], serials, bfactors, occupancies, hets)
+    for model, chain_name, res_serial, ins_code, res_name, atom_name, element, x, y, z, serial, bfactor, occupancy, het in rows:
+        if model != model_key:
+            model_key = model
+            chain_key = residue_key = None
+            molecule = nanome.structure.Molecule()
+            molecule.name = f'{name} {model}' if model else name
+            complex.add_molecule(molecule)
+        if chain_name != chain_key:
+            chain_key = chain_name
+            residue_key = None
+            chain_ = nanome.structure.Chain()
+            chain_.name = chain_name
+            molecule.add_chain(chain_)
+        key = (res_serial, ins_code, res_name)
+        if key != residue_key:
+            residue_key = key
+            residue = nanome.structure.Residue()
+            residue.name = res_name
+            residue.serial = res_serial
+            chain_.add_residue(residue)
+        atom = nanome.structure.Atom()
+        atom.symbol = element.capitalize() if element else atom_name[:1]
+        atom.name = atom_name
+        atom.serial = serial
+        atom.position = Vector3(x, y, z)
+        atom.bfactor = bfactor
+        atom.occupancy = occupancy
+        atom.is_het = het
+        residue.add_atom(atom)
+    return complex
@@ -0,0 +1,101 @@
+import struct
+
+from .Columns import build_complex, delta, recursive_index, run_length, scale, typed_array
+
+HEADER = struct.Struct('>iii')
+
+
+def decode(value):
+    """ Decodes an MMTF binary-encoded field, passing through plain msgpack values """
+    if not isinstance(value, (bytes, bytearray)):
+        return value
+    codec, length, param = HEADER.unpack_from(value)
+    data = value[HEADER.size:]
+    if codec == 1:
+        return typed_array(data, 'f', big_endian=True)
+    if codec == 2:
+        return typed_array(data, 'b', big_endian=True)
+    if codec == 3:
+        return typed_array(data, 'h', big_endian=True)
+    if codec == 4:
+        return typed_array(data, 'i', big_endian=True)
+    if codec == 5:
+        return [data[i:i+param].rstrip(b'\x00').decode('ascii') for i in range(0, length * param, param)]
+    if codec == 6:
+        return [chr(c) if c else '' for c in run_length(typed_array(data, 'i', big_endian=True))]
+    if codec == 7:
+        return run_length(typed_array(data, 'i', big_endian=True))
+    if codec == 8:
+        return delta(run_length(typed_array(data, 'i', big_endian=True)))
+    if codec == 9:
+        return scale(run_length(typed_array(data, 'i', big_endian=True)), param)
+    if codec == 10:
+        return scale(delta(recursive_index(typed_array(data, 'h', big_endian=True), -0x8000, 0x7FFF)), param)
+    if codec == 11:
+        return scale(typed_array(data, 'h', big_endian=True), param)
+    if codec == 12:
+        return scale(recursive_index(typed_array(data, 'h', big_endian=True), -0x8000, 0x7FFF), param)
+    if codec == 13:
+        return scale(recursive_index(typed_array(data, 'b', big_endian=True), -0x80, 0x7F), param)
+    if codec == 14:
+        return recursive_index(typed_array(data, 'h', big_endian=True), -0x8000, 0x7FFF)
+    if codec == 15:
+        return recursive_index(typed_array(data, 'b', big_endian=True), -0x80, 0x7F)
+    raise ValueError(f'Unsupported MMTF codec {codec}')
+
+
+def parse(stream):
+    import msgpack
+    return msgpack.unpack(stream, raw=False)
+
+
+def complex_from_mmtf(stream, name=''):
+    """ Builds a complex from an MMTF stream.\n
+        Group types hold the per-residue atom names and elements, so per-atom columns
+        are produced by expanding group types along the model/chain/group hierarchy.
+    """
+    mmtf = parse(stream)
+    group_types = mmtf['groupList']
+    group_type_list = decode(mmtf['groupTypeList'])
+    group_ids = decode(mmtf['groupIdList'])
+    ins_codes = decode(mmtf.get('insCodeList')) or [''] * len(group_ids)
+    chain_names = decode(mmtf.get('chainNameList')) or decode(mmtf['chainIdList'])
+    groups_per_chain = mmtf['groupsPerChain']
+    chains_per_model = mmtf['chainsPerModel']
+    num_atoms = mmtf['numAtoms']
+
+    x = decode(mmtf['xCoordList'])
+    columns = {
+        'model': [], 'chain': [], 'residue_serial': [], 'ins_code': [],
+        'residue_name': [], 'atom_name': [], 'element': [], 'het': [],
+        'x': x,
+        'y': decode(mmtf['yCoordList']),
+        'z': decode(mmtf['zCoordList']),
+        'serial': decode(mmtf['atomIdList']) if 'atomIdList' in mmtf else None,
+        'bfactor': decode(mmtf['bFactorList']) if 'bFactorList' in mmtf else None,
+        'occupancy': decode(mmtf['occupancyList']) if 'occupancyList' in mmtf else None
+    }
+
+    chain_i = group_i = 0
+    for model in range(mmtf.get('numModels', len(chains_per_model))):
+        for _ in range(chains_per_model[model]):
+            chain_name = chain_names[chain_i]
+            for _ in range(groups_per_chain[chain_i]):
+                group_type = group_types[group_type_list[group_i]]
+                atom_names = group_type['atomNameList']
+                n = len(atom_names)
+                het = group_type.get('chemCompType', '').upper() in ['NON-POLYMER', 'OTHER']
+                columns['model'].extend([model + 1] * n)
+                columns['chain'].extend([chain_name] * n)
+                columns['residue_serial'].extend([group_ids[group_i]] * n)
+                columns['ins_code'].extend([ins_codes[group_i]] * n)
+                columns['residue_name'].extend([group_type['groupName']] * n)
+                columns['atom_name'].extend(atom_names)
+                columns['element'].extend(group_type['elementList'])
+                columns['het'].extend([het] * n)
+                group_i += 1
+            chain_i += 1
+
+    if len(columns['atom_name']) != num_atoms or len(x) != num_atoms:
+        raise ValueError('MMTF atom count does not match its group list')
+    return build_complex(name or mmtf.get('structureId', ''), columns)
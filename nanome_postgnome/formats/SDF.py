@@ -0,0 +1,74 @@
+import io
+
+import nanome
+from nanome.util import Logs
+
+RECORD_END = '$$$$'
+
+
+def split_records(file):
+    """ Yields each record of an SDF stream as a list of lines, terminator included """
+    record = []
+    for line in file:
+        record.append(line)
+        if line.rstrip() == RECORD_END:
+            yield record
+            record = []
+    if any(line.strip() for line in record):
+        record.append(RECORD_END + '\n')
+        yield record
+
+
+def record_tags(record):
+    """ Reads the SD data items ('> <TAG>' followed by value lines) of a record """
+    tags = {}
+    tag = None
+    values = []
+    for line in record:
+        line = line.rstrip('\r\n')
+        if line.startswith('>'):
+            start, end = line.find('<'), line.rfind('>')
+            tag = line[start+1:end] if 0 < start < end else None
+            values = []
+        elif tag is not None:
+            if line.strip() and line != RECORD_END:
+                values.append(line)
+            else:
+                tags[tag] = '\n'.join(values)
+                tag = None
+    return tags
+
+
+def parse_records(text):
+    return nanome.structure.Complex.io.from_sdf(file=io.StringIO(text))
+
+
+def complex_from_sdf(file, name=''):
+    """ Parses an SDF stream into one complex.\n
+        Multi-record files are split on $$$$, each record becoming a frame (molecule)
+        of the same complex with its SD tags as metadata.
+    """
+    records = list(split_records(file))
+    if len(records) <= 1:
+        return parse_records(''.join(records[0]) if records else '')
+
+    parsed = parse_records(''.join(line for record in records for line in record))
+    if len(list(parsed.molecules)) != len(records):
+        # nanome reads the records as conformers of one molecule
+        parsed = parsed.convert_to_frames()
+    molecules = list(parsed.molecules)
+    if len(molecules) != len(records):
+        Logs.warning(f'{len(records)} SDF records parsed into {len(molecules)} molecules, skipping their metadata')
+        records = [[]] * len(molecules)
+
+    complex = nanome.structure.Complex()
+    complex.name = name
+    for record, molecule in zip(records, molecules):
+        title = record[0].strip() if record else ''
+        if title:
+            molecule.name = title
+        associated = dict(getattr(molecule, 'associated', None) or {})
+        associated.update(record_tags(record))
+        molecule.associated = associated
+        complex.add_molecule(molecule)
+    return complex
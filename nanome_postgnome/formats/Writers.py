@@ -0,0 +1,153 @@
+import re
+
+CHUNK_SIZE = 64 * 1024
+BOND_ORDERS = {'CovalentSingle': 1, 'CovalentDouble': 2, 'CovalentTriple': 3, 'Aromatic': 4}
+CIF_COLUMNS = ['group_PDB', 'id', 'type_symbol', 'label_atom_id', 'label_comp_id', 'label_asym_id', 'label_seq_id',
+    'Cartn_x', 'Cartn_y', 'Cartn_z', 'occupancy', 'B_iso_or_equiv', 'auth_seq_id', 'auth_asym_id', 'pdbx_PDB_model_num']
+
+
+def current_molecule(complex):
+    """ The molecule a complex displays, its current frame """
+    molecules = list(complex.molecules)
+    if not molecules:
+        return None
+    frame = getattr(complex, 'current_frame', 0)
+    return molecules[frame] if 0 <= frame < len(molecules) else molecules[0]
+
+
+def frame_atoms(complex, selected_only=False):
+    """ Yields (chain, residue, atom) for the atoms of the displayed frame of a complex """
+    molecule = current_molecule(complex)
+    if molecule is None:
+        return
+    for chain in molecule.chains:
+        for residue in chain.residues:
+            for atom in residue.atoms:
+                if atom.selected or not selected_only:
+                    yield chain, residue, atom
+
+
+def frame_bonds(complex, numbers):
+    """ Yields (number1, number2, order) for the bonds between atoms that were given numbers """
+    molecule = current_molecule(complex)
+    if molecule is None:
+        return
+    for bond in molecule.bonds:
+        number1, number2 = numbers.get(id(bond.atom1)), numbers.get(id(bond.atom2))
+        if number1 and number2:
+            yield number1, number2, BOND_ORDERS.get(getattr(bond.kind, 'name', ''), 1)
+
+
+def buffered(lines):
+    """ Joins lines into chunks of about CHUNK_SIZE characters """
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def pdb_atom_name(name, symbol):
+    # one letter elements start in the second column of the name field
+    return f'{name:<4}'[:4] if len(name) >= 4 or len(symbol) == 2 else f' {name:<3}'
+
+
+def pdb_lines(complexes, selected_only):
+    serial = 0
+    for complex in complexes:
+        numbers = {}
+        het = set()
+        chain_key = None
+        for chain, residue, atom in frame_atoms(complex, selected_only):
+            if chain_key is not None and chain is not chain_key:
+                serial += 1
+                yield f'TER   {serial % 100000:>5}\n'
+            chain_key = chain
+            serial += 1
+            numbers[id(atom)] = serial
+            if atom.is_het:
+                het.add(serial)
+            p = atom.position
+            yield (f"{'HETATM' if atom.is_het else 'ATOM  '}{serial % 100000:>5} {pdb_atom_name(atom.name, atom.symbol)} "
+                f"{residue.name[:3]:>3} {chain.name[-1:] or 'A'}{residue.serial % 10000:>4}    "
+                f"{p.x:8.3f}{p.y:8.3f}{p.z:8.3f}{atom.occupancy:6.2f}{atom.bfactor:6.2f}          {atom.symbol[:2]:>2}\n")
+        if chain_key is not None:
+            serial += 1
+            yield f'TER   {serial % 100000:>5}\n'
+        # as in files from the PDB, only bonds of hetero atoms are listed
+        for number1, number2, _ in frame_bonds(complex, numbers):
+            if number1 in het or number2 in het:
+                yield f'CONECT{number1 % 100000:>5}{number2 % 100000:>5}\n'
+    yield 'END\n'
+
+
+def sdf_lines(complexes, selected_only):
+    for complex in complexes:
+        atoms = [atom for _, _, atom in frame_atoms(complex, selected_only)]
+        if not atoms:
+            continue
+        if len(atoms) > 999:
+            raise ValueError(f'{complex.name} has {len(atoms)} atoms, more than an SDF record holds')
+        numbers = {id(atom): i+1 for i, atom in enumerate(atoms)}
+        bonds = list(frame_bonds(complex, numbers))
+        # the counts line comes first, so a record is built whole
+        lines = [f'{complex.name}\n', '  postgnome\n', '\n', f'{len(atoms):>3}{len(bonds):>3}  0  0  0  0  0  0  0  0999 V2000\n']
+        for atom in atoms:
+            p = atom.position
+            lines.append(f'{p.x:10.4f}{p.y:10.4f}{p.z:10.4f} {atom.symbol:<3} 0' + '  0' * 11 + '\n')
+        for number1, number2, order in bonds:
+            lines.append(f'{number1:>3}{number2:>3}{order:>3}  0  0  0  0\n')
+        lines.append('M  END\n')
+        associated = getattr(current_molecule(complex), 'associated', None) or {}
+        for tag, value in associated.items():
+            lines += [f'> <{tag}>\n', f'{value}\n', '\n']
+        lines.append('$$$$\n')
+        yield from lines
+
+
+def cif_value(value):
+    text = str(value)
+    if not text:
+        return '.'
+    if re.search(r'\s', text) or text[0] in '_#$;[]\'"':
+        return f"'{text}'" if "'" not in text else f'"{text}"'
+    return text
+
+
+def mmcif_lines(complexes, selected_only):
+    name = re.sub(r'\s+', '_', complexes[0].name) if complexes and complexes[0].name else 'postgnome'
+    yield f'data_{name}\n#\nloop_\n'
+    for column in CIF_COLUMNS:
+        yield f'_atom_site.{column}\n'
+    serial = 0
+    for complex in complexes:
+        for chain, residue, atom in frame_atoms(complex, selected_only):
+            serial += 1
+            p = atom.position
+            values = ['HETATM' if atom.is_het else 'ATOM', serial, atom.symbol, atom.name, residue.name, chain.name,
+                residue.serial, f'{p.x:.3f}', f'{p.y:.3f}', f'{p.z:.3f}', f'{atom.occupancy:.2f}', f'{atom.bfactor:.2f}',
+                residue.serial, chain.name, 1]
+            yield ' '.join(cif_value(value) for value in values) + '\n'
+    yield '#\n'
+
+
+def write_pdb(complexes, selected_only=False):
+    """ Yields the displayed frames of complexes as one PDB file, in chunks """
+    return buffered(pdb_lines(complexes, selected_only))
+
+
+def write_sdf(complexes, selected_only=False):
+    """ Yields the displayed frames of complexes as SDF records, one per complex, in chunks """
+    return buffered(sdf_lines(complexes, selected_only))
+
+
+def write_mmcif(complexes, selected_only=False):
+    """ Yields the displayed frames of complexes as one mmCIF atom_site table, in chunks """
+    return buffered(mmcif_lines(complexes, selected_only))
+
+
+WRITERS = {'pdb': write_pdb, 'sdf': write_sdf, 'cif': write_mmcif}
@@ -0,0 +1,4 @@
+from .BinaryCIF import complex_from_bcif
+from .MMTF import complex_from_mmtf
+from .SDF import complex_from_sdf
+from .Writers import WRITERS, write_mmcif, write_pdb, write_sdf
@@ -1,34 +1,31 @@
-import re
 import os
-import requests
-import tempfile
-from functools import partial, reduce
-
-from rdkit import Chem
-from rdkit.Chem import AllChem
-
 import json
-import xmltodict
-import requests
 import tempfile
+import threading
 import traceback
+from functools import partial
+from concurrent.futures import Future
 
 import nanome
 from nanome.util import Logs
 from nanome.util.enums import LoadFileErrorCode
 from nanome.api.structure import Complex
 
-from . import ResourcesMenu
-from . import RequestsMenu
+from ..engine import Progress, RequestCancelled, RequestRun, RequestRunner, WorkspaceIndex
+from ..engine.ComplexCache import complex_cache
+from ..engine.Scheduler import INTERACTIVE, scheduler
+from ..Templates import load_menu
+from ..formats import complex_from_bcif, complex_from_mmtf, complex_from_sdf
+from ..engine.ResponseBody import ResponseBody
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), 'json', 'MakeRequest.json')
+# import types parsed into complexes here, which can be found again by payload
+COMPLEX_TYPES = ['.pdb', '.sdf', '.cif', '.bcif', '.mmtf', '.mol', '.smi']
+# seconds to wait for Nanome to answer a plugin request
+PLUGIN_TIMEOUT = 30
 class MakeRequestMenu():
     def __init__(self, plugin, settings, show_all_requests=True):
-        self.session = requests.Session()
-        self.proxies = {
-            'no': 'pass'
-        }
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self.menu = load_menu(MENU_PATH)
         self.menu.index = 0
         self.plugin = plugin
         self.settings = settings
@@ -36,16 +33,27 @@ class MakeRequestMenu():
         self.fields = {}
 
         self.request = None
-        self.tempdir = tempfile.TemporaryDirectory()
+        # RequestRun of the Load in progress
+        self.run = None
+        # fetches and steps run here, structures are imported into this session's workspace
+        self.runner = RequestRunner(settings, self.plugin, INTERACTIVE, self.plugin.send_notification, self.import_to_nanome, self.workspace_structures)
+        self.tempdir = self.runner.tempdir
+        # complexes this session loaded, by payload
+        self.loaded = WorkspaceIndex()
+        complex_cache.open(os.path.join(self.plugin.plugin_files_path, 'postgnome', 'complexes'))
 
         self.__ln_fields = self.menu.root.find_node('Fields')
+        self.__ln_spacer = nanome.ui.LayoutNode()
+        # var uid -> displayed field node
+        self.field_nodes = {}
         self.ln_all_requests = self.menu.root.find_node('All Requests')
         self.ln_all_requests.get_content().register_pressed_callback(lambda b: self.plugin.requests.open_menu())
         self.ln_all_requests.enabled = show_all_requests
         self.btn_load = self.menu.root.find_node('Load Button').get_content()
         self.btn_load.register_pressed_callback(self.load_request)
-
-        self.host = os.environ.get("HOSTNAME", None)
+        self.lbl_progress = self.create_progress_label()
+        # the run whose progress is displayed, which outlives self.run while imports finish
+        self.progress_run = None
 
     def open_menu(self):
         self.menu.enabled = True
@@ -59,103 +67,152 @@ class MakeRequestMenu():
         if not request:
             self.close_menu()
             return
-        
-        if not self.menu.enabled:
-            self.open_menu()
+
         self.request = request
         self.menu.title = request['name']
-        self.show_request()
-
-    def show_request(self):
-        self.__ln_fields.clear_children()
-        if not self.request:
-            self.plugin.update_menu(self.menu)
+        # the title can only be sent with the whole menu
+        self.show_request(push=False)
+        self.open_menu()
+        self.speculate()
+
+    def speculate(self):
+        """ Warms connections to every host the request targets, and prefetches the
+            steps that can already be rendered: GETs without overridden data that only
+            use input variables. Variables a step of the request produces are left out,
+            their stored values are from an earlier run
+        """
+        self.runner.prefetcher.clear()
+        if self.runner.recorder:
+            # a recording has to hold every exchange of the Load itself
             return
-
-        self.variables = self.settings.get_inputs(self.request)
+        produced = set()
+        for step in self.request['steps']:
+            produced.update(self.settings.get_resource(step['resource']).get('output variables', {}))
+            if step.get('fan out'):
+                produced.add(step['fan out'][1])
+        # inputs as Load will see them: what was typed in their field, or their stored value
+        inputs = self.settings.get_inputs(self.request)
+        typed = {uid: self.fields[name] for uid, (name, _) in inputs.items() if self.fields.get(name)}
+        contexts = [typed, self.settings.variables]
+        urls = []
+        for step in self.request['steps']:
+            resource = self.settings.get_resource(step['resource'])
+            if not resource:
+                continue
+            data = resource['data'].replace("\'", "\"")
+            rendered = self.runner.render_request(resource, contexts, data)
+            urls.append(rendered.url)
+            if rendered.method == 'get' and not step['override_data'] and self.runner.is_determined(resource, contexts, produced):
+                self.runner.prefetcher.prefetch(rendered)
+        self.runner.prefetcher.warm(urls)
+
+    def show_request(self, push=True):
+        """ Diffs the request's input variables against the displayed fields
+            and only sends the nodes that were added, removed or changed
+        """
+        self.variables = self.settings.get_inputs(self.request) if self.request else {}
         self.fields = {name:self.fields.get(name, '') for (name, value) in self.variables.values()}
+
+        structure_changed = False
+        changed_content = []
+        for var_uid in list(self.field_nodes):
+            if var_uid not in self.variables:
+                del self.field_nodes[var_uid]
+                structure_changed = True
         for var_uid, (var_name, default_value) in self.variables.items():
-            field_value = self.fields[var_name]
-            ln = nanome.ui.LayoutNode()
-            ln.sizing_type = nanome.util.enums.SizingTypes.ratio
-            ln.sizing_value = 0.25
-            ln.layout_orientation = nanome.util.enums.LayoutTypes.horizontal
-            ln.set_padding(top=0.01, down=0.01, left=0.01, right=0.01)
-
-            ln_label = ln.create_child_node()
-            label = ln_label.add_new_label(var_name+':')
-            label.text_max_size = 0.4
-            label.text_vertical_align = nanome.util.enums.VertAlignOptions.Middle
-
-            ln_field = ln.create_child_node()
-            ln_field.forward_dist = 0.02
-            ln_field.set_padding(top=0.01, down=0.01, left=0.01, right=0.01)
-            text_input = ln_field.add_new_text_input()
-            text_input.max_length = 0
-            text_input.input_text = field_value
-            text_input.placeholder_text = default_value
-            text_input.max_length = 64
-            text_input.register_changed_callback(partial(self.field_changed, var_name))
-            self.__ln_fields.add_child(ln)
-        self.__ln_fields.create_child_node()
-        self.plugin.update_menu(self.menu)
+            if default_value is not None and not isinstance(default_value, str):
+                default_value = json.dumps(default_value)
+            ln = self.field_nodes.get(var_uid)
+            if ln is None:
+                self.field_nodes[var_uid] = self.create_field(var_name, default_value)
+                structure_changed = True
+            elif ln.displayed != (var_name, default_value):
+                changed_content += self.update_field(ln, var_name, default_value)
+
+        children = [self.field_nodes[var_uid] for var_uid in self.variables] + [self.__ln_spacer]
+        if self.__ln_fields.get_children() != children:
+            self.__ln_fields.clear_children()
+            for ln in children:
+                self.__ln_fields.add_child(ln)
+            structure_changed = True
+
+        if not push or not self.menu.enabled:
+            return
+        if structure_changed:
+            self.plugin.update_node(self.__ln_fields)
+        elif changed_content:
+            self.plugin.update_content(*changed_content)
+
+    def create_field(self, var_name, default_value):
+        ln = nanome.ui.LayoutNode()
+        ln.sizing_type = nanome.util.enums.SizingTypes.ratio
+        ln.sizing_value = 0.25
+        ln.layout_orientation = nanome.util.enums.LayoutTypes.horizontal
+        ln.set_padding(top=0.01, down=0.01, left=0.01, right=0.01)
+
+        ln_label = ln.create_child_node()
+        ln.label = ln_label.add_new_label(var_name+':')
+        ln.label.text_max_size = 0.4
+        ln.label.text_vertical_align = nanome.util.enums.VertAlignOptions.Middle
+
+        ln_field = ln.create_child_node()
+        ln_field.forward_dist = 0.02
+        ln_field.set_padding(top=0.01, down=0.01, left=0.01, right=0.01)
+        ln.text_input = ln_field.add_new_text_input()
+        ln.text_input.max_length = 0
+        ln.text_input.input_text = self.fields[var_name]
+        ln.text_input.placeholder_text = default_value
+        ln.text_input.max_length = 64
+        ln.text_input.register_changed_callback(partial(self.field_changed, var_name))
+        ln.displayed = (var_name, default_value)
+        return ln
+
+    def update_field(self, ln, var_name, default_value):
+        """ Updates a displayed field in place, returning the content that changed """
+        changed = []
+        old_name, old_default = ln.displayed
+        if var_name != old_name:
+            ln.label.text_value = var_name+':'
+            ln.text_input.input_text = self.fields[var_name]
+            ln.text_input.register_changed_callback(partial(self.field_changed, var_name))
+            changed += [ln.label, ln.text_input]
+        if default_value != old_default:
+            ln.text_input.placeholder_text = default_value
+            if ln.text_input not in changed:
+                changed.append(ln.text_input)
+        ln.displayed = (var_name, default_value)
+        return changed
+
+    def requests_changed(self, request_ids):
+        if self.request and self.request['id'] in request_ids:
+            self.show_request()
 
     def field_changed(self, var_name, text_input):
         self.fields[var_name] = text_input.input_text
 
-    def set_load_enabled(self, enabled):
-        self.btn_load.unusable = not enabled
-        self.plugin.update_content(self.btn_load)
-
-    def contextualize(self, variable, contexts, left_wrapper="", right_wrapper=""):
-        cvar = self.settings.contextualize(variable, contexts, add_to_context=True, default_value="", left_wrapper=left_wrapper, right_wrapper=right_wrapper)
-        return cvar
-
-    def convert_to_json_string(self, response_text, response_type):
-        if 'json' in response_type:
-            coerced_response = '{"root": '+ response_text + '}'
-        elif 'xml' in response_type:
-            coerced_response = json.dumps(xmltodict.parse(response_text))
-        elif 'text' in response_type:
-            coerced_response = '{"root": '+ response_text + '}'
-        return coerced_response
-
-    def get_response(self, resource, contexts, data=None):
-        """ Responsible for getting a response from a resource.
-            As this method calls settings.set_output,
-            It gives a response decontextualized from the resource's inputs
-            and will update the resource's output variables in the process.
-        """
-        load_url = self.contextualize(variable=resource['url'], contexts=contexts)
-        if self.host: load_url = load_url.replace('localhost', self.host)
-        method = resource['method'].lower()
-        headers = dict(resource['headers'].values())
-        headers = {self.contextualize(name, contexts):self.contextualize(value, contexts) for name,value in headers.items()}
-        data = self.contextualize(data or resource['data'], contexts=contexts)
-        if method == 'post':
-            headers.update({'Content-Length': str(len(data))})
-        elif headers.get('Content-Length'):
-            del headers['Content-Length']
-
-        try:
-            Logs.debug(f"load url: {load_url}")
-            if method == 'get':
-                response = self.session.get(load_url, headers=headers, proxies=self.proxies, verify=False)
-            elif method == 'post':
-                if 'Content-Type' not in headers:
-                    headers['Content-Type'] = 'text/plain'
-                response = self.session.post(load_url, data=json.loads(data), proxies=self.proxies, verify=False)
-
-            json_text = self.convert_to_json_string(response.text, response.headers.get('Content-Type', 'text/plain'))
-            response._content = bytes(json_text, 'utf-8')
-            self.settings.set_output(resource, response.text, dict(response.headers))
-        except:
-            exception = self.get_exception("An error occured while making the request")
-            Logs.debug(traceback.format_exc())
-            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"{exception}")
-            return None
+    def create_progress_label(self):
+        ln_buttons = self.menu.root.find_node('Buttons')
+        ln_load = self.menu.root.find_node('Load Button')
+        ln_buttons.remove_child(ln_load)
+        ln_progress = ln_buttons.create_child_node('Progress')
+        ln_progress.set_padding(left=0.01, right=0.01)
+        ln_buttons.add_child(ln_load)
+        label = ln_progress.add_new_label('')
+        label.text_max_size = 0.3
+        label.text_vertical_align = nanome.util.enums.VertAlignOptions.Middle
+        return label
+
+    def show_progress(self, run, text):
+        # a single content update, at most once per Progress interval
+        if run is not self.progress_run:
+            return
+        self.lbl_progress.text_value = text
+        self.plugin.update_content(self.lbl_progress)
 
-        return response
+    def set_running(self, running):
+        # while a Request runs the Load button cancels it
+        self.btn_load.text.value.set_all('Cancel' if running else 'Load')
+        self.plugin.update_content(self.btn_load)
 
     def save_fields_to_vars(self):
         for name, value in self.fields.items():
@@ -163,95 +220,209 @@ class MakeRequestMenu():
                 self.settings.set_variable(None, name, value)
 
     def load_request(self, button=None):
+        if self.run:
+            self.cancel_request()
+            return
         if not self.request:
             self.plugin.send_notification(nanome.util.enums.NotificationTypes.message, "Please select a request")
             return
 
         self.save_fields_to_vars()
 
-        self.set_load_enabled(False)
-        results = {}
-        for i, step in enumerate(self.request['steps']):
-            resource = self.settings.get_resource(step['resource'])
-            import_type = resource['import type']
-            metadata = step['metadata_source']
-            data = resource['data'].replace("\'", "\"")
-            # override data if necessary
-            data_override_field_name = f"{self.request['name']} {step['name']} data"
-            if step['override_data']:
-                data = self.fields[data_override_field_name]
-
-            contexts = [self.fields, results, self.settings.variables]
-            response = self.get_response(resource, contexts, data)
-            var_uid, var_value = self.settings.get_output_variable(resource, 0)
-            if not response:
-                self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"Step {i} failed. Aborting {self.request['name']}")
-                self.set_load_enabled(True)
-                return
-            results[f'step{i+1}'] = json.dumps(var_value) or response.text
-            Logs.debug(f'setting step{i+1} to {var_value} ({self.settings.variables[var_uid][0]})')
-            if import_type:
-                import_name = self.contextualize(variable=resource['import name'], contexts=contexts)
-                self.import_to_nanome(import_name, import_type, var_value or response.text, metadata)
-        self.set_load_enabled(True)
-
-    def import_to_nanome(self, name, filetype, contents, metadata):
+        self.run = RequestRun()
+        self.run.progress = Progress(partial(self.show_progress, self.run))
+        self.progress_run = self.run
+        self.set_running(True)
+        if self.runner.recorder:
+            self.runner.recorder.start()
+        # off the plugin's thread, so the Cancel press can be received
+        threading.Thread(target=self.run_request, args=[self.request, self.run], daemon=True).start()
+
+    def cancel_request(self):
+        """ Aborts the Load in progress: transfers are closed, queued fetches dropped,
+            and remaining steps and imports skipped. The menu is ready for the next Load at once.
+        """
+        run, self.run = self.run, None
+        run.cancel.cancel()
+        scheduler.cancel(self.plugin, [INTERACTIVE])
+        run.progress.message('Cancelled')
+        self.set_running(False)
+        self.plugin.send_notification(nanome.util.enums.NotificationTypes.message, "Request cancelled")
+
+    def run_request(self, request, run):
         try:
-            file_path = os.path.join(self.tempdir.name, name+filetype)
-            with open(file_path, 'w+') as file:
-                file.write(contents)
-                file.seek(0)
-                if filetype == ".pdb":
-                    complex = nanome.structure.Complex.io.from_pdb(path=file.name)
-                    self.plugin.add_bonds([complex], partial(self.bonds_ready, name, metadata))
-                elif filetype == ".sdf":
-                    complex = nanome.structure.Complex.io.from_sdf(path=file.name)
-                    self.bonds_ready(name, metadata, [complex])
-                elif filetype == ".cif":
-                    complex = nanome.structure.Complex.io.from_mmcif(path=file.name)
-                    self.plugin.add_bonds([complex], partial(self.bonds_ready, name, metadata))
-                elif filetype == ".mol":
-                    self.plugin.send_files_to_load([file.name], partial(self.apply_residue_label, name))
-                    # self.plugin.add_bonds([complex], partial(self.bonds_ready, name, metadata))
-                elif filetype == ".smi":
-                    complex = self.complexFromSMILES(contents)
-                    self.plugin.add_bonds([complex], partial(self.bonds_ready, name, metadata))
-                elif filetype == '.pdf':
-                    self.plugin.send_files_to_load([file])
-                    return
-                elif filetype == '.nanome':
-                    self.plugin.send_files_to_load([file])
+            self.runner.run_steps(request, run, self.fields)
+        except RequestCancelled:
+            Logs.debug(f"{request['name']} cancelled")
+        except Exception:
+            exception = self.runner.get_exception(f"{request['name']} failed")
+            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"{exception}")
+            run.progress.message('Failed')
+        finally:
+            if self.runner.recorder:
+                self.runner.recorder.save(request['name'])
+            if self.run is run:
+                self.run = None
+                self.set_running(False)
+
+    def import_to_nanome(self, name, filetype, contents, metadata, body=None, cancel=None, progress=None, repeat='focus'):
+        """ Imports contents, or a downloaded body if given. Compressed bodies are
+            decompressed as the parser reads them. Imports of a cancelled run stop
+            before they reach the workspace.
+            A payload this session already loaded under the same name is focused
+            in the workspace, replaced or loaded again, depending on repeat
+        """
+        progress = progress or Progress()
+        try:
+            if body is None:
+                body = ResponseBody.from_text(contents, self.tempdir.name)
+            key = self.loaded.key(body, filetype, name) if filetype in COMPLEX_TYPES else None
+            replaced = None
+            if key and repeat != 'duplicate':
+                replaced = self.find_loaded(key, cancel)
+                if replaced is not None and repeat == 'focus':
+                    self.plugin.zoom_on_structures([replaced])
+                    progress.message(f'{name} is already loaded')
                     return
-                    # load workspace
-                elif filetype == ".json":
-                    complex = nanome.structure.Complex()
-                    self.bonds_ready(name, metadata, [complex])
+            cached = complex_cache.get(key[:2]) if key else None
+            if cached is not None:
+                # parsed, bonded and assigned secondary structure by an earlier load, under any name
+                self.finish_load(name, filetype, metadata, cached, cancel=cancel, progress=progress, loaded_key=key, replaced=replaced)
+                return
+            bonds_ready = partial(self.bonds_ready, name, filetype, metadata, cancel=cancel, progress=progress, loaded_key=key, replaced=replaced)
+            def add_bonds(complex):
+                progress.stage(f'computing bonds of {name}')
+                self.plugin.add_bonds([complex], bonds_ready)
+            progress.stage(f'parsing {name}')
+            file_path = os.path.join(self.tempdir.name, name+filetype)
+            if filetype == ".pdb":
+                with body.open_text() as file:
+                    complex = nanome.structure.Complex.io.from_pdb(file=file)
+                add_bonds(complex)
+            elif filetype == ".sdf":
+                # multi-record files load as frames of a single complex
+                with body.open_text() as file:
+                    complex = complex_from_sdf(file, name)
+                bonds_ready([complex])
+            elif filetype == ".cif":
+                with body.open_text() as file:
+                    complex = nanome.structure.Complex.io.from_mmcif(file=file)
+                add_bonds(complex)
+            elif filetype == ".bcif":
+                with body.open() as file:
+                    complex = complex_from_bcif(file, name)
+                add_bonds(complex)
+            elif filetype == ".mmtf":
+                with body.open() as file:
+                    complex = complex_from_mmtf(file, name)
+                add_bonds(complex)
+            elif filetype == ".mol":
+                with body.open_text() as file:
+                    complex = self.complex_from_molfile(file)
+                if complex is not None:
+                    bonds_ready([complex])
                 else:
-                    Logs.error("Unknown filetype")
-        except: # Making sure temp file gets deleted in case of problem
-            self._loading = False
-            exception = self.get_exception("Error while parsing")
+                    self.load_and_label(body.save_as(file_path), name)
+                    progress.message(f'Sent {name} to Nanome')
+            elif filetype == ".smi":
+                complex = self.complexFromSMILES(body.text().strip())
+                add_bonds(complex)
+            elif filetype == '.pdf':
+                self.plugin.send_files_to_load([body.save_as(file_path)])
+                progress.message(f'Sent {name} to Nanome')
+                return
+            elif filetype == '.nanome':
+                self.plugin.send_files_to_load([body.save_as(file_path)])
+                progress.message(f'Sent {name} to Nanome')
+                return
+            elif filetype == ".json":
+                complex = nanome.structure.Complex()
+                bonds_ready([complex])
+            else:
+                Logs.error("Unknown filetype")
+        except RequestCancelled:
+            raise
+        except:
+            Logs.debug(traceback.format_exc())
             self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"Import failure. Have you configured the resource for {filetype} files?")
+            progress.message(f'Could not import {name}')
+
+    def find_loaded(self, key, cancel=None):
+        """ The workspace complex a payload was loaded as, if it is still there """
+        index = self.loaded.get(key)
+        if index is None:
+            return None
+        complexes = self.wait_for(self.plugin.request_complex_list, cancel)
+        self.loaded.retain(complex.index for complex in complexes)
+        return next((complex for complex in complexes if complex.index == index), None)
+
+    def workspace_structures(self, source, cancel=None):
+        """ The complexes of the workspace, in full, for resources uploading them.
+            Which atoms are sent (all, or the selected ones) is up to the upload
+        """
+        complexes = self.wait_for(self.plugin.request_complex_list, cancel)
+        if not complexes:
+            return []
+        return self.wait_for(partial(self.plugin.request_complexes, [complex.index for complex in complexes]), cancel)
+
+    def wait_for(self, request, cancel=None):
+        """ Calls a plugin request taking a callback, and waits for its result.
+            Callbacks are delivered on the plugin thread, which can't wait for one itself
+        """
+        if threading.current_thread() is threading.main_thread():
+            raise RuntimeError('plugin requests can only be waited for off the plugin thread')
+        if cancel:
+            cancel.check()
+        future = Future()
+        request(lambda result: future.done() or future.set_result(result))
+        return cancel.result(future, PLUGIN_TIMEOUT) if cancel else future.result(PLUGIN_TIMEOUT)
+
+    def complex_from_molfile(self, file):
+        """ Parses a molfile locally, returning None if nanome could not read it
+            (in which case the file has to go through send_files_to_load)
+        """
+        try:
+            complex = nanome.structure.Complex.io.from_sdf(file=file)
+        except Exception:
+            Logs.debug(traceback.format_exc())
+            return None
+        if not any(True for _ in complex.atoms):
+            return None
+        return complex
+
+    def label_residues(self, complex, name):
+        for residue in complex.residues:
+            residue.label_text = name
+
+    def load_and_label(self, path, name):
+        self.plugin.send_files_to_load([path], partial(self.apply_residue_label, name))
 
     def apply_residue_label(self, name, error_code):
+        """ Labels the residues of the complex a file named name just loaded as.
+            Nanome gives complexes increasing indexes, so it is the last one with that name,
+            or the last one loaded if Nanome named it after the file's contents
+        """
         if error_code == LoadFileErrorCode.loading_failed:
             self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Failed to upload structure.")
             return
 
-        def label_last_complex(complexes):
-            complex = complexes[-1]
-            for residue in complex.residues:
-                Logs.debug(residue.label_text)
-                residue.label_text = name
-                Logs.debug('name:', name)
-                Logs.debug(residue.label_text)
-            self.plugin.update_structures_deep([complex])
-        def request_and_label_last_complex(all_complexes):
-            self.plugin.request_complexes([all_complexes[-1].index], label_last_complex)
+        def label_complexes(complexes):
+            residues = []
+            for complex in complexes:
+                self.label_residues(complex, name)
+                residues += complex.residues
+            # labels are residue properties, the atoms don't need to be sent back
+            self.plugin.update_structures_shallow(residues)
+        def request_and_label_loaded(all_complexes):
+            loaded = [c for c in all_complexes if c.name == name] or all_complexes
+            if loaded:
+                self.plugin.request_complexes([max(c.index for c in loaded)], label_complexes)
 
-        self.plugin.request_complex_list(request_and_label_last_complex)
+        self.plugin.request_complex_list(request_and_label_loaded)
 
     def complexFromSMILES(self, smiles):
+        from rdkit import Chem
+        from rdkit.Chem import AllChem
         mol = Chem.MolFromSmiles(smiles)
         AllChem.Compute2DCoords(mol)
         with tempfile.TemporaryFile(mode='w+') as temp:
@@ -270,28 +441,53 @@ class MakeRequestMenu():
                 dict_found = True
         return obj
 
-    def bonds_ready(self, name, metadata, complex_list):
+    def bonds_ready(self, name, filetype, metadata, complex_list, cancel=None, progress=None, loaded_key=None, replaced=None):
+        if cancel and cancel.cancelled:
+            return
+        progress = progress or Progress()
+        progress.stage(f'computing secondary structure of {name}')
         if len(complex_list):
-            try:
-                if metadata: complex_list[0]._remarks.update(self.get_remarks(json.loads(metadata)))
-            except Exception as e:
-                self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"Metadata error. Have you configured the resource for metadata json?")
-            self.plugin.add_dssp(complex_list, partial(self.complex_ready, name))
-
-    def complex_ready(self, name, complex_list):
-        self._loading = False
-        self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, f"Successfully loaded while parsing metadata")
+            self.plugin.add_dssp(complex_list, partial(self.complex_processed, name, filetype, metadata, cancel=cancel, progress=progress, loaded_key=loaded_key, replaced=replaced))
+
+    def apply_metadata(self, complex_list, metadata):
+        try:
+            if metadata: complex_list[0]._remarks.update(self.get_remarks(json.loads(metadata)))
+        except Exception:
+            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Metadata error. Have you configured the resource for metadata json?")
+
+    def complex_processed(self, name, filetype, metadata, complex_list, cancel=None, progress=None, loaded_key=None, replaced=None):
+        # bonds and secondary structure are assigned, later loads of the payload can start from here
+        if loaded_key and complex_list:
+            complex_cache.put(loaded_key[:2], complex_list)
+        self.finish_load(name, filetype, metadata, complex_list, cancel=cancel, progress=progress, loaded_key=loaded_key, replaced=replaced)
+
+    def finish_load(self, name, filetype, metadata, complex_list, cancel=None, progress=None, loaded_key=None, replaced=None):
+        """ Adds what depends on the load rather than on the payload (the residue labels
+            of molfiles and the metadata), which the complex cache is keyed and filled without
+        """
+        if complex_list:
+            if filetype == '.mol':
+                self.label_residues(complex_list[0], name)
+            self.apply_metadata(complex_list, metadata)
+        self.complex_ready(name, complex_list, cancel=cancel, progress=progress, loaded_key=loaded_key, replaced=replaced)
+
+    def complex_ready(self, name, complex_list, cancel=None, progress=None, loaded_key=None, replaced=None):
+        if cancel and cancel.cancelled:
+            return
+        if progress:
+            progress.message(f'Loaded {name}')
+        self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, "Successfully loaded while parsing metadata")
         complex_list[0].molecular.name = name
-        self.plugin.add_to_workspace(complex_list)
-
-    def get_exception(self, default_error, pattern=".*?([\w ]*Error:[\w ]*)"):
-        exc = traceback.format_exc()
-        Logs.debug(exc)
-        exc_lines = re.findall(pattern, exc, re.MULTILINE)
-        if not len(exc_lines) or len(exc_lines[0]) < 15:
-            return default_error
-        else:
-            return exc_lines[0]
+        if replaced is not None:
+            # the new complex takes the place of the one it replaces
+            complex_list[0].position = replaced.position
+            complex_list[0].rotation = replaced.rotation
+            self.plugin.remove_from_workspace([replaced])
+        self.plugin.add_to_workspace(complex_list, partial(self.complex_added, loaded_key) if loaded_key else None)
+
+    def complex_added(self, loaded_key, complex_list):
+        if complex_list:
+            self.loaded.add(loaded_key, complex_list[0].index)
 
 class Response:
     def __init__(self, **kwds):
@@ -1,20 +1,22 @@
 import os
+import re
 from functools import partial
 
 import nanome
 from nanome.util import Logs
 
 from ..components import ListElement, ValueDisplayType
-from ..menus import ResourceConfigurationMenu
+from ..Templates import load_menu
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), "json", "RequestConfig.json")
+# 'each {{ids}} as {{id}}' in a step's value field makes it a fan-out step
+FAN_OUT_PATTERN = re.compile(r'^\s*each\s+{{(.+?)}}\s+as\s+{{(.+?)}}\s*$')
 
 class RequestConfigurationMenu():
     def __init__(self, plugin, settings):
         self.plugin = plugin
         self.settings = settings
-        self.resource_config = ResourceConfigurationMenu(plugin, settings)
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self.menu = load_menu(MENU_PATH)
         self.menu.index = 2
 
         self.request = None
@@ -81,7 +83,7 @@ class RequestConfigurationMenu():
                 config_opened=open_config
             )
             el.set_top_panel_text(resource['name'])
-            el.set_resource_placeholder("Metadata source ({{step1}})")
+            el.set_resource_placeholder("Metadata source ({{step1}}) or each {{list}} as {{item}}")
             el.set_tooltip('Override post data during request')
             self.lst_steps.items.append(el)
             name = request['name']
@@ -119,7 +121,7 @@ class RequestConfigurationMenu():
             config_closed=close_config
         )
         el.set_top_panel_text(resource.get('name', ''))
-        el.set_resource_placeholder('Metadata source ({{step1}})')
+        el.set_resource_placeholder("Metadata source ({{step1}}) or each {{list}} as {{item}}")
         el.set_tooltip('Override post data during request')
         self.lst_steps.items.append(el)
         self.plugin.update_content(self.lst_steps)
@@ -132,7 +134,14 @@ class RequestConfigurationMenu():
         return self.settings.rename_step(self.request['id'], step, new_name)
 
     def validate_new_resource(self, step, list_element, metadata_source_name):
-        step_index = self.plugin.make_request.request['steps'].index(step)
+        fan_out = FAN_OUT_PATTERN.match(metadata_source_name)
+        if fan_out or (step.get('fan out') and not metadata_source_name.strip()):
+            if not self.settings.set_fan_out(step, *(fan_out.groups() if fan_out else ())):
+                return False
+            self.plugin.make_request.requests_changed([self.request['id']])
+            message = f"{step['name']} runs once per element of {fan_out.group(1)}" if fan_out else f"{step['name']} runs once"
+            self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, message)
+            return True
         if metadata_source_name in self.settings.variables:
             step['metadata_source'] = metadata_source_name
             self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, "Resource for step updated")
@@ -142,7 +151,7 @@ class RequestConfigurationMenu():
             return False
 
     def config_opened(self, resource):
-        self.resource_config.open_menu(resource)
+        self.plugin.resource_config.open_menu(resource)
 
     def config_closed(self, resource):
         pass
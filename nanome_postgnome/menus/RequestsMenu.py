@@ -6,6 +6,7 @@ from nanome.util import Logs
 
 from ..components import ListElement
 from ..menus.RequestConfigurationMenu import RequestConfigurationMenu
+from ..Templates import load_menu
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), "json", "Requests.json")
 
@@ -13,10 +14,10 @@ class RequestsMenu():
     def __init__(self, plugin, settings):
         self.plugin = plugin
         self.settings = settings
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self.menu = load_menu(MENU_PATH)
         self.menu.register_closed_callback(self.open_menu)
         self.menu.index = 1
-        self.config = RequestConfigurationMenu(self.plugin, self.settings)
+        self._config = None
 
         self.req_i = 0
 
@@ -24,6 +25,15 @@ class RequestsMenu():
         self.btn_new_request = self.menu.root.find_node("New Request").get_content()
         self.btn_new_request.register_pressed_callback(self.add_request)
 
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = RequestConfigurationMenu(self.plugin, self.settings)
+        return self._config
+
+    def open_config(self, request):
+        self.config.open_menu(request)
+
     def open_menu(self, menu=None):
         self.refresh_requests()
         self.menu.enabled = True
@@ -38,11 +48,10 @@ class RequestsMenu():
             self.requests_list,
             name,
             externally_used=True,
-            config=self.config,
             deleted=self.delete_request,
             renamed=partial(self.request_renamed, request),
             external_toggle=self.set_active_request,
-            config_opened=partial(self.config.open_menu, request)
+            config_opened=partial(self.open_config, request)
         )
         element.r_id = request['id']
         element.set_tooltip("Set to active request")
@@ -74,11 +83,10 @@ class RequestsMenu():
             self.requests_list,
             name,
             externally_used=True,
-            config=self.config,
             deleted=self.delete_request,
             renamed=partial(self.request_renamed, request),
             external_toggle=self.set_active_request,
-            config_opened=partial(self.config.open_menu, request)
+            config_opened=partial(self.open_config, request)
             )
             element.r_id = r_id
             element.set_tooltip("Set to active request")
@@ -1,21 +1,46 @@
 import os
-import re
+import math
 from functools import partial
 
 import nanome
-from nanome.util import Logs
 
-from ..components import ListElement
+from ..engine import format_policy, parse_policy
+from ..engine.Pagination import PAGINATION_TYPES
+from ..engine.Upload import UPLOAD_FORMATS, UPLOAD_SOURCES
+from ..engine.WorkspaceIndex import REPEAT_MODES
 from . import ResponseConfigurationMenu
+from ..Templates import load_menu
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), "json", "ResourceConfig.json")
+MEGABYTE = 1024 * 1024
+# dropdown item of an unset option
+NONE = 'none'
+
+
+def positive_number(text):
+    """ The finite positive number in text, or None """
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) and number > 0 else None
+
+
+def select_item(dropdown, name):
+    for item in dropdown.items:
+        item.selected = item.name == name
+
+
+def selected_item(dropdown):
+    return next((item.name for item in dropdown.items if item.selected), None)
+
 
 class ResourceConfigurationMenu():
     def __init__(self, plugin, settings):
         self.plugin = plugin
         self.settings = settings
-        self.response_config = ResponseConfigurationMenu(plugin, settings)
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self._response_config = None
+        self.menu = load_menu(MENU_PATH)
         self.menu.index = 4
 
         self.resource = None
@@ -37,6 +62,26 @@ class ResourceConfigurationMenu():
         self.ls_import_types = self.menu.root.find_node('Import Type List').get_content()
         self.btn_response_config = self.menu.root.find_node('Configure Button').get_content()
         self.btn_response_config.register_pressed_callback(self.open_response_config)
+        self.btn_credential_provider = self.menu.root.find_node('Credential Provider Button').get_content()
+        self.btn_credential_provider.register_pressed_callback(self.toggle_credential_provider)
+        self.inp_credential_ttl = self.menu.root.find_node('Credential TTL Input').get_content()
+        self.inp_credential_ttl.register_changed_callback(self.credential_ttl_changed)
+        self.dd_pagination_type = self.menu.root.find_node('Pagination Type Dropdown').get_content()
+        self.dd_pagination_type.register_item_clicked_callback(self.pagination_changed)
+        self.inp_pagination = self.menu.root.find_node('Pagination Options Input').get_content()
+        self.inp_pagination.register_submitted_callback(self.pagination_changed)
+        self.inp_max_size = self.menu.root.find_node('Max Size Input').get_content()
+        self.inp_max_size.register_changed_callback(self.max_size_changed)
+        self.dd_repeat_load = self.menu.root.find_node('Repeat Load Dropdown').get_content()
+        self.dd_repeat_load.register_item_clicked_callback(self.repeat_load_changed)
+        self.dd_upload_format = self.menu.root.find_node('Upload Format Dropdown').get_content()
+        self.dd_upload_format.register_item_clicked_callback(self.upload_changed)
+        self.dd_upload_source = self.menu.root.find_node('Upload Source Dropdown').get_content()
+        self.dd_upload_source.register_item_clicked_callback(self.upload_changed)
+        self.btn_upload_gzip = self.menu.root.find_node('Upload Gzip Button').get_content()
+        self.btn_upload_gzip.register_pressed_callback(self.toggle_upload_gzip)
+        self.inp_upload_field = self.menu.root.find_node('Upload Field Input').get_content()
+        self.inp_upload_field.register_submitted_callback(self.upload_changed)
         self.prepare_menu()
 
     def open_menu(self, resource):
@@ -44,6 +89,12 @@ class ResourceConfigurationMenu():
         self.set_resource(resource)
         self.plugin.update_menu(self.menu)
 
+    @property
+    def response_config(self):
+        if self._response_config is None:
+            self._response_config = ResponseConfigurationMenu(self.plugin, self.settings)
+        return self._response_config
+
     def open_response_config(self, button):
         self.response_config.open_menu(self.resource)
 
@@ -55,13 +106,17 @@ class ResourceConfigurationMenu():
             btn.register_pressed_callback(self.set_resource_method)
             self.ls_request_types.items.append(ln)
 
-        for import_type in ['.pdb', '.cif', '.sdf', '.mol', '.smi', '.pdf', '.nanome', '.json']:
+        for import_type in ['.pdb', '.cif', '.bcif', '.mmtf', '.sdf', '.mol', '.smi', '.pdf', '.nanome', '.json']:
             ln = nanome.ui.LayoutNode()
             ln.name = import_type
             btn = ln.add_new_button(import_type)
             btn.register_pressed_callback(self.set_resource_import_type)
             self.ls_import_types.items.append(ln)
 
+        for dropdown, names in [(self.dd_pagination_type, [NONE] + PAGINATION_TYPES), (self.dd_repeat_load, REPEAT_MODES),
+                (self.dd_upload_format, [NONE] + list(UPLOAD_FORMATS)), (self.dd_upload_source, UPLOAD_SOURCES)]:
+            dropdown.items = [nanome.ui.DropdownItem(name) for name in names]
+
     def set_resource(self, resource):
         self.resource = resource
         self.inp_resource_url.input_text = self.settings.get_resource_item(resource, 'url')
@@ -71,6 +126,20 @@ class ResourceConfigurationMenu():
         self.set_headers(self.settings.get_resource_item(resource, 'headers'))
         self.update_import_type()
         self.inp_post_data.input_text = self.settings.get_resource_item(resource, 'data')
+        self.btn_credential_provider.selected = bool(resource.get('credential provider'))
+        ttl = resource.get('credential ttl')
+        self.inp_credential_ttl.input_text = f'{ttl:g}' if ttl else ''
+        pagination_type, _, options = format_policy(resource.get('pagination')).partition(' ')
+        select_item(self.dd_pagination_type, pagination_type or NONE)
+        self.inp_pagination.input_text = options
+        max_size = resource.get('max size')
+        self.inp_max_size.input_text = f'{max_size / MEGABYTE:g}' if max_size else ''
+        select_item(self.dd_repeat_load, resource.get('repeat load', 'focus'))
+        upload = resource.get('upload') or {}
+        select_item(self.dd_upload_format, upload.get('format', NONE))
+        select_item(self.dd_upload_source, upload.get('source', 'workspace'))
+        self.btn_upload_gzip.selected = upload.get('gzip', False)
+        self.inp_upload_field.input_text = upload.get('field') or ''
         name = resource['name']
         self.menu.title = f"{name} {'Configuration' if len(name) < 16 else 'Config'}"
         self.plugin.update_menu(self.menu)
@@ -81,26 +150,30 @@ class ResourceConfigurationMenu():
             self.plugin.update_content(self.inp_resource_url)
 
     def resource_url_changed(self, text_input):
+        inputs = list(self.resource['input variables'])
         self.settings.change_resource(self.resource, new_url=text_input.input_text)
         self.plugin.resources_menu.refresh_resource_url(self.resource)
-        self.update_other_menus()
+        self.update_other_menus(inputs)
 
     def data_changed(self, text_input):
+        inputs = list(self.resource['input variables'])
         self.settings.change_resource(self.resource, new_data=text_input.input_text)
-        self.update_other_menus()
+        self.update_other_menus(inputs)
 
     def import_content_changed(self, text_input):
+        inputs = list(self.resource['input variables'])
         self.settings.change_resource(self.resource, new_import_content=text_input.input_text)
-        self.update_other_menus()
+        self.update_other_menus(inputs)
 
     def import_name_changed(self, text_input):
+        inputs = list(self.resource['input variables'])
         self.settings.change_resource(self.resource, new_import_name=text_input.input_text)
-        self.update_other_menus()
+        self.update_other_menus(inputs)
 
-    def update_other_menus(self):
-        if self.plugin.make_request.request:
-            if self.resource['references'].get(self.plugin.make_request.request['id']):
-                self.plugin.make_request.show_request()
+    def update_other_menus(self, old_inputs):
+        # requests only display input variables, nothing to refresh if those didn't change
+        if self.resource['input variables'] != old_inputs:
+            self.plugin.make_request.requests_changed(self.settings.requests_using_resource(self.resource))
 
     def add_step_dependency(self, step_element, reset=False):
         if reset:
@@ -153,12 +226,16 @@ class ResourceConfigurationMenu():
 
     def set_header(self, header_id, name_input, value_input, text_input):
         if name_input.input_text and value_input.input_text:
+            inputs = list(self.resource['input variables'])
             self.settings.set_header(self.resource, header_id, name_input.input_text, value_input.input_text)
+            self.update_other_menus(inputs)
 
     def delete_header(self, header_id, button):
+        inputs = list(self.resource['input variables'])
         if self.settings.delete_header(self.resource, header_id):
             self.ls_headers.items.remove(button.element)
             self.plugin.update_content(self.ls_headers)
+            self.update_other_menus(inputs)
 
     def set_resource_method(self, button=None):
         if self.resource:
@@ -176,4 +253,49 @@ class ResourceConfigurationMenu():
             self.update_import_type()
             self.plugin.update_content(button)
         else:
-            self.__plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Resource undefined")
\ No newline at end of file
+            self.__plugin.send_notification(nanome.util.enums.NotificationTypes.error, "Resource undefined")
+
+    def toggle_credential_provider(self, button):
+        self.resource['credential provider'] = not self.resource.get('credential provider')
+        button.selected = self.resource['credential provider']
+        self.plugin.update_content(button)
+
+    def credential_ttl_changed(self, text_input):
+        self.resource['credential ttl'] = positive_number(text_input.input_text)
+
+    def repeat_load_changed(self, dropdown, item):
+        # what loading a structure that is already in the workspace does
+        self.resource['repeat load'] = item.name
+
+    def max_size_changed(self, text_input):
+        megabytes = positive_number(text_input.input_text) or 0
+        self.resource['max size'] = int(megabytes * MEGABYTE) or None
+
+    def toggle_upload_gzip(self, button):
+        button.selected = not button.selected
+        self.plugin.update_content(button)
+        self.upload_changed()
+
+    def upload_changed(self, *args):
+        upload_format = selected_item(self.dd_upload_format)
+        if upload_format in (None, NONE):
+            self.resource['upload'] = None
+            return
+        self.resource['upload'] = {
+            'format': upload_format,
+            'source': selected_item(self.dd_upload_source) or 'workspace',
+            'gzip': self.btn_upload_gzip.selected,
+            'field': self.inp_upload_field.input_text.strip() or None
+        }
+
+    def pagination_changed(self, *args):
+        pagination_type = selected_item(self.dd_pagination_type)
+        if pagination_type in (None, NONE):
+            self.resource['pagination'] = None
+            return
+        try:
+            self.resource['pagination'] = parse_policy(f'{pagination_type} {self.inp_pagination.input_text}')
+        except ValueError as e:
+            self.plugin.send_notification(nanome.util.enums.NotificationTypes.error, f"{e}")
+            return
+        self.plugin.send_notification(nanome.util.enums.NotificationTypes.success, "Pagination updated")
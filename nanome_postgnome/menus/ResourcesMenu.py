@@ -5,20 +5,19 @@ import nanome
 from nanome.util import Logs
 
 from ..components import ListElement, ValueDisplayType
-from ..menus import ResourceConfigurationMenu
+from ..Templates import load_menu
 MENU_PATH = os.path.join(os.path.dirname(__file__), "json", "Resources.json")
 
 class ResourcesMenu():
     def __init__(self, plugin, settings):
         self.plugin = plugin
         self.settings = settings
-        self.config = ResourceConfigurationMenu(plugin, settings)
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self.menu = load_menu(MENU_PATH)
         self.menu.index = 3
 
         self.lst_resources = self.menu.root.find_node('Resources List').get_content()
         self.edit_variables = self.menu.root.find_node('Edit Variables').get_content()
-        self.edit_variables.register_pressed_callback(self.plugin.variables_menu.open_menu)
+        self.edit_variables.register_pressed_callback(lambda button: self.plugin.variables_menu.open_menu())
         self.btn_add_resource = self.menu.root.find_node('Add Resource').get_content()
         self.btn_add_resource.register_pressed_callback(partial(self.add_resource, 'get'))
 
@@ -29,6 +28,9 @@ class ResourcesMenu():
         self.menu.enabled = True
         self.plugin.update_menu(self.menu)
 
+    def open_config(self, resource):
+        self.plugin.resource_config.open_menu(resource)
+
     def delete_resource(self, resource, list_element):
         return self.settings.delete_resource(resource)
 
@@ -41,11 +43,11 @@ class ResourcesMenu():
         return False
 
     def change_resource(self, resource, list_element, new_url):
+        inputs = list(resource['input variables'])
         if self.settings.change_resource(resource, new_url=new_url):
-            self.config.refresh_resource_url()
-            if self.plugin.make_request.request:
-                if resource['references'].get(self.plugin.make_request.request.get('id')):
-                    self.plugin.make_request.show_request()
+            self.plugin.resource_config.refresh_resource_url()
+            if resource['input variables'] != inputs:
+                self.plugin.make_request.requests_changed(self.settings.requests_using_resource(resource))
             return True
         return False
 
@@ -53,7 +55,7 @@ class ResourcesMenu():
         name = f'Resource {len(self.settings.resource_ids)+1}'
         resource = self.settings.add_resource(name, '', method)
         delete = partial(self.delete_resource, resource)
-        open_config = partial(self.config.open_menu, resource)
+        open_config = partial(self.open_config, resource)
         el = ListElement(
             self.plugin,
             self.lst_resources,
@@ -85,11 +87,11 @@ class ResourcesMenu():
                 None,
                 ValueDisplayType.Mutable,
                 False,
-                self.config,
+                None,
                 deleted=partial(self.delete_resource, resource),
                 renamed=partial(self.rename_resource, resource),
                 revalued=partial(self.change_resource, resource),
-                config_opened=partial(self.config.open_menu, resource)
+                config_opened=partial(self.open_config, resource)
             )
             self.resource_elements[resource['id']] = el
             self.lst_resources.items.append(el)
@@ -1,30 +1,38 @@
 import os
+import threading
 import requests
 from requests.exceptions import HTTPError
 import json
 from collections import OrderedDict
-import xmltodict
 from functools import partial
 
 import nanome
 from nanome.util import Logs
 
 from ..components import ListElement
+from ..Templates import load_menu
 
 MENU_PATH = os.path.join(os.path.dirname(__file__), "json", "ResponseConfig.json")
 RESPONSE_SETUP = os.path.join(os.path.dirname(__file__), "json", "MakeRequest.json")
+# the preview of a response shows at most this many elements,
+PREVIEW_ELEMENTS = 200
+# the first elements of each list,
+PREVIEW_LIST_ITEMS = 20
+# and the start of long values
+PREVIEW_TEXT = 64
 
 class ResponseConfigurationMenu():
     def __init__(self, plugin, settings):
         self.plugin = plugin
         self.settings = settings
-        self.menu = nanome.ui.Menu.io.from_json(MENU_PATH)
+        self.menu = load_menu(MENU_PATH)
         self.menu.index = 5
         self.response_setup = nanome.ui.Menu(6, 'Response Setup')
         self.variable_confirm = nanome.ui.Menu(7, 'Confirm Variable Creation')
 
         self.resource = None
         self.response = None
+        self.preview_remaining = PREVIEW_ELEMENTS
 
         self.lst_response_elements = self.menu.root.find_node("Response Entry List").get_content()
         self.btn_refresh = self.menu.root.find_node("Refresh Button").get_content()
@@ -57,7 +65,7 @@ class ResponseConfigurationMenu():
     def get_and_set_response(self):
       try:
         if not self.response:
-          response = self.plugin.make_request.get_response(self.resource, [self.settings.variables])
+          response = self.plugin.make_request.runner.get_response(self.resource, [self.settings.variables])
           if response:
             response.raise_for_status()
             self.response = Response(text=response.text, headers=response.headers, status_code=response.status_code)
@@ -68,9 +76,18 @@ class ResponseConfigurationMenu():
         return None
 
     def show_hierarchy(self, button=None):
-      # Logs.debug('showing...')
-      self.lst_response_elements.items = []
+      if self.response:
+        self.draw_hierarchy()
+      else:
+        # uploads wait for the workspace's structures, which arrive on the plugin thread
+        threading.Thread(target=self.fetch_hierarchy, daemon=True).start()
+
+    def fetch_hierarchy(self):
       self.get_and_set_response()
+      self.draw_hierarchy()
+
+    def draw_hierarchy(self):
+      self.lst_response_elements.items = []
       response_object = self.settings.get_response_object(self.resource)
       # Logs.debug(f'response object is {response_object}')
       if not response_object:
@@ -80,11 +97,16 @@ class ResponseConfigurationMenu():
       self.response_setup.enabled = False
       self.plugin.update_menu(self.response_setup)
 
+      self.preview_remaining = PREVIEW_ELEMENTS
       self.draw_elements(response_object)
+      if self.preview_remaining <= 0:
+        self.create_button('... (preview truncated)', [], True)
       self.menu.enabled = True
       self.plugin.update_menu(self.menu)
       
     def draw_elements(self, obj, path=[]):
+      if self.preview_remaining <= 0:
+        return
       inputs = self.settings.get_inputs(self.resource)
       outputs = {uid:self.settings.variables[uid] for uid in self.resource['output variables'].keys()}
       Logs.debug(outputs)
@@ -100,23 +122,31 @@ class ResponseConfigurationMenu():
           Logs.debug(f"key:{key}, name_key:{name_key}")
           self.create_button(name_key, path, name_key!=key)
           self.draw_elements(value, path+[uid_key])
+          if self.preview_remaining <= 0:
+            return
       elif type(obj) is list:
-        for i, value in enumerate(obj):
+        for i, value in enumerate(obj[:PREVIEW_LIST_ITEMS]):
           self.create_button(str(i), path)
           self.draw_elements(value, path+[str(i)])
+          if self.preview_remaining <= 0:
+            return
+        if len(obj) > PREVIEW_LIST_ITEMS:
+          self.create_button(f'... {len(obj) - PREVIEW_LIST_ITEMS} more', path, True)
       else:
         self.create_button(str(obj), path)
 
     def create_button(self, text, json_path=None, disabled=False):
       ln = nanome.ui.LayoutNode()
       ln.set_padding(left=(len(json_path))*0.1)
-      btn = ln.add_new_button(text)
+      # the full value is kept as the button's name, for the variable it defines
+      btn = ln.add_new_button(text if len(text) <= PREVIEW_TEXT else text[:PREVIEW_TEXT] + '...')
       btn.name = text
       btn.json_path = json_path
       btn.text.horizontal_align = btn.HorizAlignOptions.Middle
       btn.register_pressed_callback(self.open_variable_setup)
       btn.unusable = disabled
       self.lst_response_elements.items.append(ln)
+      self.preview_remaining -= 1
 
     def open_variable_setup(self, button):
       self.variable_confirm.root.clear_children()
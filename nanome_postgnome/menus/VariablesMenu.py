@@ -89,14 +89,12 @@ class VariablesMenu():
 
     def rename_variable(self, list_element, text_input):
         self.settings.set_variable(list_element.var_id, text_input.input_text)
-        Logs.debug("variable is now...")
-        Logs.debug(self.settings.get_variable_by_id(list_element.var_id))
+        self.plugin.make_request.requests_changed(self.settings.requests_using_variable(list_element.var_id))
         return True
     
     def change_variable_value(self, list_element, new_value):
         self.settings.set_variable(list_element.var_id, None, new_value)
-        Logs.debug("variable is now...")
-        Logs.debug(self.settings.get_variable_by_id(list_element.var_id))
+        self.plugin.make_request.requests_changed(self.settings.requests_using_variable(list_element.var_id))
         return True
 
     def delete_variable(self, list_element):
@@ -0,0 +1,40 @@
+import os
+import json
+import tempfile
+
+
+class JSONBackend():
+    """ Stores all settings in a single settings.json document """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, 'settings.json')
+
+    def load(self, settings):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as settings_file:
+            for key, value in json.load(settings_file).items():
+                if key == 'variables':
+                    settings.variables.load(value)
+                elif key in ['variable_names', 'variable_values']:
+                    # rebuilt from variables by the store
+                    continue
+                else:
+                    setattr(settings, key, value)
+
+    def save(self, settings):
+        # the whole document is rewritten, changes are only taken so they don't pile up
+        changed, deleted = settings.variables.take_changes()
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as settings_file:
+                json.dump(dict(settings.generate_settings()), settings_file)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            # the previous settings.json stays in place
+            os.remove(temp_path)
+            settings.variables.restore_changes(changed, deleted)
+            raise
+
+    def close(self):
+        pass
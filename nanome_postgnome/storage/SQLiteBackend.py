@@ -0,0 +1,241 @@
+import os
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+from nanome.util import Logs
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS variables (uid TEXT PRIMARY KEY, name TEXT NOT NULL, value TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS variables_name ON variables (name);
+CREATE TABLE IF NOT EXISTS resources (id TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, body TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS resources_name ON resources (name);
+CREATE INDEX IF NOT EXISTS resources_position ON resources (position);
+CREATE TABLE IF NOT EXISTS headers (resource_id TEXT NOT NULL, id TEXT NOT NULL, position INTEGER NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (resource_id, id));
+CREATE TABLE IF NOT EXISTS requests (id TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, body TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS requests_name ON requests (name);
+CREATE INDEX IF NOT EXISTS requests_position ON requests (position);
+CREATE TABLE IF NOT EXISTS steps (request_id TEXT NOT NULL, position INTEGER NOT NULL, name TEXT NOT NULL, resource_id TEXT NOT NULL, body TEXT NOT NULL, PRIMARY KEY (request_id, position));
+CREATE INDEX IF NOT EXISTS steps_resource ON steps (resource_id);
+'''
+BATCH_SIZE = 500
+
+
+def serialize(row):
+    return json.dumps(row, sort_keys=True)
+
+
+class LazyTable(MutableMapping):
+    """ id -> row mapping that only reads a row from the database when it is accessed.\n
+        Keeps the serialized form of every row as last loaded or saved, so saving
+        can skip rows that did not change and never touches rows that were not loaded.
+    """
+
+    def __init__(self, ids, load_rows):
+        self.__ids = dict.fromkeys(ids)
+        self.__rows = {}
+        self.__load_rows = load_rows
+        # id -> serialized row, as stored
+        self.saved = {}
+        self.deleted = set()
+
+    def __getitem__(self, key):
+        if key not in self.__rows:
+            if key not in self.__ids:
+                raise KeyError(key)
+            self.__load([key])
+        return self.__rows[key]
+
+    def __setitem__(self, key, row):
+        self.__ids[key] = None
+        self.__rows[key] = row
+        self.deleted.discard(key)
+
+    def __delitem__(self, key):
+        del self.__ids[key]
+        self.__rows.pop(key, None)
+        self.saved.pop(key, None)
+        self.deleted.add(key)
+
+    def __iter__(self):
+        return iter(self.__ids)
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def __contains__(self, key):
+        return key in self.__ids
+
+    def items(self):
+        # listing everything, load what is missing in batches instead of row by row
+        self.__load([key for key in self.__ids if key not in self.__rows])
+        return [(key, self.__rows[key]) for key in self.__ids]
+
+    def values(self):
+        return [row for key, row in self.items()]
+
+    def loaded(self):
+        return list(self.__rows.items())
+
+    def __load(self, keys):
+        for i in range(0, len(keys), BATCH_SIZE):
+            for key, row in self.__load_rows(keys[i:i+BATCH_SIZE]).items():
+                self.__rows[key] = row
+                self.saved[key] = serialize(row)
+
+
+class SQLiteBackend():
+    """ Stores settings in settings.db, one row per variable, resource, header, request and step.\n
+        Resources and requests are loaded lazily and only rows that changed are written,
+        each save being a single transaction. An existing settings.json is migrated
+        the first time the database is created.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, 'settings.db')
+        self.json_path = os.path.join(directory, 'settings.json')
+        migrate = not os.path.exists(self.path) and os.path.exists(self.json_path)
+        self.__lock = threading.RLock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.__positions = {'resources': [], 'requests': []}
+        if migrate:
+            self.migrate(self.json_path)
+
+    def load(self, settings):
+        with self.__lock:
+            variables = {uid: [name, json.loads(value)] for uid, name, value in self.db.execute('SELECT uid, name, value FROM variables')}
+            settings.variables.load(variables)
+            settings.resource_ids = [r[0] for r in self.db.execute('SELECT id FROM resources ORDER BY position')]
+            settings.resources = LazyTable(settings.resource_ids, self.load_resources)
+            settings.request_ids = [r[0] for r in self.db.execute('SELECT id FROM requests ORDER BY position')]
+            settings.requests = LazyTable(settings.request_ids, self.load_requests)
+            self.__positions = {'resources': list(settings.resource_ids), 'requests': list(settings.request_ids)}
+
+    def load_resources(self, ids):
+        with self.__lock:
+            marks = ','.join('?' * len(ids))
+            resources = {}
+            for r_id, body in self.db.execute(f'SELECT id, body FROM resources WHERE id IN ({marks})', ids):
+                resource = json.loads(body)
+                resource['header ids'] = []
+                resource['headers'] = {}
+                resources[r_id] = resource
+            query = f'SELECT resource_id, id, name, value FROM headers WHERE resource_id IN ({marks}) ORDER BY resource_id, position'
+            for r_id, h_id, name, value in self.db.execute(query, ids):
+                resources[r_id]['header ids'].append(h_id)
+                resources[r_id]['headers'][h_id] = [name, value]
+            return resources
+
+    def load_requests(self, ids):
+        with self.__lock:
+            marks = ','.join('?' * len(ids))
+            requests = {}
+            for r_id, body in self.db.execute(f'SELECT id, body FROM requests WHERE id IN ({marks})', ids):
+                request = json.loads(body)
+                request['steps'] = []
+                requests[r_id] = request
+            query = f'SELECT request_id, name, resource_id, body FROM steps WHERE request_id IN ({marks}) ORDER BY request_id, position'
+            for r_id, name, resource_id, body in self.db.execute(query, ids):
+                step = json.loads(body)
+                step['name'] = name
+                step['resource'] = resource_id
+                requests[r_id]['steps'].append(step)
+            return requests
+
+    def save(self, settings):
+        with self.__lock:
+            changed, deleted = settings.variables.take_changes()
+            try:
+                with self.db:
+                    self.db.executemany('INSERT OR REPLACE INTO variables VALUES (?, ?, ?)', [(v.uid, v.name, json.dumps(v.value)) for v in changed])
+                    self.db.executemany('DELETE FROM variables WHERE uid = ?', [(uid,) for uid in deleted])
+                    if not isinstance(settings.resources, LazyTable):
+                        settings.resources = self.__adopt(settings.resources, 'resources')
+                    if not isinstance(settings.requests, LazyTable):
+                        settings.requests = self.__adopt(settings.requests, 'requests')
+                    saved = [
+                        self.__save_table(settings.resources, settings.resource_ids, 'resources', self.write_resource, 'headers', 'resource_id'),
+                        self.__save_table(settings.requests, settings.request_ids, 'requests', self.write_request, 'steps', 'request_id')
+                    ]
+            except BaseException:
+                # the transaction was rolled back, so everything is written again next time
+                settings.variables.restore_changes(changed, deleted)
+                raise
+            for mark_saved in saved:
+                mark_saved()
+
+    def __adopt(self, rows, name):
+        # the dict was replaced wholesale, so every row is written and stored rows it lacks are deleted
+        table = LazyTable([], self.load_resources if name == 'resources' else self.load_requests)
+        for r_id, row in rows.items():
+            table[r_id] = row
+        table.deleted.update(r_id for r_id in self.__positions[name] if r_id not in rows)
+        return table
+
+    def __save_table(self, table, ids, name, write, child_table, child_key):
+        """ Writes the rows of a table that changed, returning a function
+            that records them as saved once the transaction is committed
+        """
+        deleted = list(table.deleted)
+        for r_id in deleted:
+            self.db.execute(f'DELETE FROM {name} WHERE id = ?', (r_id,))
+            self.db.execute(f'DELETE FROM {child_table} WHERE {child_key} = ?', (r_id,))
+        positions = {r_id: i for i, r_id in enumerate(ids)}
+        written = {}
+        for r_id, row in table.loaded():
+            serialized = serialize(row)
+            if table.saved.get(r_id) != serialized:
+                write(row, positions.get(r_id, len(positions)))
+                written[r_id] = serialized
+        moved = ids != self.__positions[name]
+        if moved:
+            self.db.executemany(f'UPDATE {name} SET position = ? WHERE id = ?', [(i, r_id) for r_id, i in positions.items()])
+        order = list(ids)
+
+        def mark_saved():
+            table.deleted.difference_update(deleted)
+            table.saved.update(written)
+            if moved:
+                self.__positions[name] = order
+        return mark_saved
+
+    def write_resource(self, resource, position):
+        body = {k: v for k, v in resource.items() if k not in ['headers', 'header ids']}
+        self.db.execute('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)', (resource['id'], position, resource['name'], json.dumps(body)))
+        self.db.execute('DELETE FROM headers WHERE resource_id = ?', (resource['id'],))
+        headers = [(resource['id'], h_id, i, *resource['headers'][h_id]) for i, h_id in enumerate(resource['header ids'])]
+        self.db.executemany('INSERT INTO headers VALUES (?, ?, ?, ?, ?)', headers)
+
+    def write_request(self, request, position):
+        body = {k: v for k, v in request.items() if k != 'steps'}
+        self.db.execute('INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?)', (request['id'], position, request['name'], json.dumps(body)))
+        self.db.execute('DELETE FROM steps WHERE request_id = ?', (request['id'],))
+        steps = []
+        for i, step in enumerate(request['steps']):
+            step_body = {k: v for k, v in step.items() if k not in ['name', 'resource']}
+            steps.append((request['id'], i, step['name'], step['resource'], json.dumps(step_body)))
+        self.db.executemany('INSERT INTO steps VALUES (?, ?, ?, ?, ?)', steps)
+
+    def migrate(self, json_path):
+        """ Imports an existing settings.json into the database in one transaction """
+        with open(json_path, 'r') as settings_file:
+            settings = json.load(settings_file)
+        with self.__lock, self.db:
+            variables = settings.get('variables', {})
+            self.db.executemany('INSERT OR REPLACE INTO variables VALUES (?, ?, ?)',
+                [(uid, name, json.dumps(value)) for uid, (name, value) in variables.items()])
+            resources = settings.get('resources', {})
+            for i, r_id in enumerate(settings.get('resource_ids', [])):
+                if r_id in resources:
+                    self.write_resource(resources[r_id], i)
+            requests = settings.get('requests', {})
+            for i, r_id in enumerate(settings.get('request_ids', [])):
+                if r_id in requests:
+                    self.write_request(requests[r_id], i)
+        Logs.message(f'migrated {json_path} to {self.path}')
+
+    def close(self):
+        with self.__lock:
+            self.db.close()
@@ -0,0 +1,2 @@
+from .JSONBackend import JSONBackend
+from .SQLiteBackend import SQLiteBackend
@@ -0,0 +1,6 @@
+import sys
+
+from nanome_postgnome import Headless
+
+if __name__ == '__main__':
+    sys.exit(Headless.main())
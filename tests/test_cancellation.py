@@ -0,0 +1,29 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('nanome')
+
+from nanome_postgnome.engine.Cancellation import CancelToken, RequestCancelled
+
+
+def test_results_are_returned_once_ready():
+    future = Future()
+    threading.Timer(0.05, future.set_result, ['done']).start()
+    assert CancelToken().result(future, timeout=5) == 'done'
+
+
+def test_cancelling_stops_the_wait_and_the_future():
+    token, future = CancelToken(), Future()
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(RequestCancelled):
+        token.result(future)
+    assert future.cancelled()
+
+
+def test_waits_time_out():
+    future = Future()
+    with pytest.raises(TimeoutError):
+        CancelToken().result(future, timeout=0.05)
+    assert future.cancelled()
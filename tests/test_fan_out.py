@@ -0,0 +1,114 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip('nanome')
+pytest.importorskip('requests')
+
+from nanome_postgnome.Settings import Settings
+from nanome_postgnome.engine import Progress, RequestRun, RequestRunner
+from nanome_postgnome.engine.Scheduler import BATCH
+
+
+class Handler(BaseHTTPRequestHandler):
+    summaries = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/search':
+            body = {'ids': ['a', 'b', 'c']}
+        elif url.path.startswith('/item/'):
+            body = {'name': 'item-' + url.path.rsplit('/', 1)[1]}
+        elif url.path == '/summary':
+            self.summaries.append(parse_qs(url.query)['names'][0])
+            body = {'count': 3}
+        elif url.path.startswith('/structure/'):
+            self.send_text(f"HEADER    {url.path.rsplit('/', 1)[1]}\nEND\n")
+            return
+        else:
+            self.send_error(404)
+            return
+        self.send_text(json.dumps(body), 'application/json')
+
+    def send_text(self, text, content_type='text/plain'):
+        data = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    Handler.summaries = []
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_step_after_fan_out_sees_its_list(server, tmp_path):
+    settings = Settings(directory=str(tmp_path))
+    search = settings.add_resource('search', server + '/search')
+    settings.set_output_variable(search, None, 'ids', ['root', 'ids'])
+    item = settings.add_resource('item', server + '/item/{{id}}')
+    settings.set_output_variable(item, None, 'names', ['root', 'name'])
+    summary = settings.add_resource('summary', server + '/summary?names={{names}}')
+    settings.set_output_variable(summary, None, 'count', ['root', 'count'])
+
+    request = settings.add_request('chain')
+    settings.add_step(request['id'], 'search', search['id'])
+    fan_out = settings.add_step(request['id'], 'items', item['id'])
+    settings.set_fan_out(fan_out, 'ids', 'id')
+    settings.add_step(request['id'], 'summary', summary['id'])
+
+    fields = {name: '' for name, _ in settings.get_inputs(request).values()}
+    runner = RequestRunner(settings, priority=BATCH)
+    try:
+        results = runner.run_steps(request, RequestRun(Progress()), fields)
+    finally:
+        runner.tempdir.cleanup()
+
+    assert results is not None
+    assert json.loads(results['items']) == ['item-a', 'item-b', 'item-c']
+    assert [json.loads(names) for names in Handler.summaries] == [['item-a', 'item-b', 'item-c']]
+    assert json.loads(settings.get_variable_by_name('names')) == ['item-a', 'item-b', 'item-c']
+    assert settings.get_variable_by_name('count') == 3
+
+
+def test_imports_get_the_response_as_received(server, tmp_path):
+    settings = Settings(directory=str(tmp_path))
+    search = settings.add_resource('search', server + '/search')
+    settings.set_output_variable(search, None, 'ids', ['root', 'ids'])
+    structure = settings.add_resource('structure', server + '/structure/{{id}}', import_type='.pdb')
+    settings.set_resource_item(structure, 'import name', '{{id}}')
+    single = settings.add_resource('single', server + '/structure/x', import_type='.pdb')
+    single['import name'] = 'x'
+
+    request = settings.add_request('structures')
+    settings.add_step(request['id'], 'search', search['id'])
+    fan_out = settings.add_step(request['id'], 'structures', structure['id'])
+    settings.set_fan_out(fan_out, 'ids', 'id')
+    settings.add_step(request['id'], 'structure', single['id'])
+
+    imported = {}
+    def importer(name, import_type, contents, metadata, body=None, cancel=None, progress=None, repeat=None):
+        imported.setdefault(name, []).append(contents if body is None else body.text())
+    fields = {name: '' for name, _ in settings.get_inputs(request).values()}
+    runner = RequestRunner(settings, priority=BATCH, importer=importer)
+    try:
+        runner.run_steps(request, RequestRun(Progress()), fields)
+    finally:
+        runner.tempdir.cleanup()
+
+    # the text as served, not the JSON wrapping outputs are read from
+    assert imported == {name: [f'HEADER    {name}\nEND\n'] for name in ['a', 'b', 'c', 'x']}
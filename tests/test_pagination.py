@@ -0,0 +1,130 @@
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('nanome')
+requests = pytest.importorskip('requests')
+
+from nanome_postgnome.engine.Pagination import format_policy, paginate, parse_policy, query_value
+from nanome_postgnome.engine.RequestRun import RenderedRequest, RequestRun
+
+
+def page(document, headers=None):
+    """ A response as RequestRunner.read leaves it, the document wrapped in root """
+    response = requests.Response()
+    response.status_code = 200
+    response.headers.update(headers or {})
+    response._content = bytes(json.dumps({'root': document}), 'utf-8')
+    response.encoding = 'utf-8'
+    response.body = None
+    return response
+
+
+class Pages():
+    """ A fetch answering urls from a dict of url -> (document, headers), recording what it fetched """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def __call__(self, rendered):
+        with self.lock:
+            self.fetched.append(rendered.url)
+        if rendered.url not in self.pages:
+            raise ConnectionError(rendered.url)
+        document, headers = self.pages[rendered.url]
+        return page(document, headers)
+
+
+def get(url):
+    return RenderedRequest.create('get', url, {}, '')
+
+
+def items_of(response):
+    return json.loads(response.text)['root']['results']
+
+
+def test_policies_parse_and_format_back():
+    spec = 'offset items=root.data total=root.total limit=2 offset_param=start'
+    policy = parse_policy(spec)
+    assert policy == {'type': 'offset', 'items': ['root', 'data'], 'total': ['root', 'total'], 'limit': 2, 'offset param': 'start'}
+    assert parse_policy(format_policy(policy)) == policy
+    assert parse_policy('') is None
+
+
+@pytest.mark.parametrize('spec', ['pages items=root', 'link', 'next items=root.results', 'link items=root.results size=2'])
+def test_invalid_policies_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_policy(spec)
+
+
+def test_offset_pages_are_merged_in_order():
+    url = 'https://example.com/search?q=x&offset={}&limit=2'
+    fetch = Pages({url.format(offset): ({'total': 5, 'results': list(range(offset, min(offset + 2, 5)))}, {})
+        for offset in [0, 2, 4]})
+    merged = paginate(parse_policy('offset items=root.results total=root.total limit=2'), get('https://example.com/search?q=x'), fetch)
+    assert items_of(merged) == [0, 1, 2, 3, 4]
+    assert sorted(int(query_value(fetched, 'offset')) for fetched in fetch.fetched) == [0, 2, 4]
+
+
+def test_offset_pages_without_a_total_stop_at_a_short_page():
+    url = 'https://example.com/search?offset={}&limit=2'
+    fetch = Pages({url.format(0): ({'results': [0, 1]}, {}), url.format(2): ({'results': [2, 3]}, {}),
+        url.format(4): ({'results': [4]}, {})})
+    merged = paginate(parse_policy('offset items=root.results limit=2'), get('https://example.com/search'), fetch)
+    assert items_of(merged) == [0, 1, 2, 3, 4]
+    assert len(fetch.fetched) == 3
+
+
+def test_cursors_and_next_urls_are_followed():
+    fetch = Pages({
+        'https://example.com/items': ({'results': ['a'], 'next': 'abc'}, {}),
+        'https://example.com/items?page_token=abc': ({'results': ['b'], 'next': '/items?page_token=def'}, {}),
+        'https://example.com/items?page_token=def': ({'results': ['c'], 'next': None}, {}),
+    })
+    policy = parse_policy('next next=root.next items=root.results cursor=page_token')
+    assert items_of(paginate(policy, get('https://example.com/items'), fetch)) == ['a', 'b', 'c']
+
+
+def test_link_headers_are_followed_until_a_page_repeats():
+    fetch = Pages({
+        'https://example.com/items': ({'results': [1]}, {'Link': '<https://example.com/items?page=2>; rel="next"'}),
+        'https://example.com/items?page=2': ({'results': [2]}, {'Link': '</items?page=1>; rel="prev", </items>; rel="next"'}),
+    })
+    assert items_of(paginate(parse_policy('link items=root.results'), get('https://example.com/items'), fetch)) == [1, 2]
+    assert len(fetch.fetched) == 2
+
+
+def test_a_failing_page_keeps_the_pages_before_it():
+    fetch = Pages({'https://example.com/items': ({'results': [1], 'next': 'https://example.com/items?page=2'}, {})})
+    merged = paginate(parse_policy('next next=root.next items=root.results'), get('https://example.com/items'), fetch)
+    assert items_of(merged) == [1]
+
+
+def test_max_pages_bounds_the_merge():
+    fetch = Pages({f'https://example.com/items?cursor={i}': ({'results': [i], 'next': i + 1}, {}) for i in range(10)})
+    policy = parse_policy('next next=root.next items=root.results max_pages=3')
+    assert items_of(paginate(policy, get('https://example.com/items?cursor=0'), fetch)) == [0, 1, 2]
+
+
+def test_documents_without_the_items_list_are_returned_as_they_are():
+    fetch = Pages({'https://example.com/items': ({'error': 'not found'}, {})})
+    response = paginate(parse_policy('link items=root.results'), get('https://example.com/items'), fetch)
+    assert json.loads(response.text) == {'root': {'error': 'not found'}}
+
+
+def test_the_shared_first_page_is_left_untouched():
+    fetch = Pages({
+        'https://example.com/items': ({'results': [1], 'next': 'https://example.com/items?page=2'}, {}),
+        'https://example.com/items?page=2': ({'results': [2]}, {}),
+    })
+    policy = parse_policy('next next=root.next items=root.results')
+    run = RequestRun()
+    # steps of a run that render to the same request share its first page
+    shared = lambda rendered: run.fetch(rendered, fetch)
+    first = paginate(policy, get('https://example.com/items'), shared)
+    second = paginate(policy, get('https://example.com/items'), shared)
+    assert items_of(first) == items_of(second) == [1, 2]
+    assert items_of(run.fetch(get('https://example.com/items'), fetch)) == [1]
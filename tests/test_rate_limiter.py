@@ -0,0 +1,77 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+pytest.importorskip('nanome')
+
+from nanome_postgnome.engine.RateLimiter import (HostLimiter, MAX_RETRY_AFTER, RateLimits, UnlimitedHost,
+    parse_limit, retry_after)
+
+
+def test_entries_apply_to_subdomains_and_star_to_the_rest():
+    limits = RateLimits('rcsb.org=10/20:4,*=5')
+    limiter = limits.for_url('https://files.rcsb.org/download/1abc.pdb')
+    assert (limiter.rate, limiter.burst, limiter.max_concurrency) == (10.0, 20.0, 4)
+    assert limits.for_url('https://pubchem.ncbi.nlm.nih.gov/').rate == 5.0
+    # one budget per host, created on first use
+    assert limits.for_url('https://files.rcsb.org/download/2abc.pdb') is limiter
+
+
+def test_hosts_without_an_entry_are_unlimited():
+    limits = RateLimits('rcsb.org=10')
+    assert isinstance(limits.for_url('https://example.com/'), UnlimitedHost)
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'nan', 'inf', '5/0', '5:0', 'fast'])
+def test_limits_that_are_not_positive_are_rejected(limit):
+    with pytest.raises(ValueError):
+        parse_limit(limit)
+    # the entry is skipped, leaving its host unlimited
+    assert isinstance(RateLimits(f'rcsb.org={limit}').for_url('https://rcsb.org/'), UnlimitedHost)
+
+
+def test_host_limiter_needs_a_positive_rate():
+    with pytest.raises(ValueError):
+        HostLimiter('rcsb.org', rate=0)
+
+
+def test_token_bucket_holds_requests_past_the_burst():
+    limiter = HostLimiter('rcsb.org', rate=20, burst=2)
+    started = time.monotonic()
+    for _ in range(2):
+        with limiter:
+            pass
+    assert time.monotonic() - started < 0.04
+    with limiter:
+        pass
+    assert time.monotonic() - started >= 0.04
+
+
+def test_backoff_halves_concurrency_and_successes_grow_it_back():
+    limiter = HostLimiter('rcsb.org', rate=100, max_concurrency=3)
+    assert limiter.limit == 2
+    assert limiter.feedback(429, {'Retry-After': '0'}) == 0
+    assert limiter.limit == 1
+    assert limiter.feedback(200, {}) is None
+    assert limiter.limit == 2
+    for _ in range(10):
+        limiter.feedback(200, {})
+    assert limiter.limit == 3
+
+
+def test_retry_after_reads_delays_and_dates():
+    assert retry_after({'Retry-After': '2.5'}, 1.0) == 2.5
+    assert retry_after({}, 1.0) == 1.0
+    assert retry_after({'Retry-After': 'soon'}, 1.0) == 1.0
+    assert retry_after({'Retry-After': '3600'}, 1.0) == MAX_RETRY_AFTER
+    in_ten = retry_after({'Retry-After': formatdate(time.time() + 10, usegmt=True)}, 1.0)
+    assert 8 <= in_ten <= 10
+
+
+def test_unlimited_hosts_still_report_retry_after():
+    host = UnlimitedHost('example.com')
+    with host:
+        pass
+    assert host.feedback(503, {'Retry-After': '5'}) == 5.0
+    assert host.feedback(200, {}) is None
@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+pytest.importorskip('nanome')
+
+from nanome_postgnome.Settings import Settings
+from nanome_postgnome.storage.SQLiteBackend import LazyTable, SQLiteBackend
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('POSTGNOME_SETTINGS_BACKEND', 'sqlite')
+    yield str(tmp_path)
+
+
+@pytest.fixture
+def stored(directory):
+    settings = Settings(directory=directory)
+    settings.set_variable(name='pdb', value='1abc')
+    first = settings.add_resource('first', 'https://files.rcsb.org/download/{{pdb}}.pdb', headers={'Accept': 'text/plain'})
+    second = settings.add_resource('second', 'https://example.com/')
+    request = settings.add_request('load')
+    settings.add_step(request['id'], 'download', first['id'])
+    settings.save_settings()
+    settings.backend.close()
+    yield first, second, request
+
+
+def reopen(directory):
+    settings = Settings(directory=directory)
+    writes = []
+    # record the rows each save writes, by name
+    for write in ['write_resource', 'write_request']:
+        original = getattr(settings.backend, write)
+        def recorded(row, position, original=original):
+            writes.append(row['name'])
+            original(row, position)
+        setattr(settings.backend, write, recorded)
+    return settings, writes
+
+
+def test_settings_round_trip(directory, stored):
+    first, second, request = stored
+    settings, _ = reopen(directory)
+    assert settings.get_variable_by_name('pdb') == '1abc'
+    assert settings.resource_ids == [first['id'], second['id']]
+    assert settings.resources[first['id']] == first
+    assert settings.requests[request['id']]['steps'] == request['steps']
+
+
+def test_rows_are_loaded_when_accessed(directory, stored):
+    first, second, request = stored
+    settings, _ = reopen(directory)
+    assert isinstance(settings.resources, LazyTable)
+    assert settings.resources.loaded() == []
+    settings.resources[second['id']]
+    assert [r_id for r_id, _ in settings.resources.loaded()] == [second['id']]
+    assert len(settings.resources.values()) == 2
+
+
+def test_only_changed_rows_are_written(directory, stored):
+    first, second, request = stored
+    settings, writes = reopen(directory)
+    settings.resources[first['id']]
+    settings.resources[second['id']]['url'] = 'https://example.org/'
+    settings.save_settings()
+    assert writes == ['second']
+    settings.save_settings()
+    assert writes == ['second']
+    assert reopen(directory)[0].resources[second['id']]['url'] == 'https://example.org/'
+
+
+def test_deletes_and_moves_are_saved(directory, stored):
+    first, second, request = stored
+    settings, writes = reopen(directory)
+    settings.resource_ids.reverse()
+    settings.delete_request(request['id'])
+    settings.save_settings()
+    # only the resource whose step went away, for its references
+    assert writes == ['first']
+    settings, _ = reopen(directory)
+    assert settings.resource_ids == [second['id'], first['id']]
+    assert settings.request_ids == []
+
+
+def test_replaced_tables_drop_rows_they_lack(directory, stored):
+    first, second, request = stored
+    settings, writes = reopen(directory)
+    settings.resources = {second['id']: dict(settings.resources[second['id']])}
+    settings.resource_ids = [second['id']]
+    settings.save_settings()
+    assert writes == ['second']
+    assert reopen(directory)[0].resource_ids == [second['id']]
+
+
+def test_failed_saves_keep_the_changes(directory, stored):
+    first, second, request = stored
+    settings, writes = reopen(directory)
+    write_resource = settings.backend.write_resource
+
+    def fail(resource, position):
+        raise OSError('disk full')
+    settings.backend.write_resource = fail
+    settings.set_variable(name='pdb', value='2xyz')
+    settings.resources[first['id']]['name'] = 'renamed'
+    with pytest.raises(OSError):
+        settings.save_settings()
+    # the transaction was rolled back
+    assert reopen(directory)[0].get_variable_by_name('pdb') == '1abc'
+
+    settings.backend.write_resource = write_resource
+    settings.save_settings()
+    saved, _ = reopen(directory)
+    assert saved.get_variable_by_name('pdb') == '2xyz'
+    assert saved.resources[first['id']]['name'] == 'renamed'
+
+
+def test_settings_json_is_migrated_once(directory):
+    settings = {
+        'variables': {'uid-1': ['pdb', '1abc']},
+        'resource_ids': ['r-1'],
+        'resources': {'r-1': {'id': 'r-1', 'name': 'download', 'url': 'https://example.com/{{pdb}}',
+            'header ids': ['h-1'], 'headers': {'h-1': ['Accept', 'text/plain']}}},
+        'request_ids': ['q-1'],
+        'requests': {'q-1': {'id': 'q-1', 'name': 'load', 'steps': [{'name': 'download', 'resource': 'r-1'}]}},
+    }
+    with open(f'{directory}/settings.json', 'w') as settings_file:
+        json.dump(settings, settings_file)
+    backend = SQLiteBackend(directory)
+    backend.close()
+
+    migrated = Settings(directory=directory)
+    assert migrated.get_variable_by_name('pdb') == '1abc'
+    assert migrated.resources['r-1'] == settings['resources']['r-1']
+    assert migrated.requests['q-1'] == settings['requests']['q-1']
+    migrated.set_variable(name='pdb', value='2xyz')
+    migrated.save_settings()
+    # settings.json is left alone, and not read again
+    assert Settings(directory=directory).get_variable_by_name('pdb') == '2xyz'
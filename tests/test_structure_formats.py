@@ -0,0 +1,181 @@
+import io
+import struct
+
+import pytest
+
+pytest.importorskip('nanome')
+msgpack = pytest.importorskip('msgpack')
+
+from nanome_postgnome.formats import BinaryCIF, MMTF, complex_from_bcif, complex_from_mmtf
+
+
+def int8(*values):
+    return struct.pack(f'<{len(values)}b', *values)
+
+
+def int32(*values):
+    return struct.pack(f'<{len(values)}i', *values)
+
+
+def mmtf_field(codec, length, param, data):
+    return struct.pack('>iii', codec, length, param) + data
+
+
+def atoms_of(complex):
+    return [(atom.chain.name, atom.residue.name, atom.residue.serial, atom.name, atom.symbol,
+        round(atom.position.x, 3), round(atom.position.y, 3), round(atom.position.z, 3), atom.is_het)
+        for atom in complex.atoms]
+
+
+# BinaryCIF
+
+def test_bcif_integer_packing_sums_values_at_the_type_limits():
+    encoding = [{'kind': 'IntegerPacking', 'byteCount': 1, 'isUnsigned': False, 'srcSize': 3},
+        {'kind': 'ByteArray', 'type': 1}]
+    assert BinaryCIF.decode(int8(1, 127, 3, -128, -128, -5, 7), encoding) == [1, 130, -261]
+
+
+def test_bcif_delta_of_run_length():
+    encoding = [{'kind': 'Delta', 'origin': 10, 'srcType': 3}, {'kind': 'RunLength', 'srcType': 3, 'srcSize': 4},
+        {'kind': 'ByteArray', 'type': 3}]
+    assert BinaryCIF.decode(int32(5, 3, 1, 1), encoding) == [15, 20, 25, 26]
+
+
+def test_bcif_fixed_point():
+    encoding = [{'kind': 'FixedPoint', 'factor': 1000, 'srcType': 33}, {'kind': 'ByteArray', 'type': 3}]
+    assert BinaryCIF.decode(int32(12345, -500), encoding) == [12.345, -0.5]
+
+
+def test_bcif_string_array_maps_indices_to_strings():
+    encoding = [{'kind': 'StringArray', 'stringData': 'ALAGLYHOH',
+        'offsets': int32(0, 3, 6, 9), 'offsetEncoding': [{'kind': 'ByteArray', 'type': 3}],
+        'dataEncoding': [{'kind': 'ByteArray', 'type': 1}]}]
+    assert BinaryCIF.decode(int8(0, 1, 1, 2, -1), encoding) == ['ALA', 'GLY', 'GLY', 'HOH', '']
+
+
+def test_bcif_unknown_encodings_are_rejected():
+    with pytest.raises(ValueError):
+        BinaryCIF.decode(b'', [{'kind': 'Huffman'}])
+
+
+def bcif_strings(name, values):
+    strings = sorted(set(values))
+    offsets = [0]
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    return bcif_column(name, int32(*[strings.index(value) for value in values]), [{'kind': 'StringArray',
+        'stringData': ''.join(strings), 'offsets': int32(*offsets), 'offsetEncoding': [{'kind': 'ByteArray', 'type': 3}],
+        'dataEncoding': [{'kind': 'ByteArray', 'type': 3}]}])
+
+
+def bcif_column(name, data, encoding, mask=None):
+    return {'name': name, 'data': {'data': data, 'encoding': encoding}, 'mask': mask}
+
+
+def bcif_fixed(name, values):
+    return bcif_column(name, int32(*[round(value * 1000) for value in values]),
+        [{'kind': 'FixedPoint', 'factor': 1000, 'srcType': 33}, {'kind': 'ByteArray', 'type': 3}])
+
+
+BCIF = msgpack.packb({'version': '0.3.0', 'encoder': 'tests', 'dataBlocks': [{'header': '1ABC', 'categories': [
+    {'name': '_atom_site', 'rowCount': 3, 'columns': [
+        bcif_strings('group_PDB', ['ATOM', 'ATOM', 'HETATM']),
+        bcif_column('id', int32(1, 2, 3), [{'kind': 'ByteArray', 'type': 3}]),
+        bcif_strings('type_symbol', ['N', 'C', 'O']),
+        bcif_strings('label_atom_id', ['N', 'CA', 'O']),
+        bcif_strings('label_comp_id', ['ALA', 'ALA', 'HOH']),
+        bcif_strings('auth_asym_id', ['A', 'A', 'A']),
+        bcif_column('auth_seq_id', int32(1, 1, 0, 1, 1, 1), [{'kind': 'Delta', 'origin': 0, 'srcType': 3},
+            {'kind': 'RunLength', 'srcType': 3, 'srcSize': 3}, {'kind': 'ByteArray', 'type': 3}]),
+        bcif_fixed('Cartn_x', [1.5, 2.25, -3.0]),
+        bcif_fixed('Cartn_y', [0.0, 1.0, 2.0]),
+        bcif_fixed('Cartn_z', [-1.0, -2.0, 10.125]),
+        bcif_fixed('B_iso_or_equiv', [20.0, 99.0, 30.0]) | {'mask': {'data': int8(0, 1, 0),
+            'encoding': [{'kind': 'ByteArray', 'type': 1}]}},
+    ]}
+]}]})
+
+
+def test_bcif_atom_site_becomes_a_complex():
+    complex = complex_from_bcif(io.BytesIO(BCIF))
+    assert complex.name == '1ABC'
+    assert atoms_of(complex) == [
+        ('A', 'ALA', 1, 'N', 'N', 1.5, 0.0, -1.0, False),
+        ('A', 'ALA', 1, 'CA', 'C', 2.25, 1.0, -2.0, False),
+        ('A', 'HOH', 2, 'O', 'O', -3.0, 2.0, 10.125, True),
+    ]
+    # masked values are missing, whatever the data holds
+    assert [atom.bfactor for atom in complex.atoms] == [20.0, 0.0, 30.0]
+    assert [atom.occupancy for atom in complex.atoms] == [1.0, 1.0, 1.0]
+
+
+# MMTF
+
+@pytest.mark.parametrize('codec, param, data, expected', [
+    (1, 0, struct.pack('>2f', 1.5, -2.0), [1.5, -2.0]),
+    (2, 0, struct.pack('>3b', 1, -1, 5), [1, -1, 5]),
+    (4, 0, struct.pack('>2i', 70000, -3), [70000, -3]),
+    (5, 4, b'A\x00\x00\x00BB\x00\x00', ['A', 'BB']),
+    (6, 0, struct.pack('>4i', ord('A'), 2, 0, 1), ['A', 'A', '']),
+    (7, 0, struct.pack('>2i', 9, 3), [9, 9, 9]),
+    (8, 0, struct.pack('>4i', 1, 3, 5, 1), [1, 2, 3, 8]),
+    (9, 10, struct.pack('>2i', 15, 2), [1.5, 1.5]),
+    (10, 1000, struct.pack('>4h', 1000, 32767, 1, -500), [1.0, 33.768, 33.268]),
+    (11, 100, struct.pack('>2h', 150, -25), [1.5, -0.25]),
+    (12, 100, struct.pack('>3h', 32767, 3, 7), [327.7, 0.07]),
+    (13, 10, struct.pack('>3b', 127, 1, -4), [12.8, -0.4]),
+    (14, 0, struct.pack('>3h', -32768, -2, 4), [-32770, 4]),
+    (15, 0, struct.pack('>3b', 127, 127, 2), [256]),
+])
+def test_mmtf_codecs(codec, param, data, expected):
+    decoded = MMTF.decode(mmtf_field(codec, len(expected), param, data))
+    assert [round(value, 3) if isinstance(value, float) else value for value in decoded] == expected
+
+
+def test_mmtf_plain_values_pass_through():
+    assert MMTF.decode([1, 2]) == [1, 2]
+
+
+def test_mmtf_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError):
+        MMTF.decode(mmtf_field(99, 0, 0, b''))
+
+
+MMTF_FILE = msgpack.packb({
+    'structureId': '2XYZ',
+    'numAtoms': 3,
+    'numModels': 1,
+    'chainsPerModel': [1],
+    'groupsPerChain': [2],
+    'chainNameList': mmtf_field(5, 1, 4, b'B\x00\x00\x00'),
+    'chainIdList': mmtf_field(5, 1, 4, b'A\x00\x00\x00'),
+    'groupList': [
+        {'groupName': 'GLY', 'atomNameList': ['N', 'CA'], 'elementList': ['N', 'C'], 'chemCompType': 'L-PEPTIDE LINKING'},
+        {'groupName': 'ZN', 'atomNameList': ['ZN'], 'elementList': ['ZN'], 'chemCompType': 'NON-POLYMER'},
+    ],
+    'groupTypeList': mmtf_field(4, 2, 0, struct.pack('>2i', 0, 1)),
+    'groupIdList': mmtf_field(8, 2, 0, struct.pack('>2i', 10, 1) + struct.pack('>2i', 90, 1)),
+    'xCoordList': mmtf_field(10, 3, 1000, struct.pack('>3h', 1000, 500, -2000)),
+    'yCoordList': mmtf_field(10, 3, 1000, struct.pack('>3h', 0, 0, 250)),
+    'zCoordList': mmtf_field(10, 3, 1000, struct.pack('>3h', 2000, 0, 0)),
+    'bFactorList': mmtf_field(10, 3, 100, struct.pack('>3h', 1500, 0, 0)),
+})
+
+
+def test_mmtf_groups_expand_into_atoms():
+    complex = complex_from_mmtf(io.BytesIO(MMTF_FILE))
+    assert complex.name == '2XYZ'
+    # chain names (auth) are preferred over chain ids (label)
+    assert atoms_of(complex) == [
+        ('B', 'GLY', 10, 'N', 'N', 1.0, 0.0, 2.0, False),
+        ('B', 'GLY', 10, 'CA', 'C', 1.5, 0.0, 2.0, False),
+        ('B', 'ZN', 100, 'ZN', 'Zn', -0.5, 0.25, 2.0, True),
+    ]
+    assert [atom.bfactor for atom in complex.atoms] == [15.0, 15.0, 15.0]
+
+
+def test_mmtf_atom_counts_are_checked():
+    broken = msgpack.unpackb(MMTF_FILE)
+    broken['numAtoms'] = 4
+    with pytest.raises(ValueError):
+        complex_from_mmtf(io.BytesIO(msgpack.packb(broken)))
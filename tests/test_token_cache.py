@@ -0,0 +1,106 @@
+import json
+import time
+import base64
+
+import pytest
+
+pytest.importorskip('nanome')
+
+from nanome_postgnome.engine.RequestRun import RenderedRequest
+from nanome_postgnome.engine.TokenCache import TokenCache, token_ttl
+
+LOGIN = RenderedRequest.create('post', 'https://auth.example.com/token', {}, '{}')
+
+
+class FakeResponse():
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+
+class Counter():
+    """ A fetch returning a new response with expires_in=ttl on every call """
+
+    def __init__(self, ttl=None, status_code=200, prefix='token'):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.status_code = status_code
+        self.calls = 0
+
+    def __call__(self, rendered):
+        self.calls += 1
+        body = {'access_token': f'{self.prefix}-{self.calls}'}
+        if self.ttl is not None:
+            body['expires_in'] = self.ttl
+        return FakeResponse(json.dumps(body), self.status_code)
+
+
+def jwt(claims):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return f'eyJhbGciOiJub25lIn0.{payload}.'
+
+
+def test_ttl_is_read_from_expires_in_or_a_jwt():
+    assert token_ttl(json.dumps({'data': {'expires_in': '300'}})) == 300
+    assert token_ttl(json.dumps({'token': jwt({'exp': 1060})}), now=1000) == 60
+    assert token_ttl(json.dumps({'token': 'opaque'})) is None
+    assert token_ttl('not json') is None
+
+
+def test_tokens_are_reused_while_valid():
+    cache = TokenCache(min_margin=0)
+    fetch, refresh = Counter(ttl=0.2), Counter(ttl=0.2)
+    first = cache.get(LOGIN, fetch, refresh)
+    assert cache.get(LOGIN, fetch, refresh) is first
+    assert fetch.calls == 1
+    cache.clear()
+
+
+def test_used_tokens_are_refreshed_before_expiry():
+    cache = TokenCache(refresh_margin=0.5, min_margin=0)
+    fetch, refresh = Counter(ttl=0.2), Counter(ttl=0.2, prefix='refreshed')
+    cache.get(LOGIN, fetch, refresh)
+    cache.get(LOGIN, fetch, refresh)
+    time.sleep(0.15)
+    assert refresh.calls == 1
+    assert json.loads(cache.get(LOGIN, fetch, refresh).text)['access_token'] == 'refreshed-1'
+    assert fetch.calls == 1
+    cache.clear()
+
+
+def test_unused_tokens_are_dropped_instead_of_refreshed():
+    cache = TokenCache(refresh_margin=0.5, min_margin=0)
+    fetch, refresh = Counter(ttl=0.2), Counter(ttl=0.2)
+    cache.get(LOGIN, fetch, refresh)
+    time.sleep(0.15)
+    assert refresh.calls == 0
+    cache.get(LOGIN, fetch, refresh)
+    assert fetch.calls == 2
+    cache.clear()
+
+
+@pytest.mark.parametrize('fetch, ttl', [
+    (Counter(ttl=300, status_code=401), None),
+    (Counter(ttl=None), None),
+    (Counter(ttl=None), float('nan')),
+    (Counter(ttl=None), float('inf')),
+])
+def test_failed_or_unexpiring_responses_are_not_cached(fetch, ttl):
+    cache = TokenCache()
+    cache.get(LOGIN, fetch, fetch, ttl)
+    cache.get(LOGIN, fetch, fetch, ttl)
+    assert fetch.calls == 2
+
+
+def test_invalidated_tokens_are_fetched_again():
+    cache = TokenCache()
+    fetch = Counter(ttl=300)
+    cache.get(LOGIN, fetch, fetch)
+    cache.invalidate(LOGIN)
+    cache.get(LOGIN, fetch, fetch)
+    assert fetch.calls == 2
+    cache.clear()